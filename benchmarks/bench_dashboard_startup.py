@@ -0,0 +1,142 @@
+"""
+bench_dashboard_startup.py
+
+Time-to-first-page for the dashboards with a large data/raw. Builds a scratch
+tree with FILES synthetic captures of ROWS rows each (plus a copy of the
+anomaly log), then for each app, in a fresh interpreter, times the module
+import, GET /, the layout request and the callback that fills the landing
+view. Target: the first page (everything after the import) in under 1 s.
+
+Usage:
+    python benchmarks/bench_dashboard_startup.py [--files 6] [--rows 1000000] [--app both]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TARGET_S = 1.0
+
+# The callback each app runs to fill its landing view
+FIRST_CALLBACK = {
+    'app2': lambda catalog, version: {
+        'output': 'tab-content.children',
+        'outputs': {'id': 'tab-content', 'property': 'children'},
+        'inputs': [
+            {'id': 'tabs', 'property': 'active_tab', 'value': 'tab-overview'},
+            {'id': 'datasets-store', 'property': 'data', 'value': catalog},
+            {'id': 'anomalies-store', 'property': 'data', 'value': version},
+        ],
+        'changedPropIds': ['tabs.active_tab'],
+        'state': [],
+    },
+    'app': lambda catalog, version: {
+        'output': '..time-series-graph.figure...stats-table.data..',
+        'outputs': [{'id': 'time-series-graph', 'property': 'figure'},
+                    {'id': 'stats-table', 'property': 'data'}],
+        'inputs': [
+            {'id': 'dataset-dropdown', 'property': 'value', 'value': next(iter(catalog))},
+            {'id': 'date-range', 'property': 'start_date', 'value': '2024-01-01'},
+            {'id': 'date-range', 'property': 'end_date', 'value': '2024-12-31'},
+            {'id': 'vis-options', 'property': 'value', 'value': ['anomalies', 'thresholds']},
+            {'id': 'time-series-graph', 'property': 'relayoutData', 'value': None},
+        ],
+        'changedPropIds': ['dataset-dropdown.value'],
+        'state': [{'id': 'ts-plot-width', 'property': 'data', 'value': None}],
+    },
+}
+
+
+def build_tree(path, files, rows):
+    import numpy as np
+    import pandas as pd
+
+    raw = os.path.join(path, 'data', 'raw')
+    os.makedirs(raw)
+    os.makedirs(os.path.join(path, 'logs', 'raw'))
+    os.makedirs(os.path.join(path, 'logs', 'alerts'))
+    shutil.copy(os.path.join(ROOT_DIR, 'logs', 'alerts', 'anomaly.log'),
+                os.path.join(path, 'logs', 'alerts', 'anomaly.log'))
+    rng = np.random.default_rng(0)
+    names = ['baseline'] + [f'capture_{i}' for i in range(1, files)]
+    for name in names:
+        df = pd.DataFrame({
+            'reg0': rng.normal(100, 5, rows).round(3),
+            'reg1': rng.normal(100, 5, rows).round(3),
+        })
+        df.to_csv(os.path.join(raw, f'{name}.csv'), index=False)
+    total = sum(os.path.getsize(os.path.join(raw, f)) for f in os.listdir(raw))
+    print(f"data/raw: {files} files x {rows:,} rows, {total / 1e6:.0f} MB")
+
+
+def child(app_name):
+    """Runs inside the scratch tree; prints one JSON line of timings."""
+    import importlib
+
+    timings = {}
+    t = time.perf_counter()
+    mod = importlib.import_module(f'src.dashboard.{app_name}')
+    timings['import'] = time.perf_counter() - t
+
+    client = mod.app.server.test_client()
+    for label, url in (('index', '/'), ('layout', '/_dash-layout'), ('dependencies', '/_dash-dependencies')):
+        t = time.perf_counter()
+        resp = client.get(url)
+        timings[label] = time.perf_counter() - t
+        assert resp.status_code == 200, (url, resp.status_code)
+
+    catalog = mod.dataset_cache.catalog()
+    payload = FIRST_CALLBACK[app_name](catalog, mod.alert_loader.refresh().version)
+    t = time.perf_counter()
+    resp = client.post('/_dash-update-component', json=payload)
+    timings['first_callback'] = time.perf_counter() - t
+    assert resp.status_code == 200, resp.get_data(as_text=True)[:500]
+
+    timings['first_page'] = sum(timings[k] for k in ('index', 'layout', 'dependencies', 'first_callback'))
+    print(json.dumps(timings))
+
+
+def run(app_name, tree):
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', app_name],
+                         cwd=tree, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard time-to-first-page benchmark")
+    parser.add_argument('--files', type=int, default=6)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--app', choices=['app', 'app2', 'both'], default='both')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    tree = tempfile.mkdtemp(prefix='dash-bench-')
+    try:
+        build_tree(tree, args.files, args.rows)
+        apps = ['app2', 'app'] if args.app == 'both' else [args.app]
+        ok = True
+        for app_name in apps:
+            t = run(app_name, tree)
+            passed = t['first_page'] < TARGET_S
+            ok &= passed
+            print(f"{app_name:5s} import {t['import']:.2f}s  index {t['index'] * 1000:.0f}ms  "
+                  f"layout {t['layout'] * 1000:.0f}ms  first callback {t['first_callback'] * 1000:.0f}ms  "
+                  f"-> first page {t['first_page']:.2f}s {'OK' if passed else 'SLOW'}")
+    finally:
+        shutil.rmtree(tree, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
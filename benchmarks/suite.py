@@ -0,0 +1,600 @@
+"""
+suite.py
+
+Offline performance suite. Every benchmark runs on synthetic data generated
+into a scratch directory (plus the local PLC simulator for the Modbus poll),
+so results only depend on the code and the machine.
+
+    python benchmarks/suite.py run                       # run everything, print and save results
+    python benchmarks/suite.py run -k score --quick      # subset, smaller inputs
+    python benchmarks/suite.py run --save-baseline       # also store as the baseline
+    python benchmarks/suite.py compare benchmarks/results/latest.json
+    python benchmarks/suite.py run --compare             # run, then compare with the baseline
+
+Results are JSON: per benchmark the median and best time per operation over
+REPEAT timed calls (after a warm-up call). `compare` flags benchmarks whose
+median time per operation grew by more than --threshold and exits 1 if any did.
+Benchmarks whose dependency (pyshark/tshark, shap...) is missing are skipped
+and listed with the reason.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+BASELINE = os.path.join(ROOT_DIR, 'benchmarks', 'baselines', 'baseline.json')
+MODEL_PATH = os.path.join(ROOT_DIR, 'models', 'isoforest.pkl')
+REPEAT = 5
+THRESHOLD = 0.25   # 25% slower per operation counts as a regression
+SIM_PORT = 5020    # fixed in plc_simulator.py
+
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+class Skip(Exception):
+    pass
+
+
+BENCHMARKS = []
+
+
+def benchmark(name, group):
+    """Register setup(ctx) -> (fn, ops); fn() is timed and does `ops` operations."""
+    def register(setup):
+        BENCHMARKS.append((name, group, setup))
+        return setup
+    return register
+
+
+class Context:
+    """Scratch directory and sizes shared by the benchmarks of one run."""
+
+    def __init__(self, workdir, quick):
+        self.workdir = workdir
+        self.quick = quick
+        self.simulator = None
+        self._cache = {}
+
+    def size(self, full, quick):
+        return quick if self.quick else full
+
+    def once(self, key, make):
+        if key not in self._cache:
+            self._cache[key] = make()
+        return self._cache[key]
+
+    def model(self):
+        def load():
+            import joblib
+            if not os.path.exists(MODEL_PATH):
+                raise Skip(f'{MODEL_PATH} not found')
+            return joblib.load(MODEL_PATH)
+        return self.once('model', load)
+
+    def frame(self, rows):
+        """Synthetic register frame shaped like the model's training data."""
+        def make():
+            import numpy as np
+            import pandas as pd
+            features = list(self.model().feature_names_in_)
+            rng = np.random.default_rng(rows)
+            return pd.DataFrame(rng.normal(100, 10, (rows, len(features))).round(), columns=features)
+        return self.once(('frame', rows), make)
+
+
+# --- Synthetic inputs ---------------------------------------------------------
+
+def write_modbus_pcap(path, n_packets):
+    """Classic libpcap file of alternating Modbus/TCP read-holding-registers requests and responses."""
+    def ip_checksum(header):
+        total = sum(struct.unpack('!10H', header))
+        total = (total >> 16) + (total & 0xffff)
+        return ~(total + (total >> 16)) & 0xffff
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        t0 = 1_700_000_000.0
+        for i in range(n_packets):
+            tid = i // 2
+            if i % 2 == 0:
+                pdu = struct.pack('!BHH', 3, 0, 5)
+                sport, dport = 40000, 502
+            else:
+                regs = [(tid * 7 + k) % 1000 for k in range(5)]
+                pdu = struct.pack('!BB5H', 3, 10, *regs)
+                sport, dport = 502, 40000
+            mbap = struct.pack('!HHHB', tid & 0xffff, 0, len(pdu) + 1, 1)
+            payload = mbap + pdu
+            tcp = struct.pack('!HHIIBBHHH', sport, dport, i, i, 5 << 4, 0x18, 65535, 0, 0)
+            ip = bytearray(struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp) + len(payload), i & 0xffff, 0,
+                                       64, 6, 0, bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2])))
+            ip[10:12] = struct.pack('!H', ip_checksum(bytes(ip)))
+            eth = b'\x00\x11\x22\x33\x44\x55' + b'\x66\x77\x88\x99\xaa\xbb' + b'\x08\x00'
+            frame = eth + bytes(ip) + tcp + payload
+            ts = t0 + i * 0.01
+            f.write(struct.pack('<IIII', int(ts), int((ts % 1) * 1e6), len(frame), len(frame)))
+            f.write(frame)
+
+
+def write_anomaly_log(path, n_lines):
+    """Lines in detect.py's format: ts,[r0, r1],score,[[s0 s1]]"""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    ts = 1_700_000_000 + np.cumsum(rng.exponential(0.5, n_lines))
+    regs = rng.integers(0, 1000, (n_lines, 2))
+    scores = -rng.exponential(0.1, n_lines)
+    shap = rng.normal(0, 2, (n_lines, 2))
+    with open(path, 'w') as f:
+        for t, (r0, r1), s, (a, b) in zip(ts, regs, scores, shap):
+            f.write(f'{t},[{r0}, {r1}],{s},[[{a:.7f} {b:.7f}]]\n')
+
+
+# --- Benchmarks ---------------------------------------------------------------
+
+@benchmark('pcap_parse', 'ingest')
+def bench_pcap_parse(ctx):
+    try:
+        import pyshark
+    except ImportError:
+        raise Skip('pyshark not installed')
+    if shutil.which('tshark') is None:
+        raise Skip('tshark not found')
+    from src.logging.parse_modbus import parse_packet
+
+    n = ctx.size(2000, 200)
+    path = os.path.join(ctx.workdir, 'modbus.pcap')
+    write_modbus_pcap(path, n)
+
+    def run():
+        cap = pyshark.FileCapture(path, display_filter='modbus')
+        try:
+            for pkt in cap:
+                parse_packet(pkt)
+        finally:
+            cap.close()
+    return run, n
+
+
+@benchmark('feature_records', 'ingest')
+def bench_feature_records(ctx):
+    import numpy as np
+    from src.logging.collect_data import make_record
+
+    n = ctx.size(50_000, 5_000)
+    rows = np.random.default_rng(1).integers(0, 1000, (n, 5)).tolist()
+
+    def run():
+        prev_vals = prev_time = None
+        ts = 1_700_000_000.0
+        for vals in rows:
+            make_record(ts, vals, prev_vals, prev_time)
+            prev_vals, prev_time = vals, ts
+            ts += 0.1
+    return run, n
+
+
+@benchmark('modbus_poll', 'ingest')
+def bench_modbus_poll(ctx):
+    from pymodbus.client import ModbusTcpClient
+
+    ctx.simulator = start_simulator(ctx.workdir)
+    client = ModbusTcpClient('127.0.0.1', port=SIM_PORT)
+    if not client.connect():
+        raise Skip(f'PLC simulator not reachable on 127.0.0.1:{SIM_PORT}')
+    n = ctx.size(200, 50)
+
+    def run():
+        for _ in range(n):
+            client.read_holding_registers(address=0, count=5, slave=1)
+    return run, n
+
+
+@benchmark('modbus_pipelined', 'ingest')
+def bench_modbus_pipelined(ctx):
+    from src.modbus.pipeline import PipelinedClient
+
+    ctx.simulator = ctx.simulator or start_simulator(ctx.workdir)
+    client = PipelinedClient('127.0.0.1', port=SIM_PORT, window=16)
+    if not client.connect():
+        raise Skip(f'PLC simulator not reachable on 127.0.0.1:{SIM_PORT}')
+    calls = [('read_holding_registers', {'address': 0, 'count': 5, 'slave': 1})] * ctx.size(200, 50)
+
+    def run():
+        client.call_many(calls)
+    return run, len(calls)
+
+
+@benchmark('score_single', 'detection')
+def bench_score_single(ctx):
+    clf = ctx.model()
+    df = ctx.frame(1000)
+    n = ctx.size(200, 50)
+    rows = [df.iloc[[i]] for i in range(n)]
+
+    def run():
+        for row in rows:
+            clf.decision_function(row)
+    return run, n
+
+
+@benchmark('score_cascade', 'detection')
+def bench_score_cascade(ctx):
+    from src.detection.cascade import fit_cascade
+
+    clf = ctx.model()
+    df = ctx.frame(1000)
+    cascade = fit_cascade(clf, df.to_numpy(dtype=float))
+    n = ctx.size(200, 50)
+    rows = [df.iloc[[i]] for i in range(n)]
+
+    # the same frames as score_single, one at a time through the early exits
+    def run():
+        for row in rows:
+            cascade.decision_function(row)
+    return run, n
+
+
+@benchmark('score_batch', 'detection')
+def bench_score_batch(ctx):
+    clf = ctx.model()
+    n = ctx.size(100_000, 10_000)
+    df = ctx.frame(n)
+    return (lambda: clf.decision_function(df)), n
+
+
+def _explainer(ctx):
+    def make():
+        try:
+            import shap
+        except ImportError:
+            raise Skip('shap not installed')
+        return shap.TreeExplainer(ctx.model())
+    return ctx.once('explainer', make)
+
+
+@benchmark('shap_single', 'detection')
+def bench_shap_single(ctx):
+    explainer = _explainer(ctx)
+    df = ctx.frame(1000)
+    n = ctx.size(20, 5)
+    rows = [df.iloc[[i]] for i in range(n)]
+
+    def run():
+        for row in rows:
+            explainer.shap_values(row)
+    return run, n
+
+
+@benchmark('shap_batch', 'detection')
+def bench_shap_batch(ctx):
+    explainer = _explainer(ctx)
+    n = ctx.size(500, 100)
+    df = ctx.frame(1000).iloc[:n]
+    return (lambda: explainer.shap_values(df)), n
+
+
+def _register_history(ctx):
+    def make():
+        import numpy as np
+
+        rows = ctx.size(1_000_000, 100_000)
+        rng = np.random.default_rng(3)
+        ts = 1.7e9 + np.cumsum(rng.normal(0.1, 0.002, rows))
+        steps = rng.integers(-3, 4, (rows, 5))
+        regs = np.clip(np.cumsum(steps, axis=0) + [100, 250, 80, 60, 1], 0, 1000)
+        values = np.column_stack([regs, rng.integers(0, 2, (rows, 4))]).astype(float)
+        return ts, values
+    return ctx.once('history', make)
+
+
+@benchmark('tsdb_append', 'storage')
+def bench_tsdb_append(ctx):
+    from src.storage.tsdb import SeriesWriter
+
+    ts, values = _register_history(ctx)
+    n = ctx.size(100_000, 20_000)
+    root = os.path.join(ctx.workdir, 'tsdb-append')
+    fields = [f'p{i}' for i in range(values.shape[1])]
+
+    def run():
+        shutil.rmtree(root, ignore_errors=True)
+        writer = SeriesWriter('plc', fields, root)
+        for i in range(n):
+            writer.append(ts[i], values[i])
+        writer.close()
+    return run, n
+
+
+@benchmark('tsdb_range_scan', 'storage')
+def bench_tsdb_range_scan(ctx):
+    from src.storage.tsdb import TSDB, SeriesWriter
+
+    ts, values = _register_history(ctx)
+    root = os.path.join(ctx.workdir, 'tsdb-scan')
+    writer = SeriesWriter('plc', [f'p{i}' for i in range(values.shape[1])], root)
+    writer.append_many(ts, values)
+    writer.close()
+    db = TSDB(root)
+    # one minute of 10 Hz polls from the middle of the history
+    mid = len(ts) // 2
+    start, end = ts[mid], ts[mid] + 60
+
+    def run():
+        return db.scan('plc', start, end)
+    return run, int(((ts >= start) & (ts <= end)).sum())
+
+
+@benchmark('rollup_range_query', 'storage')
+def bench_rollup_range_query(ctx):
+    from src.storage.rollup import RollupStore
+    from src.storage.tsdb import TSDB, SeriesWriter
+
+    ts, values = _register_history(ctx)
+    root = os.path.join(ctx.workdir, 'tsdb-rollup')
+    writer = SeriesWriter('plc', [f'p{i}' for i in range(values.shape[1])], root)
+    writer.append_many(ts, values)
+    writer.close()
+    store = RollupStore(TSDB(root), root=os.path.join(ctx.workdir, 'rollups')).refresh(save=False)
+
+    # the whole history at plot width: served from buckets, not raw rows
+    def run():
+        return store.query('plc', n_points=1200)
+    return run, 1
+
+
+@benchmark('alert_log_parse', 'dashboard')
+def bench_alert_log_parse(ctx):
+    from src.dashboard.alert_loader import IncrementalAlertLoader
+
+    n = ctx.size(100_000, 10_000)
+    path = os.path.join(ctx.workdir, 'anomaly.log')
+    write_anomaly_log(path, n)
+    # what load_anomalies() does: a fresh loader parsing the whole log
+    return (lambda: IncrementalAlertLoader(path).refresh().frame), n
+
+
+def _dashboard_inputs(ctx):
+    def make():
+        import numpy as np
+        import pandas as pd
+        from src.dashboard.alert_loader import IncrementalAlertLoader
+
+        rows = ctx.size(1_000_000, 100_000)
+        rng = np.random.default_rng(2)
+        series = pd.DataFrame({
+            'timestamp': pd.date_range('2024-01-01', periods=rows, freq='100ms'),
+            'reg0': rng.normal(100, 5, rows).round(3),
+            'reg1': rng.normal(100, 5, rows).round(3),
+        })
+        path = os.path.join(ctx.workdir, 'alerts.log')
+        write_anomaly_log(path, ctx.size(5000, 1000))
+        return series, IncrementalAlertLoader(path).refresh().frame
+    return ctx.once('dashboard', make)
+
+
+@benchmark('downsample_lttb', 'dashboard')
+def bench_downsample(ctx):
+    from src.dashboard.downsample import downsample, target_points
+
+    series, _ = _dashboard_inputs(ctx)
+    n_out = target_points()
+    return (lambda: downsample(series['timestamp'], series['reg0'], n_out)), len(series)
+
+
+@benchmark('dataset_stats', 'dashboard')
+def bench_dataset_stats(ctx):
+    from src.dashboard.stats_cache import DatasetStats
+
+    series, _ = _dashboard_inputs(ctx)
+    return (lambda: DatasetStats.from_frame(series).describe()), len(series)
+
+
+@benchmark('anomaly_figures', 'dashboard')
+def bench_anomaly_figures(ctx):
+    _, alerts = _dashboard_inputs(ctx)
+    app2 = import_app2(ctx)
+
+    def run():
+        app2.generate_anomaly_timeline(alerts)
+        app2.generate_score_histogram(alerts)
+        app2.generate_anomalies_table(alerts)
+    return run, len(alerts)
+
+
+@benchmark('overview_timeline', 'dashboard')
+def bench_overview_timeline(ctx):
+    _, alerts = _dashboard_inputs(ctx)
+    app2 = import_app2(ctx)
+    start = alerts['timestamp'].min()
+    summaries = {f'capture_{i}': {'rows': 1_000_000, 'columns': ['timestamp', 'reg0', 'reg1'],
+                                  'start': start, 'end': start + (i + 1) * (alerts['timestamp'].max() - start) / 8}
+                 for i in range(8)}
+    return (lambda: app2.generate_overview_timeline(summaries, alerts)), len(alerts)
+
+
+def import_app2(ctx):
+    """app2 creates its data/log folders relative to the cwd: import it inside the scratch dir."""
+    def load():
+        cwd = os.getcwd()
+        os.chdir(ctx.workdir)
+        try:
+            import src.dashboard.app2 as app2
+        finally:
+            os.chdir(cwd)
+        return app2
+    return ctx.once('app2', load)
+
+
+def start_simulator(workdir):
+    """Start plc_simulator.py unless something already listens on SIM_PORT; returns the process or None."""
+    with socket.socket() as s:
+        if s.connect_ex(('127.0.0.1', SIM_PORT)) == 0:
+            return None
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, METRICS_PORT='0')
+    proc = subprocess.Popen([sys.executable, '-m', 'src.logging.plc_simulator'], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(('127.0.0.1', SIM_PORT)) == 0:
+                return proc
+        time.sleep(0.1)
+    proc.kill()
+    raise Skip('PLC simulator did not start')
+
+
+# --- Running and comparing -----------------------------------------------------
+
+def measure(fn, ops, repeat=REPEAT):
+    fn()  # warm-up: imports, caches, lazily built structures
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    times.sort()
+    median = times[len(times) // 2]
+    return {
+        'ops': ops,
+        'repeat': repeat,
+        'median_s': median,
+        'min_s': times[0],
+        'per_op_us': median / ops * 1e6,
+        'ops_per_s': ops / median,
+    }
+
+
+def environment():
+    import numpy as np
+    import pandas as pd
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run_suite(selected=None, quick=False):
+    results, skipped = {}, {}
+    workdir = tempfile.mkdtemp(prefix='bench-suite-')
+    ctx = Context(workdir, quick)
+    try:
+        for name, group, setup in BENCHMARKS:
+            if selected and not any(k in name or k == group for k in selected):
+                continue
+            try:
+                fn, ops = setup(ctx)
+            except Skip as e:
+                skipped[name] = str(e)
+                print(f'{name:20s} skipped: {e}')
+                continue
+            res = dict(measure(fn, ops), group=group)
+            results[name] = res
+            print(f"{name:20s} {res['per_op_us']:12.2f} us/op  {res['ops_per_s']:14,.0f} ops/s  "
+                  f"(median of {res['repeat']}, {ops:,} ops)")
+    finally:
+        if ctx.simulator is not None:
+            ctx.simulator.terminate()
+            ctx.simulator.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'environment': environment(), 'quick': quick, 'results': results, 'skipped': skipped}
+
+
+def save(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    return path
+
+
+def compare(new, base, threshold=THRESHOLD):
+    """Print per-benchmark change; returns the names that regressed."""
+    if new.get('quick') != base.get('quick'):
+        print('[WARN] comparing a --quick run with a full run; input sizes differ')
+    regressions = []
+    print(f"{'benchmark':20s} {'baseline us/op':>15s} {'current us/op':>15s} {'change':>9s}")
+    for name in sorted(set(new['results']) | set(base['results'])):
+        cur, ref = new['results'].get(name), base['results'].get(name)
+        if cur is None or ref is None:
+            print(f"{name:20s} {'-' if ref is None else format(ref['per_op_us'], '15.2f'):>15s} "
+                  f"{'-' if cur is None else format(cur['per_op_us'], '15.2f'):>15s}")
+            continue
+        change = cur['per_op_us'] / ref['per_op_us'] - 1
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = 'faster'
+        print(f"{name:20s} {ref['per_op_us']:15.2f} {cur['per_op_us']:15.2f} {change:+8.1%} {flag}")
+    return regressions
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline performance benchmark suite')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    r = sub.add_parser('run', help='run benchmarks and save the results')
+    r.add_argument('-k', action='append', help='only benchmarks whose name contains K (or group K)')
+    r.add_argument('--quick', action='store_true', help='smaller inputs (smoke test)')
+    r.add_argument('-o', '--output', help='results file (default benchmarks/results/<timestamp>.json)')
+    r.add_argument('--save-baseline', action='store_true', help='also write the results as the baseline')
+    r.add_argument('--compare', action='store_true', help='compare with the baseline afterwards')
+    r.add_argument('--baseline', default=BASELINE)
+    r.add_argument('--threshold', type=float, default=THRESHOLD)
+    c = sub.add_parser('compare', help='compare a results file with the baseline')
+    c.add_argument('results', nargs='?', default=os.path.join(RESULTS_DIR, 'latest.json'))
+    c.add_argument('--baseline', default=BASELINE)
+    c.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    if args.cmd == 'run':
+        data = run_suite(args.k, args.quick)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = save(data, args.output or os.path.join(RESULTS_DIR, f'{stamp}.json'))
+        save(data, os.path.join(RESULTS_DIR, 'latest.json'))
+        print(f'Results -> {path}')
+        if args.save_baseline:
+            print(f'Baseline -> {save(data, args.baseline)}')
+        if not args.compare:
+            return
+        new = data
+    else:
+        new = load(args.results)
+
+    if not os.path.exists(args.baseline):
+        sys.exit(f'No baseline at {args.baseline}; run with --save-baseline first')
+    regressions = compare(new, load(args.baseline), args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f'No regressions beyond {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
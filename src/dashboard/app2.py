@@ -2,14 +2,23 @@ import os
 import pandas as pd
 import numpy as np
 from dash import Dash, dcc, html, Input, Output, State, dash_table, callback, callback_context
-import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from datetime import datetime, timedelta
+from plotly.colors import qualitative
+from datetime import timedelta
+import dash
 import dash_bootstrap_components as dbc
 import json
-import base64
-import io
+
+from src.dashboard.alert_loader import IncrementalAlertLoader
+from src.dashboard.data_cache import DatasetCache
+from src.dashboard.downsample import POINTS_PER_PIXEL, downsample, target_points, visible_range
+from src.dashboard.ingest import UploadManager
+from src.dashboard.push import AlertPush
+from src.dashboard.stats_cache import StatsCache
+from src.detection.incidents import INCIDENT_LOG, read_incidents
+from src.detection.shap_store import ShapStore
+from src.storage.rollup import ALL_SERIES, RollupStore
+from src.storage.tsdb import parse_time
 
 # Initialize the Dash app with Bootstrap for better styling
 app = Dash(__name__, external_stylesheets=[dbc.themes.FLATLY])
@@ -17,99 +26,62 @@ server = app.server
 
 # Paths
 data_folder = os.path.join(os.getcwd(), 'data', 'raw')
+stats_folder = os.path.join(os.getcwd(), 'data', 'cache', 'stats')
+upload_spool = os.path.join(os.getcwd(), 'data', 'cache', 'uploads')
 alerts_path = os.path.join(os.getcwd(), 'logs', 'alerts', 'anomaly.log')
+shap_path = os.path.join(os.getcwd(), 'logs', 'alerts', 'shap')
 
 # Ensure directories exist
 os.makedirs(data_folder, exist_ok=True)
 os.makedirs(os.path.dirname(alerts_path), exist_ok=True)
 
+# Server-side dataset cache: DataFrames stay in this process, keyed by name and
+# file mtime; the browser stores only the {name: version} catalog
+dataset_cache = DatasetCache(data_folder)
+
+# Statistics for the stats tab, computed once per file content and kept on disk
+stats_cache = StatsCache(dataset_cache, stats_folder)
+
 # Function to load data from CSV files
 def load_datasets():
-    datasets = {}
-    if os.path.exists(data_folder):
-        for fname in sorted(os.listdir(data_folder)):
-            if fname.endswith('.csv'):
-                name = os.path.splitext(fname)[0]
-                try:
-                    df = pd.read_csv(os.path.join(data_folder, fname))
-                    # Create realistic timestamps based on file name
-                    if 'baseline' in name:
-                        start_time = datetime(2024, 1, 1)
-                    elif 'attack' in name:
-                        start_time = datetime(2024, 1, 1, 12)  # Attacks start at noon
-                    else:
-                        start_time = datetime(2024, 1, 1, 8)  # Other scenarios start at 8 AM
-                        
-                    df['timestamp'] = pd.date_range(start=start_time, periods=len(df), freq='s')
-                    datasets[name] = df
-                except Exception as e:
-                    print(f"Error loading {fname}: {e}")
-                    datasets[name] = pd.DataFrame()
-    return datasets
+    return dataset_cache.get_many(dataset_cache.catalog())
 
 # Load anomalies log
 def load_anomalies(path):
-    if not os.path.isfile(path):
-        return pd.DataFrame(columns=['timestamp', 'reg0', 'reg1', 'score', 'shap'])
-    
-    records = []
-    with open(path) as f:
-        for line in f:
-            parts = line.strip().split(',', 3)
-            if len(parts) < 4: continue
-            ts, vals, score, shap = parts
-            try: ts = float(ts)
-            except: continue
-            vals = vals.strip().lstrip('[').rstrip(']').split(',')
-            try:
-                r0 = float(vals[0]); r1 = float(vals[1])
-            except: r0=r1=None
-            try: score = float(score.strip().strip('[]'))
-            except: score=None
-            records.append({
-                'timestamp': datetime.fromtimestamp(ts),
-                'reg0': r0,
-                'reg1': r1,
-                'score': score,
-                'shap': shap
-            })
-    return pd.DataFrame(records)
+    return IncrementalAlertLoader(path).refresh().frame
 
-# Load initial data
-datasets = load_datasets()
-anomalies_df = load_anomalies(alerts_path)
+# Anomaly log loader: each refresh parses only the lines appended since the last one
+alert_loader = IncrementalAlertLoader(alerts_path)
 
-# Function to parse uploaded files
-def parse_contents(contents, filename):
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-    
-    try:
-        if filename.endswith('.csv'):
-            # Assume that the user uploaded a CSV file
-            df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-            
-            # Create timestamps
-            name = os.path.splitext(filename)[0]
-            if 'baseline' in name.lower():
-                start_time = datetime(2024, 1, 1)
-            elif 'attack' in name.lower():
-                start_time = datetime(2024, 1, 1, 12)
-            else:
-                start_time = datetime(2024, 1, 1, 8)
-                
-            df['timestamp'] = pd.date_range(start=start_time, periods=len(df), freq='s')
-            
-            # Save the file locally
-            os.makedirs(data_folder, exist_ok=True)
-            df.to_csv(os.path.join(data_folder, filename), index=False)
-            
-            return df
+# Per-alert SHAP vectors written by the detectors; refresh() folds new records
+# into running per-feature/device/bucket aggregates
+shap_store = ShapStore(shap_path)
+
+# 1 s / 1 min / 1 h aggregates of the register history (data/tsdb) and of the
+# alert counts; long ranges are drawn from these instead of raw rows
+rollups = RollupStore(shap_store=shap_store)
+HISTORY_PREFIX = 'tsdb:'     # dropdown values for register-history series
+OVERVIEW_MARKERS = 2000      # above this many alerts the overview shows counts per bucket
+
+# Push new alerts to open browsers over Socket.IO (see push.py / assets/alert_push.js)
+alert_push = AlertPush(server, alerts_path)
+
+# Chunked uploads: streamed to a spool file, then parsed in the background
+# into data_folder (see ingest.py / assets/chunked_upload.js)
+uploads = UploadManager(server, dataset_cache, upload_spool, stats_cache)
+
+# Status lines for recent uploads
+def render_upload_status(jobs):
+    lines = []
+    for job in jobs:
+        if job.state == 'done':
+            text, color = f"{job.filename}: {job.rows:,} rows added as '{job.name}'", "success"
+        elif job.state == 'error':
+            text, color = f"{job.filename}: failed ({job.error})", "danger"
         else:
-            return pd.DataFrame()
-    except Exception as e:
-        print(e)
-        return pd.DataFrame()
+            text, color = f"{job.filename}: {job.state} ({100 * job.progress:.0f}%)", "info"
+        lines.append(html.Div(text, className=f"text-{color}"))
+    return lines
 
 # Function to generate dataset info card
 def create_info_card(title, value, color="primary"):
@@ -159,10 +131,11 @@ app.layout = dbc.Container(fluid=True, children=[
     # Content
     html.Div(id="tab-content"),
     
-    # Store for datasets and current selection
+    # Store for dataset/anomaly version keys (the data itself stays server-side)
     dcc.Store(id='datasets-store'),
     dcc.Store(id='current-dataset-store'),
     dcc.Store(id='anomalies-store'),
+    dcc.Store(id='alert-push-store'),
     
     # Interval for auto-refresh
     dcc.Interval(
@@ -185,57 +158,32 @@ app.layout = dbc.Container(fluid=True, children=[
 
 # Callbacks
 
-# Store datasets in browser on page load
+# Publish dataset/anomaly versions to the browser; a changed version re-renders
 @app.callback(
     Output('datasets-store', 'data'),
     Output('anomalies-store', 'data'),
     Input('interval-component', 'n_intervals')
 )
 def update_stores(n):
-    datasets = load_datasets()
-    anomalies_df = load_anomalies(alerts_path)
-    
-    # Convert datasets to JSON-serializable format
-    datasets_json = {}
-    for name, df in datasets.items():
-        # Convert timestamps to string for JSON serialization
-        df_copy = df.copy()
-        df_copy['timestamp'] = df_copy['timestamp'].astype(str)
-        datasets_json[name] = df_copy.to_dict('records')
-    
-    # Convert anomalies to JSON-serializable format
-    anomalies_json = anomalies_df.copy()
-    if not anomalies_json.empty:
-        anomalies_json['timestamp'] = anomalies_json['timestamp'].astype(str)
-    
-    return datasets_json, anomalies_json.to_dict('records')
+    return dataset_cache.catalog(), alert_loader.refresh().version
 
-# Handle file uploads
+# Track chunked uploads; publish the new catalog once they have all finished
 @app.callback(
+    Output('upload-progress', 'value'),
+    Output('upload-progress', 'label'),
+    Output('upload-output', 'children'),
+    Output('upload-interval', 'disabled'),
     Output('datasets-store', 'data', allow_duplicate=True),
-    Input('upload-data', 'contents'),
-    State('upload-data', 'filename'),
-    State('datasets-store', 'data'),
+    Input('upload-interval', 'n_intervals'),
     prevent_initial_call=True
 )
-def update_output(list_of_contents, list_of_filenames, existing_datasets):
-    if list_of_contents is None:
-        return existing_datasets
-        
-    # Process each uploaded file
-    for content, filename in zip(list_of_contents, list_of_filenames):
-        df = parse_contents(content, filename)
-        if not df.empty:
-            name = os.path.splitext(filename)[0]
-            
-            # Convert timestamps to string for JSON serialization
-            df_copy = df.copy()
-            df_copy['timestamp'] = df_copy['timestamp'].astype(str)
-            
-            # Add to existing datasets
-            existing_datasets[name] = df_copy.to_dict('records')
-            
-    return existing_datasets
+def poll_uploads(n):
+    jobs = uploads.jobs()
+    active = [job for job in jobs if job.active]
+    if active:
+        progress = 100 * sum(job.progress for job in active) / len(active)
+        return progress, f"{progress:.0f}%", render_upload_status(jobs), False, dash.no_update
+    return 100 if jobs else 0, "", render_upload_status(jobs), True, dataset_cache.catalog()
 
 # Tab content router
 @app.callback(
@@ -244,40 +192,32 @@ def update_output(list_of_contents, list_of_filenames, existing_datasets):
     Input('datasets-store', 'data'),
     Input('anomalies-store', 'data')
 )
-def render_tab_content(active_tab, datasets_json, anomalies_json):
-    # Convert from JSON back to dataframes
-    datasets = {}
-    for name, records in datasets_json.items():
-        df = pd.DataFrame(records)
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        datasets[name] = df
-    
-    anomalies_df = pd.DataFrame(anomalies_json)
-    if not anomalies_df.empty and 'timestamp' in anomalies_df.columns:
-        anomalies_df['timestamp'] = pd.to_datetime(anomalies_df['timestamp'])
+def render_tab_content(active_tab, catalog, anomalies_version):
+    # Each tab loads only what it shows: row counts and spans come from
+    # unparsed file summaries, and a dataset is read only once a callback selects it
+    names = list(catalog or {})
     
     # Return appropriate content based on active tab
     if active_tab == "tab-overview":
-        return render_overview_tab(datasets, anomalies_df)
+        return render_overview_tab(dataset_cache.summaries(names), alert_loader.refresh().frame)
     elif active_tab == "tab-timeseries":
-        return render_timeseries_tab(datasets, anomalies_df)
+        return render_timeseries_tab(dataset_cache.summaries(names[:1]), names)
     elif active_tab == "tab-anomalies":
-        return render_anomalies_tab(datasets, anomalies_df)
+        return render_anomalies_tab(alert_loader.refresh().frame, shap_store.refresh().aggregates)
     elif active_tab == "tab-stats":
-        return render_stats_tab(datasets)
+        return render_stats_tab(names)
     elif active_tab == "tab-data":
-        return render_data_tab(datasets)
+        return render_data_tab()
     
     # Default case
     return html.P("This tab is not yet implemented")
 
 # Overview Tab
-def render_overview_tab(datasets, anomalies_df):
+def render_overview_tab(summaries, anomalies_df):
     # Calculate summary stats
-    total_datasets = len(datasets)
-    total_datapoints = sum(len(df) for df in datasets.values())
-    total_anomalies = len(anomalies_df)
+    total_datasets = len(summaries)
+    total_datapoints = sum(s['rows'] for s in summaries.values())
+    total_anomalies = int(anomalies_df['frames'].sum())   # log lines are sampled frames
     
     # Latest anomaly time
     latest_anomaly = "None"
@@ -317,7 +257,7 @@ def render_overview_tab(datasets, anomalies_df):
         dbc.Row([
             dbc.Col([
                 html.H3("System Status Timeline", className="mb-3"),
-                dcc.Graph(id="overview-timeline", figure=generate_overview_timeline(datasets, anomalies_df))
+                dcc.Graph(id="overview-timeline", figure=generate_overview_timeline(summaries, anomalies_df))
             ], width=12, className="mb-4")
         ]),
         
@@ -335,9 +275,11 @@ def render_overview_tab(datasets, anomalies_df):
     ])
 
 # Time Series Tab
-def render_timeseries_tab(datasets, anomalies_df):
-    # Create dropdown options
-    dataset_options = [{'label': name, 'value': name} for name in datasets.keys()]
+def render_timeseries_tab(summaries, names):
+    # Create dropdown options: CSV datasets, then recorded register history
+    dataset_options = [{'label': name, 'value': name} for name in names]
+    dataset_options += [{'label': f"{series} (history)", 'value': HISTORY_PREFIX + series}
+                        for series in rollups.db.series()]
     
     # Get default dates
     default_start = None
@@ -345,10 +287,10 @@ def render_timeseries_tab(datasets, anomalies_df):
     
     # Use first dataset for default dates if available
     if dataset_options:
-        first_dataset = datasets[dataset_options[0]['value']]
-        if not first_dataset.empty and 'timestamp' in first_dataset.columns:
-            default_start = first_dataset['timestamp'].min()
-            default_end = first_dataset['timestamp'].max()
+        first_summary = summaries.get(dataset_options[0]['value'])
+        if first_summary and first_summary['rows']:
+            default_start = first_summary['start']
+            default_end = first_summary['end']
     
     return dbc.Container([
         dbc.Row([
@@ -397,7 +339,8 @@ def render_timeseries_tab(datasets, anomalies_df):
         # Time series graph
         dbc.Row([
             dbc.Col([
-                dcc.Graph(id='timeseries-graph', style={'height': '600px'})
+                dcc.Graph(id='timeseries-graph', style={'height': '600px'}),
+                dcc.Store(id='ts-plot-width')
             ], width=12)
         ]),
         
@@ -422,7 +365,8 @@ def render_timeseries_tab(datasets, anomalies_df):
     ])
 
 # Anomalies Tab
-def render_anomalies_tab(datasets, anomalies_df):
+def render_anomalies_tab(anomalies_df, shap_aggregates):
+    incidents = incident_options(read_incidents(INCIDENT_LOG))
     return dbc.Container([
         dbc.Row([
             dbc.Col([
@@ -475,13 +419,39 @@ def render_anomalies_tab(datasets, anomalies_df):
             ], width=12)
         ]),
         
-        # SHAP values analysis (if available)
+        # SHAP attributions, from the precomputed aggregates
         dbc.Row([
             dbc.Col([
                 html.H3("Feature Importance (SHAP Values)", className="mt-4 mb-3"),
                 dcc.Graph(
                     id='shap-analysis',
-                    figure=generate_shap_analysis(anomalies_df),
+                    figure=generate_shap_analysis(shap_aggregates),
+                    style={'height': '400px'}
+                )
+            ], width=6),
+            dbc.Col([
+                html.H3("Attribution Over Time", className="mt-4 mb-3"),
+                dcc.Graph(
+                    id='shap-timeline',
+                    figure=generate_shap_timeline(shap_aggregates),
+                    style={'height': '400px'}
+                )
+            ], width=6)
+        ]),
+        
+        # Per-incident attribution
+        dbc.Row([
+            dbc.Col([
+                html.H3("Incident Attribution", className="mt-4 mb-3"),
+                dcc.Dropdown(
+                    id='shap-incident-dropdown',
+                    options=incidents,
+                    value=incidents[0]['value'] if incidents else None,
+                    clearable=False,
+                    className="mb-3"
+                ),
+                dcc.Graph(
+                    id='shap-incident',
                     style={'height': '400px'}
                 )
             ], width=12)
@@ -489,9 +459,9 @@ def render_anomalies_tab(datasets, anomalies_df):
     ])
 
 # Stats Tab
-def render_stats_tab(datasets):
+def render_stats_tab(names):
     # Create dropdown options
-    dataset_options = [{'label': name, 'value': name} for name in datasets.keys()]
+    dataset_options = [{'label': name, 'value': name} for name in names]
     
     return dbc.Container([
         dbc.Row([
@@ -536,7 +506,7 @@ def render_stats_tab(datasets):
     ])
 
 # Data Management Tab
-def render_data_tab(datasets):
+def render_data_tab():
     return dbc.Container([
         dbc.Row([
             dbc.Col([
@@ -548,8 +518,8 @@ def render_data_tab(datasets):
         dbc.Row([
             dbc.Col([
                 html.H3("Upload Data Files", className="mb-3"),
-                dcc.Upload(
-                    id='upload-data',
+                html.Div(
+                    id='chunked-upload',
                     children=html.Div([
                         'Drag and Drop or ',
                         html.A('Select Files')
@@ -562,11 +532,13 @@ def render_data_tab(datasets):
                         'borderStyle': 'dashed',
                         'borderRadius': '5px',
                         'textAlign': 'center',
-                        'margin': '10px'
-                    },
-                    multiple=True
+                        'margin': '10px',
+                        'cursor': 'pointer'
+                    }
                 ),
-                html.Div(id='upload-output', className="mt-3")
+                dbc.Progress(id='upload-progress', value=0, striped=True, className="mt-2"),
+                dcc.Interval(id='upload-interval', interval=500, disabled=True),
+                html.Div(render_upload_status(uploads.jobs()), id='upload-output', className="mt-3")
             ], width=12)
         ]),
         
@@ -590,23 +562,28 @@ def render_data_tab(datasets):
     Input('ts-date-range', 'start_date'),
     Input('ts-date-range', 'end_date'),
     Input('ts-vis-options', 'value'),
+    Input('timeseries-graph', 'relayoutData'),
     State('datasets-store', 'data'),
-    State('anomalies-store', 'data')
+    State('anomalies-store', 'data'),
+    State('ts-plot-width', 'data')
 )
-def update_timeseries(selected, start_date, end_date, options, datasets_json, anomalies_json):
-    # Convert from JSON back to dataframes
-    datasets = {}
-    for name, records in datasets_json.items():
-        df = pd.DataFrame(records)
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        datasets[name] = df
+def update_timeseries(selected, start_date, end_date, options, relayout, catalog, anomalies_version, plot_width):
+    n_points = target_points(plot_width)
+    
+    # Zooming re-queries just the visible window at full on-screen resolution
+    zoom = None
+    triggered = [t['prop_id'] for t in callback_context.triggered]
+    if 'timeseries-graph.relayoutData' in triggered:
+        zoom = visible_range(relayout)
+        if zoom is None:
+            return dash.no_update, dash.no_update, dash.no_update
     
-    anomalies_df = pd.DataFrame(anomalies_json)
-    if not anomalies_df.empty and 'timestamp' in anomalies_df.columns:
-        anomalies_df['timestamp'] = pd.to_datetime(anomalies_df['timestamp'])
+    if selected and selected.startswith(HISTORY_PREFIX):
+        return history_timeseries(selected[len(HISTORY_PREFIX):], start_date, end_date, zoom,
+                                  n_points // POINTS_PER_PIXEL, options)
     
-    df = datasets.get(selected, pd.DataFrame())
+    df = dataset_cache.get(selected)
+    anomalies_df = alert_loader.refresh().frame
     
     # Create empty defaults
     fig = go.Figure()
@@ -618,9 +595,14 @@ def update_timeseries(selected, start_date, end_date, options, datasets_json, an
             mask = (df['timestamp'] >= start_date) & (df['timestamp'] <= end_date)
             df = df.loc[mask]
         
+        view = df
+        if isinstance(zoom, tuple):
+            view = df.loc[(df['timestamp'] >= zoom[0]) & (df['timestamp'] <= zoom[1])]
+        
         # Plot each numeric column with different colors
         colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2']
         
+        from plotly.subplots import make_subplots  # deferred: ~0.1 s import, only needed here
         fig = make_subplots(specs=[[{"secondary_y": True}]])
         
         # First pass to count how many columns to see if we need secondary y-axis
@@ -634,11 +616,12 @@ def update_timeseries(selected, start_date, end_date, options, datasets_json, an
             # Determine if this column should use secondary y-axis
             use_secondary_axis = i >= secondary_start if use_secondary else False
             
-            # Main line
+            # Main line, reduced to what the plot width can show
+            x_ds, y_ds = downsample(view['timestamp'], view[col], n_points)
             fig.add_trace(
                 go.Scatter(
-                    x=df['timestamp'], 
-                    y=df[col], 
+                    x=x_ds, 
+                    y=y_ds, 
                     mode='lines', 
                     name=col,
                     line=dict(color=colors[i % len(colors)], width=2)
@@ -648,11 +631,12 @@ def update_timeseries(selected, start_date, end_date, options, datasets_json, an
             
             if 'ma' in options:
                 # Add moving average
-                ma = df[col].rolling(window=20).mean()
+                ma = view[col].rolling(window=20).mean()
+                x_ma, y_ma = downsample(view['timestamp'], ma, n_points)
                 fig.add_trace(
                     go.Scatter(
-                        x=df['timestamp'],
-                        y=ma,
+                        x=x_ma,
+                        y=y_ma,
                         mode='lines',
                         name=f'{col} MA',
                         line=dict(dash='dash', color=colors[i % len(colors)])
@@ -757,6 +741,9 @@ def update_timeseries(selected, start_date, end_date, options, datasets_json, an
             height=600
         )
         
+        if isinstance(zoom, tuple):
+            fig.update_xaxes(range=list(zoom))
+        
         # Update axis titles
         if use_secondary:
             fig.update_yaxes(title_text="Primary Variables", secondary_y=False)
@@ -775,6 +762,129 @@ def update_timeseries(selected, start_date, end_date, options, datasets_json, an
     
     return fig, stats_data, stats_columns
 
+def history_timeseries(series, start_date, end_date, zoom, n_buckets, options):
+    """Figure and stats for a register-history series, drawn from the coarsest
+    rollup that still gives about one bucket per pixel (raw rows for short ranges)."""
+    fig = go.Figure()
+    stats_columns = [{'name': 'Metric', 'id': 'metric'}, {'name': 'Value', 'id': 'value'}]
+    span = rollups.refresh().span(series)
+    if span is None:
+        return fig, [], stats_columns
+    
+    # A date range from another dataset that misses this series shows all of it
+    start, end = parse_time(start_date), parse_time(end_date)
+    if start is not None and end is not None and (end < span[0] or start > span[1]):
+        start = end = None
+    if isinstance(zoom, tuple):
+        start, end = parse_time(zoom[0]), parse_time(zoom[1])
+    resolution, df = rollups.query(series, start, end, n_buckets)
+    fields = rollups.series[series].fields
+    
+    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2']
+    stats_data = []
+    for i, col in enumerate(fields):
+        color = colors[i % len(colors)]
+        if resolution:
+            # Min/max band behind the bucket means, so spikes stay visible
+            fig.add_trace(go.Scatter(x=df['timestamp'], y=df[f'{col}_max'], mode='lines',
+                                     line=dict(width=0, color=color), showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=df['timestamp'], y=df[f'{col}_min'], mode='lines',
+                                     line=dict(width=0, color=color), fill='tonexty', opacity=0.2,
+                                     name=f'{col} min/max', hoverinfo='skip'))
+            count = df[f'{col}_count'].sum()
+            mean = (df[col] * df[f'{col}_count']).sum() / count if count else float('nan')
+            low, high = df[f'{col}_min'].min(), df[f'{col}_max'].max()
+        else:
+            count, mean, low, high = df[col].count(), df[col].mean(), df[col].min(), df[col].max()
+        x_ds, y_ds = downsample(df['timestamp'], df[col], n_buckets * POINTS_PER_PIXEL)
+        fig.add_trace(go.Scatter(x=x_ds, y=y_ds, mode='lines', name=col, line=dict(color=color, width=2)))
+        stats_data.extend([
+            {'metric': f'{col} Mean', 'value': f"{mean:.4f}"},
+            {'metric': f'{col} Min', 'value': f"{low:.4f}"},
+            {'metric': f'{col} Max', 'value': f"{high:.4f}"},
+            {'metric': f'{col} Samples', 'value': f"{count:,}"}
+        ])
+    
+    if 'anomalies' in options and 'anomalies' in df.columns:
+        hits = df.loc[df['anomalies'] > 0]
+        if not hits.empty:
+            fig.add_trace(go.Scatter(
+                x=hits['timestamp'],
+                y=hits[f'{fields[0]}_max'],
+                mode='markers',
+                name='Anomalies',
+                marker=dict(size=10, color='red', symbol='x', line=dict(width=2, color='DarkSlateGrey')),
+                hovertext=[f"{n} anomalies" for n in hits['anomalies']],
+                hoverinfo='text+x'
+            ))
+    
+    detail = 'raw samples' if resolution == 0 else f'{resolution}s buckets'
+    fig.update_layout(
+        title=f"Register History: {series} ({len(df):,} {detail})",
+        xaxis_title='Time',
+        yaxis_title='Value',
+        template='plotly_white',
+        hovermode='x unified',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        margin=dict(l=50, r=50, t=50, b=50),
+        height=600
+    )
+    if isinstance(zoom, tuple):
+        fig.update_xaxes(range=list(zoom))
+    stats_data.append({'metric': 'Rows Plotted', 'value': f"{len(df):,} ({detail})"})
+    return fig, stats_data, stats_columns
+
+# Report the rendered plot width so the server picks a matching resolution
+app.clientside_callback(
+    """
+    function(relayout) {
+        var el = document.getElementById('timeseries-graph');
+        return el ? el.offsetWidth : window.innerWidth;
+    }
+    """,
+    Output('ts-plot-width', 'data'),
+    Input('timeseries-graph', 'relayoutData')
+)
+
+# Pushed alerts: extend the overview timeline and recent-anomalies table in place
+app.clientside_callback(
+    """
+    function(push, figure) {
+        if (!push || !figure) { return window.dash_clientside.no_update; }
+        var idx = figure.data.findIndex(function (t) { return t.name === 'Anomalies'; });
+        if (idx < 0) { return window.dash_clientside.no_update; }
+        var rows = push.rows;
+        return [{
+            x: [rows.map(function (r) { return r.timestamp; })],
+            y: [rows.map(function () { return -0.5; })],
+            hovertext: [rows.map(function (r) {
+                return 'Anomaly at ' + r.timestamp.slice(0, 19) + '<br>Score: ' + Number(r.score).toFixed(3) +
+                    '<br>Frames: ' + r.frames;
+            })]
+        }, [idx], 50000];
+    }
+    """,
+    Output('overview-timeline', 'extendData'),
+    Input('alert-push-store', 'data'),
+    State('overview-timeline', 'figure')
+)
+
+app.clientside_callback(
+    """
+    function(push, data) {
+        if (!push) { return window.dash_clientside.no_update; }
+        var rows = push.rows.slice().reverse().map(function (r) {
+            return {timestamp: r.timestamp.slice(0, 19), reg0: r.reg0, reg1: r.reg1, score: r.score,
+                    frames: r.frames};
+        });
+        return rows.concat(data || []).slice(0, 5);
+    }
+    """,
+    Output('recent-anomalies-table', 'data'),
+    Input('alert-push-store', 'data'),
+    State('recent-anomalies-table', 'data')
+)
+
 # Statistics Tab callbacks
 @app.callback(
     Output('stats-summary-tables', 'children'),
@@ -783,33 +893,24 @@ def update_timeseries(selected, start_date, end_date, options, datasets_json, an
     Input('stats-dataset-dropdown', 'value'),
     State('datasets-store', 'data')
 )
-def update_stats_tab(selected, datasets_json):
-    # Convert from JSON back to dataframes
-    datasets = {}
-    for name, records in datasets_json.items():
-        df = pd.DataFrame(records)
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        datasets[name] = df
-    
-    df = datasets.get(selected, pd.DataFrame())
+def update_stats_tab(selected, catalog):
+    stats = stats_cache.get(selected) if selected else None
     
     # Default empty returns
     summary_tables = html.Div("No data available")
     dist_fig = go.Figure()
     corr_fig = go.Figure()
     
-    if not df.empty:
-        # Get numeric columns
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        numeric_cols = [col for col in numeric_cols if col != 'timestamp']
+    if stats is not None and stats.rows:
+        # Numeric columns summarised by the stats cache
+        numeric_cols = stats.columns
         
         if numeric_cols:
             # Create summary statistics
             summary_tables = []
             
             # Descriptive statistics
-            desc_stats = df[numeric_cols].describe().reset_index()
+            desc_stats = stats.describe().reset_index()
             desc_stats = desc_stats.round(4)  # Round to 4 decimal places
             
             summary_tables.append(
@@ -832,13 +933,7 @@ def update_stats_tab(selected, datasets_json):
             )
             
             # Additional statistics
-            additional_stats = pd.DataFrame({
-                'Variable': numeric_cols,
-                'Skewness': [df[col].skew() for col in numeric_cols],
-                'Kurtosis': [df[col].kurtosis() for col in numeric_cols],
-                'Missing Values': [df[col].isna().sum() for col in numeric_cols],
-                'Missing (%)': [100 * df[col].isna().sum() / len(df) for col in numeric_cols]
-            }).round(4)
+            additional_stats = stats.extra().round(4)
             
             summary_tables.append(
                 html.Div([
@@ -860,26 +955,28 @@ def update_stats_tab(selected, datasets_json):
             )
             
             # Create distribution plot
+            from plotly.subplots import make_subplots
             dist_fig = make_subplots(rows=len(numeric_cols), cols=1, 
                                    subplot_titles=[f"Distribution of {col}" for col in numeric_cols],
                                    vertical_spacing=0.05)
             
-            for i, col in enumerate(numeric_cols):
-                # Add histogram
+            for i, (col, col_hist) in enumerate(zip(numeric_cols, stats.hists)):
+                # Add histogram (precomputed bins, so no raw values are sent)
+                bin_centers = col_hist.centers
                 dist_fig.add_trace(
-                    go.Histogram(
-                        x=df[col],
+                    go.Bar(
+                        x=bin_centers,
+                        y=col_hist.counts,
+                        width=col_hist.width,
                         name=col,
                         marker_color='rgba(0, 123, 255, 0.6)',
-                        opacity=0.8,
-                        autobinx=True
+                        opacity=0.8
                     ),
                     row=i+1, col=1
                 )
                 
                 # Add KDE (estimated using histogram)
-                hist, bin_edges = np.histogram(df[col].dropna(), bins='auto', density=True)
-                bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+                hist = col_hist.density()
                 
                 if len(bin_centers) > 1:  # Ensure we have enough points for line
                     dist_fig.add_trace(
@@ -904,7 +1001,7 @@ def update_stats_tab(selected, datasets_json):
             
             # Create correlation heatmap
             if len(numeric_cols) > 1:
-                corr_matrix = df[numeric_cols].corr().round(3)
+                corr_matrix = stats.corr().round(3)
                 corr_fig = go.Figure(data=go.Heatmap(
                     z=corr_matrix.values,
                     x=corr_matrix.columns,
@@ -941,20 +1038,18 @@ def update_stats_tab(selected, datasets_json):
     Output('available-datasets', 'children'),
     Input('datasets-store', 'data')
 )
-def update_available_datasets(datasets_json):
-    if not datasets_json:
+def update_available_datasets(catalog):
+    if not catalog:
         return html.P("No datasets available.")
     
     # Create a card for each dataset
     dataset_cards = []
     
-    for name, records in datasets_json.items():
-        df = pd.DataFrame(records)
-        
+    for name, summary in dataset_cache.summaries(catalog).items():
         # Get basic info
-        num_records = len(df)
-        num_columns = len(df.columns)
-        columns = ", ".join(df.columns)
+        num_records = summary['rows']
+        num_columns = len(summary['columns'])
+        columns = ", ".join(summary['columns'])
         
         # Create card
         card = dbc.Card([
@@ -980,18 +1075,18 @@ def update_available_datasets(datasets_json):
 
 # Helper functions for visualization
 
-def generate_overview_timeline(datasets, anomalies_df):
+def generate_overview_timeline(summaries, anomalies_df):
     """Generate overview timeline with dataset availability and anomalies"""
     fig = go.Figure()
     
     # Plot dataset availability periods
-    colors = px.colors.qualitative.Plotly
+    colors = qualitative.Plotly
     
-    for i, (name, df) in enumerate(datasets.items()):
-        if not df.empty and 'timestamp' in df.columns:
+    for i, (name, summary) in enumerate(summaries.items()):
+        if summary['rows']:
             color = colors[i % len(colors)]
-            start_time = df['timestamp'].min()
-            end_time = df['timestamp'].max()
+            start_time = summary['start']
+            end_time = summary['end']
             
             # Add dataset period as a rectangle
             fig.add_trace(go.Scatter(
@@ -1004,8 +1099,31 @@ def generate_overview_timeline(datasets, anomalies_df):
                 hovertext=f"{name}: {start_time.strftime('%Y-%m-%d %H:%M:%S')} to {end_time.strftime('%Y-%m-%d %H:%M:%S')}"
             ))
     
-    # Add anomalies as markers
-    if not anomalies_df.empty and 'timestamp' in anomalies_df.columns:
+    # Add anomalies as markers; past OVERVIEW_MARKERS alerts, one marker per
+    # rollup bucket sized by its count. The per-alert 'Anomalies' trace is
+    # always present (empty in count mode) so pushed alerts can extend it
+    counts = None
+    if len(anomalies_df) > OVERVIEW_MARKERS:
+        resolution, counts = rollups.refresh().query(ALL_SERIES, n_points=OVERVIEW_MARKERS // 2)
+        counts = counts.loc[counts['anomalies'] > 0] if resolution else None
+    if counts is not None:
+        fig.add_trace(go.Scatter(
+            x=counts['timestamp'],
+            y=[-0.5] * len(counts),
+            mode='markers',
+            marker=dict(
+                symbol='star',
+                size=np.clip(6 + 3 * np.log2(counts['anomalies']), 6, 24),
+                color='red',
+                line=dict(width=1, color='DarkSlateGrey')
+            ),
+            name='Anomaly counts',
+            hoverinfo='text',
+            hovertext=[f"{n:,} anomalies from {ts.strftime('%Y-%m-%d %H:%M:%S')} ({resolution}s)"
+                      for ts, n in zip(counts['timestamp'], counts['anomalies'])]
+        ))
+        anomalies_df = anomalies_df.iloc[:0]
+    if 'timestamp' in anomalies_df.columns:
         fig.add_trace(go.Scatter(
             x=anomalies_df['timestamp'],
             y=[-0.5] * len(anomalies_df),  # Plot below datasets
@@ -1017,9 +1135,11 @@ def generate_overview_timeline(datasets, anomalies_df):
                 line=dict(width=1, color='DarkSlateGrey')
             ),
             name='Anomalies',
+            showlegend=counts is None,
             hoverinfo='text',
-            hovertext=[f"Anomaly at {ts.strftime('%Y-%m-%d %H:%M:%S')}<br>Score: {score:.3f}" 
-                      for ts, score in zip(anomalies_df['timestamp'], anomalies_df['score'])]
+            hovertext=[f"Anomaly at {ts.strftime('%Y-%m-%d %H:%M:%S')}<br>Score: {score:.3f}<br>Frames: {n:,}"
+                      for ts, score, n in zip(anomalies_df['timestamp'], anomalies_df['score'],
+                                              anomalies_df['frames'])]
         ))
     
     # Layout
@@ -1039,8 +1159,8 @@ def generate_overview_timeline(datasets, anomalies_df):
         ),
         yaxis=dict(
             tickmode='array',
-            tickvals=list(range(len(datasets))),
-            ticktext=list(datasets.keys()),
+            tickvals=list(range(len(summaries))),
+            ticktext=list(summaries.keys()),
             showgrid=False
         ),
         margin=dict(l=50, r=50, t=50, b=20)
@@ -1050,18 +1170,15 @@ def generate_overview_timeline(datasets, anomalies_df):
 
 def generate_anomalies_table(anomalies_df):
     """Generate a table with recent anomalies"""
-    if anomalies_df.empty:
-        return html.P("No anomalies detected.")
-    
     # Take most recent anomalies
     recent_df = anomalies_df.sort_values('timestamp', ascending=False).head(5)
     
     # Format the data
     recent_df = recent_df.copy()
-    recent_df['timestamp'] = recent_df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    recent_df['timestamp'] = pd.to_datetime(recent_df['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
     
     # Create table columns (excluding SHAP values)
-    columns = [{'name': c, 'id': c} for c in recent_df.columns if c != 'shap']
+    columns = [{'name': c, 'id': c} for c in ['timestamp', 'reg0', 'reg1', 'score', 'frames']]
     
     return dash_table.DataTable(
         id='recent-anomalies-table',
@@ -1084,8 +1201,11 @@ def generate_anomaly_distribution(anomalies_df):
     
     if not anomalies_df.empty and 'score' in anomalies_df.columns:
         # Create histogram
+        # Each alert line stands for `frames` anomalous frames
         fig.add_trace(go.Histogram(
             x=anomalies_df['score'],
+            y=anomalies_df['frames'],
+            histfunc='sum',
             marker_color='rgba(255, 0, 0, 0.7)',
             opacity=0.8,
             name='Anomaly Scores',
@@ -1115,8 +1235,8 @@ def generate_anomaly_timeline(anomalies_df):
         
         # Create hovertext with safe formatting
         hovertext = []
-        for ts, score, r0, r1 in zip(sorted_df['timestamp'], sorted_df['score'], 
-                                    sorted_df['reg0'], sorted_df['reg1']):
+        for ts, score, r0, r1, n in zip(sorted_df['timestamp'], sorted_df['score'],
+                                       sorted_df['reg0'], sorted_df['reg1'], sorted_df['frames']):
             try:
                 time_str = ts.strftime('%Y-%m-%d %H:%M:%S') if pd.notnull(ts) else "N/A"
             except (AttributeError, TypeError):
@@ -1124,7 +1244,8 @@ def generate_anomaly_timeline(anomalies_df):
             score_str = f"{score:.3f}" if pd.notnull(score) else "N/A"
             r0_str = f"{r0:.2f}" if pd.notnull(r0) else "N/A"
             r1_str = f"{r1:.2f}" if pd.notnull(r1) else "N/A"
-            hovertext.append(f"Time: {time_str}<br>Score: {score_str}<br>Reg0: {r0_str}, Reg1: {r1_str}")
+            hovertext.append(f"Time: {time_str}<br>Score: {score_str}<br>Reg0: {r0_str}, Reg1: {r1_str}"
+                             f"<br>Frames: {n:,}")
         
         # Create scatter plot with safe value handling
         fig.add_trace(go.Scatter(
@@ -1132,7 +1253,8 @@ def generate_anomaly_timeline(anomalies_df):
             y=sorted_df['score'].fillna(0),  # Fill NaN scores with 0
             mode='markers',
             marker=dict(
-                size=sorted_df['score'].fillna(0) * 5,  # Fill NaN scores with 0 for size
+                # Anomaly scores are negative; size markers by their magnitude
+                size=(sorted_df['score'].fillna(0).abs() * 50).clip(5, 25),
                 color=sorted_df['score'].fillna(0),  # Fill NaN scores with 0 for color
                 colorscale='Reds',
                 showscale=True,
@@ -1163,8 +1285,11 @@ def generate_score_histogram(anomalies_df):
     
     if not anomalies_df.empty and 'score' in anomalies_df.columns:
         # Create histogram with more detail than simple distribution
+        # Each alert line stands for `frames` anomalous frames
         fig.add_trace(go.Histogram(
             x=anomalies_df['score'],
+            y=anomalies_df['frames'],
+            histfunc='sum',
             marker=dict(
                 color='rgba(255, 0, 0, 0.7)',
                 line=dict(color='rgba(255, 0, 0, 1)', width=1)
@@ -1175,7 +1300,9 @@ def generate_score_histogram(anomalies_df):
         ))
         
         # Add KDE overlay (estimated using histogram)
-        hist, bin_edges = np.histogram(anomalies_df['score'].dropna(), bins='auto', density=True)
+        scored = anomalies_df.dropna(subset=['score'])
+        bin_edges = np.histogram_bin_edges(scored['score'], bins='auto')
+        hist, bin_edges = np.histogram(scored['score'], bins=bin_edges, weights=scored['frames'], density=True)
         bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
         
         if len(bin_centers) > 1:  # Ensure we have enough points for line
@@ -1188,7 +1315,7 @@ def generate_score_histogram(anomalies_df):
             ))
         
         # Add vertical line for mean score
-        mean_score = anomalies_df['score'].mean()
+        mean_score = np.average(scored['score'], weights=scored['frames']) if len(scored) else np.nan
         fig.add_vline(
             x=mean_score,
             line_dash="dash",
@@ -1217,48 +1344,128 @@ def generate_score_histogram(anomalies_df):
     
     return fig
 
-def generate_shap_analysis(anomalies_df):
-    """Generate SHAP value analysis if available"""
+def _no_shap_figure(fig):
+    fig.add_annotation(
+        text="SHAP values not available",
+        xref="paper", yref="paper",
+        x=0.5, y=0.5,
+        showarrow=False,
+        font=dict(size=20)
+    )
+    return fig
+
+def generate_shap_analysis(shap_aggregates):
+    """Mean |SHAP| per feature over every stored alert, one bar series per device"""
     fig = go.Figure()
     
-    # Check if we have shap values to analyze
-    if not anomalies_df.empty and 'shap' in anomalies_df.columns:
-        # Try to parse SHAP values - this is just a placeholder
-        # In a real implementation, you'd parse the actual SHAP values from the column
-        
-        # Create dummy data for example
-        features = ['Feature1', 'Feature2', 'Feature3', 'Feature4']
-        importance = [0.8, 0.5, 0.3, 0.2]
-        
-        # Sort by importance
-        sorted_indices = np.argsort(importance)
-        sorted_features = [features[i] for i in sorted_indices]
-        sorted_importance = [importance[i] for i in sorted_indices]
-        
+    if shap_aggregates is not None and shap_aggregates.count:
+        features = shap_aggregates.features
+        order = np.argsort(shap_aggregates.mean_abs())
+        sorted_features = [features[i] for i in order]
+        if len(shap_aggregates.devices) > 1:
+            for i, device in enumerate(sorted(shap_aggregates.devices)):
+                fig.add_trace(go.Bar(
+                    y=sorted_features,
+                    x=shap_aggregates.mean_abs(device)[order],
+                    orientation='h',
+                    name=f"{device} ({shap_aggregates.devices[device][0]})",
+                    marker=dict(color=qualitative.Plotly[i % len(qualitative.Plotly)])
+                ))
+            fig.update_layout(barmode='group')
+        else:
+            sorted_importance = shap_aggregates.mean_abs()[order]
+            fig.add_trace(go.Bar(
+                y=sorted_features,
+                x=sorted_importance,
+                orientation='h',
+                marker=dict(
+                    color=sorted_importance,
+                    colorscale='Reds',
+                    line=dict(width=1, color='DarkSlateGrey')
+                )
+            ))
+    else:
+        _no_shap_figure(fig)
+    
+    # Layout
+    fig.update_layout(
+        title="Mean |SHAP| per Feature",
+        xaxis_title="Mean |SHAP value|",
+        yaxis_title="Feature",
+        template='plotly_white',
+        height=400,
+        margin=dict(l=150, r=50, t=50, b=20)
+    )
+    
+    return fig
+
+def generate_shap_timeline(shap_aggregates):
+    """Mean |SHAP| per feature in each time bucket"""
+    fig = go.Figure()
+    
+    times, matrix = shap_aggregates.bucket_series() if shap_aggregates is not None else ([], None)
+    if len(times):
+        x = pd.to_datetime(times, unit='s')
+        for i, feature in enumerate(shap_aggregates.features):
+            fig.add_trace(go.Scatter(
+                x=x,
+                y=matrix[:, i],
+                mode='lines+markers',
+                name=feature,
+                line=dict(color=qualitative.Plotly[i % len(qualitative.Plotly)])
+            ))
+    else:
+        _no_shap_figure(fig)
+    
+    fig.update_layout(
+        title="Mean |SHAP| per Time Bucket",
+        xaxis_title="Time",
+        yaxis_title="Mean |SHAP value|",
+        template='plotly_white',
+        height=400,
+        margin=dict(l=50, r=50, t=50, b=20)
+    )
+    
+    return fig
+
+def incident_options(records, limit=50):
+    """Dropdown options for the detectors' most recent incidents (incidents.jsonl), newest first"""
+    options = []
+    for inc in reversed(records[-limit:]):
+        start = pd.to_datetime(inc['start'], unit='s').strftime('%Y-%m-%d %H:%M:%S')
+        options.append({
+            'label': f"{start}  {inc['device']}  ({inc['frames']:,} frames, {inc['duration']:.0f}s)",
+            'value': inc['id']
+        })
+    return options
+
+def generate_incident_attribution(records, incident_id):
+    """SHAP of an incident's representative (lowest-scoring sampled) frame"""
+    fig = go.Figure()
+    
+    incident = None
+    if incident_id is not None:
+        incident = next((inc for inc in records if inc['id'] == incident_id), None)
+    if incident is not None and incident.get('shap'):
+        shap = np.asarray(incident['shap'], dtype=float)
+        features = incident.get('features') or [f"feature {i}" for i in range(len(shap))]
+        order = np.argsort(np.abs(shap))
         fig.add_trace(go.Bar(
-            y=sorted_features,
-            x=sorted_importance,
+            y=[features[i] for i in order],
+            x=shap[order],
             orientation='h',
-            marker=dict(
-                color=sorted_importance,
-                colorscale='Reds',
-                line=dict(width=1, color='DarkSlateGrey')
-            )
+            name='SHAP',
+            marker=dict(color=['rgba(255, 0, 0, 0.7)' if v < 0 else 'rgba(0, 0, 255, 0.7)' for v in shap[order]])
         ))
+        title = (f"Incident on {incident['device']}: {incident['frames']:,} frames, "
+                 f"peak score {incident['min_score']:.3f}")
     else:
-        # No SHAP values available
-        fig.add_annotation(
-            text="SHAP values not available",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5,
-            showarrow=False,
-            font=dict(size=20)
-        )
+        _no_shap_figure(fig)
+        title = "Incident Attribution"
     
-    # Layout
     fig.update_layout(
-        title="Feature Importance (SHAP Values)",
-        xaxis_title="Impact on Model Output",
+        title=title,
+        xaxis_title="SHAP value (negative pushes towards anomalous)",
         yaxis_title="Feature",
         template='plotly_white',
         height=400,
@@ -1267,6 +1474,14 @@ def generate_shap_analysis(anomalies_df):
     
     return fig
 
-# Run the app
+# Incident attribution
+@app.callback(
+    Output('shap-incident', 'figure'),
+    Input('shap-incident-dropdown', 'value')
+)
+def update_shap_incident(incident_id):
+    return generate_incident_attribution(read_incidents(INCIDENT_LOG), incident_id)
+
+# Run the app (through Socket.IO so alert push works)
 if __name__ == '__main__':
-    app.run(debug=True, port=8050)
\ No newline at end of file
+    alert_push.run(app, debug=True, port=8050)
\ No newline at end of file
@@ -0,0 +1,21 @@
+// Receive alert batches pushed by the server (src/dashboard/push.py) and hand
+// them to Dash through the alert-push-store; clientside callbacks take it from there.
+(function () {
+    var attempts = 0;
+    function connect() {
+        if (typeof io === 'undefined' || !window.dash_clientside || !window.dash_clientside.set_props) {
+            // Dashboards without the Socket.IO client simply never connect
+            if (++attempts < 40) {
+                setTimeout(connect, 250);
+            }
+            return;
+        }
+        var seq = 0;
+        var socket = io();
+        socket.on('alerts', function (rows) {
+            seq += 1;
+            window.dash_clientside.set_props('alert-push-store', {data: {seq: seq, rows: rows}});
+        });
+    }
+    connect();
+})();
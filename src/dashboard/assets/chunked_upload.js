@@ -0,0 +1,60 @@
+// Chunked uploads for the Data Management tab: files dropped on (or picked from)
+// #chunked-upload are posted to /upload/chunk in CHUNK-sized slices, so the
+// browser never base64-encodes or buffers a whole capture. The server side is
+// src/dashboard/ingest.py; progress is polled from there by a Dash callback.
+(function () {
+    var CHUNK = 4 * 1024 * 1024;  // keep in sync with ingest.UPLOAD_CHUNK
+
+    function jobId() {
+        var bytes = new Uint8Array(16);
+        window.crypto.getRandomValues(bytes);
+        return Array.from(bytes, function (b) { return ('0' + b.toString(16)).slice(-2); }).join('');
+    }
+
+    async function upload(file) {
+        var id = jobId();
+        var offset = 0;
+        while (true) {
+            var end = Math.min(offset + CHUNK, file.size);
+            var final = end >= file.size;
+            var url = '/upload/chunk?id=' + id +
+                '&name=' + encodeURIComponent(file.name) +
+                '&offset=' + offset + '&total=' + file.size + (final ? '&final=1' : '');
+            var resp = await fetch(url, {method: 'POST', body: file.slice(offset, end)});
+            if (resp.status === 409) {
+                var state = await resp.json();
+                if (state.offset === undefined) { return; }
+                offset = state.offset;  // resume where the server left off
+                continue;
+            }
+            if (!resp.ok || final) { return; }  // errors are reported through the job status
+            offset = end;
+        }
+    }
+
+    function start(files) {
+        if (!files || !files.length) { return; }
+        if (window.dash_clientside && window.dash_clientside.set_props) {
+            window.dash_clientside.set_props('upload-interval', {disabled: false});
+        }
+        Array.from(files).forEach(upload);
+    }
+
+    document.addEventListener('click', function (e) {
+        if (!e.target.closest || !e.target.closest('#chunked-upload')) { return; }
+        var input = document.createElement('input');
+        input.type = 'file';
+        input.accept = '.csv';
+        input.multiple = true;
+        input.onchange = function () { start(input.files); };
+        input.click();
+    });
+    document.addEventListener('dragover', function (e) {
+        if (e.target.closest && e.target.closest('#chunked-upload')) { e.preventDefault(); }
+    });
+    document.addEventListener('drop', function (e) {
+        if (!e.target.closest || !e.target.closest('#chunked-upload')) { return; }
+        e.preventDefault();
+        start(e.dataTransfer.files);
+    });
+})();
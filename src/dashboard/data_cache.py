@@ -0,0 +1,183 @@
+"""
+data_cache.py
+
+Server-side cache for the dashboards. DataFrames stay in the Dash process, keyed
+by dataset name and file modification time; callbacks only pass the small
+version keys around through dcc.Store and look the frames up here, so payloads
+stay a few kilobytes no matter how large the captures are. Frames are read on
+first use; views that only need row counts and time spans use summary(),
+which counts lines instead of parsing the CSV.
+
+Captures with a 'timestamp' column (the collector writes epoch seconds) are
+plotted at their real times; older captures without one get synthetic
+per-second timestamps.
+"""
+
+import csv
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from src.storage.tsdb import local_datetimes
+
+
+def synthetic_start(name):
+    """Start time used to fabricate timestamps for a capture without them."""
+    name = name.lower()
+    if 'baseline' in name:
+        return datetime(2024, 1, 1)
+    elif 'attack' in name:
+        return datetime(2024, 1, 1, 12)  # Attacks start at noon
+    return datetime(2024, 1, 1, 8)       # Other scenarios start at 8 AM
+
+
+def to_datetime(values):
+    """Timestamps as written to CSV (epoch seconds or date strings) -> datetimes."""
+    if pd.api.types.is_numeric_dtype(values):
+        return local_datetimes(values)
+    return pd.to_datetime(values)
+
+
+def read_dataset(path):
+    """Load one CSV, keeping its own timestamps or adding synthetic per-second ones."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    df = pd.read_csv(path)
+    if 'timestamp' in df.columns:
+        df['timestamp'] = to_datetime(df['timestamp'])
+    else:
+        df['timestamp'] = pd.date_range(start=synthetic_start(name), periods=len(df), freq='s')
+    return df
+
+
+def edge_timestamps(path, column):
+    """(first, last) value of CSV `column` read from the first and last lines only."""
+    with open(path, 'rb') as f:
+        f.readline()
+        first = f.readline()
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        tail = f.read().splitlines()
+    lines = [line for line in (first, tail[-1] if tail else b'') if line.strip()]
+    if len(lines) < 2:
+        return None
+    stamps = [next(csv.reader([line.decode('utf-8', errors='replace')]))[column] for line in lines]
+    try:
+        stamps = [float(stamp) for stamp in stamps]
+    except ValueError:
+        pass
+    first, last = to_datetime(pd.Series(stamps)).tolist()
+    return first, last
+
+
+class DatasetCache:
+    """name -> DataFrame, reloaded only when the backing CSV changes on disk."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._entries = {}  # name -> (version, DataFrame)
+        self._summaries = {}  # name -> (version, summary dict)
+        self._lock = threading.Lock()
+
+    def catalog(self):
+        """{name: version} for every CSV in the folder; cheap (one stat per file)."""
+        versions = {}
+        if os.path.isdir(self.folder):
+            for entry in sorted(os.scandir(self.folder), key=lambda e: e.name):
+                if entry.name.endswith('.csv') and entry.is_file():
+                    st = entry.stat()
+                    name = os.path.splitext(entry.name)[0]
+                    versions[name] = f"{st.st_mtime_ns}-{st.st_size}"
+        return versions
+
+    def path(self, name):
+        return os.path.join(self.folder, f"{name}.csv")
+
+    def get(self, name):
+        """Return the DataFrame for `name` (empty if missing or unreadable)."""
+        try:
+            st = os.stat(self.path(name))
+        except (FileNotFoundError, TypeError):
+            return pd.DataFrame()
+        version = f"{st.st_mtime_ns}-{st.st_size}"
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry[0] != version:
+                try:
+                    df = read_dataset(self.path(name))
+                except Exception as e:
+                    print(f"Error loading {name}.csv: {e}")
+                    df = pd.DataFrame()
+                entry = self._entries[name] = (version, df)
+        return entry[1]
+
+    def get_many(self, names):
+        return {name: self.get(name) for name in names}
+
+    def summary(self, name):
+        """{'rows', 'columns', 'start', 'end'} for `name` without parsing it (None if missing)."""
+        try:
+            st = os.stat(self.path(name))
+        except (FileNotFoundError, TypeError):
+            return None
+        version = f"{st.st_mtime_ns}-{st.st_size}"
+        cached = self._summaries.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        entry = self._entries.get(name)
+        edges = None
+        if entry is not None and entry[0] == version:
+            # Already parsed: take the exact numbers from the frame
+            df = entry[1]
+            rows, columns = len(df), list(df.columns)
+            if rows:
+                edges = (df['timestamp'].iloc[0], df['timestamp'].iloc[-1])
+        else:
+            with open(self.path(name), 'rb') as f:
+                header = f.readline()
+                rows, last = 0, b'\n'
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    rows += chunk.count(b'\n')
+                    last = chunk[-1:]
+                rows += last != b'\n'
+            columns = next(csv.reader([header.decode('utf-8', errors='replace')]), [])
+            columns = [c.strip() for c in columns] if header.strip() else []
+            if 'timestamp' in columns:
+                try:
+                    edges = edge_timestamps(self.path(name), columns.index('timestamp'))
+                except (ValueError, IndexError):
+                    edges = None
+            elif columns:
+                columns.append('timestamp')
+        if edges is None:
+            start = synthetic_start(name)
+            edges = (start, start + timedelta(seconds=max(rows - 1, 0)))
+        summary = {
+            'rows': rows,
+            'columns': columns,
+            'start': edges[0],
+            'end': edges[1],
+        }
+        self._summaries[name] = (version, summary)
+        return summary
+
+    def summaries(self, names):
+        """{name: summary} for the names that still exist."""
+        out = {}
+        for name in names:
+            summary = self.summary(name)
+            if summary is not None:
+                out[name] = summary
+        return out
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
@@ -0,0 +1,98 @@
+"""
+downsample.py
+
+Level-of-detail helpers for the dashboard time-series plots. Series are reduced
+to at most a couple of points per horizontal pixel (and never more than
+MAX_POINTS per trace) with Largest-Triangle-Three-Buckets, which keeps the
+visual shape including spikes; very long series are first pre-reduced with
+vectorised min/max bucketing so LTTB only sees a few times its output size.
+Zooming re-queries the visible range, so detail grows as the window shrinks.
+"""
+
+import numpy as np
+import pandas as pd
+
+MAX_POINTS         = 5000   # hard cap per trace
+POINTS_PER_PIXEL   = 2
+DEFAULT_PLOT_WIDTH = 1200   # px, used until the browser reports the real width
+MINMAX_PREFILTER   = 4      # min/max pre-reduce to this many x the LTTB target
+
+
+def target_points(width_px=None):
+    width = width_px or DEFAULT_PLOT_WIDTH
+    return int(min(MAX_POINTS, max(100, width * POINTS_PER_PIXEL)))
+
+
+def minmax_indices(y, n_buckets):
+    """Indices of the min and max of each of `n_buckets` equal-count buckets (sorted)."""
+    n = len(y)
+    size = int(np.ceil(n / n_buckets))
+    pad = size * n_buckets - n
+    yy = np.asarray(y, dtype=float)
+    if pad:
+        yy = np.concatenate([yy, np.full(pad, np.nan)])
+    blocks = yy.reshape(n_buckets, size)
+    filled = np.where(np.isnan(blocks), np.inf, blocks)
+    base = np.arange(n_buckets) * size
+    lo = base + np.argmin(filled, axis=1)
+    hi = base + np.argmax(np.where(np.isnan(blocks), -np.inf, blocks), axis=1)
+    idx = np.unique(np.concatenate([lo, hi, [0, n - 1]]))
+    return idx[idx < n]
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets selection; returns indices into x/y."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Bucket edges over the interior points; first and last are always kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    csx = np.concatenate([[0.0], np.cumsum(x)])
+    csy = np.concatenate([[0.0], np.cumsum(np.nan_to_num(y))])
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Average point of the next bucket (or the last point)
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        nhi = max(nhi, nlo + 1)
+        avg_x = (csx[nhi] - csx[nlo]) / (nhi - nlo)
+        avg_y = (csy[nhi] - csy[nlo]) / (nhi - nlo)
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.nanargmax(area)) if not np.all(np.isnan(area)) else lo
+        out[i + 1] = a
+    return out
+
+
+def downsample(x, y, n_out=MAX_POINTS):
+    """Reduce one trace to at most n_out points, preserving its visual envelope."""
+    x = pd.Series(x).reset_index(drop=True)
+    y = pd.Series(y).reset_index(drop=True)
+    n = len(x)
+    if n <= n_out:
+        return x, y
+    xv = x.to_numpy()
+    xnum = xv.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(xv.dtype, np.datetime64) else xv
+    yv = y.to_numpy(dtype=float)
+    idx = np.arange(n)
+    if n > n_out * MINMAX_PREFILTER:
+        idx = minmax_indices(yv, n_out * MINMAX_PREFILTER // 2)
+    keep = idx[lttb_indices(xnum[idx], yv[idx], n_out)]
+    return x.iloc[keep], y.iloc[keep]
+
+
+def visible_range(relayout_data):
+    """(x0, x1) from a Plotly relayout zoom event, 'full' on autorange, else None."""
+    if not relayout_data:
+        return None
+    if relayout_data.get('xaxis.autorange'):
+        return 'full'
+    if 'xaxis.range[0]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    rng = relayout_data.get('xaxis.range')
+    if rng:
+        return rng[0], rng[1]
+    return None
@@ -0,0 +1,164 @@
+"""
+ingest.py
+
+Chunked upload ingestion for the Data Management tab. The browser
+(assets/chunked_upload.js) posts each file in UPLOAD_CHUNK slices to
+/upload/chunk; slices are streamed straight into a spool file, so neither the
+browser nor the server ever holds the whole capture. After the last slice a
+background thread parses the spool with pandas in CHUNK_ROWS-row chunks,
+writes the normalised CSV into the data folder (atomically, so the catalog
+never sees half a file) and folds each chunk into the streaming statistics.
+Job state is kept here for the progress bar to poll.
+"""
+
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+from flask import jsonify, request
+from werkzeug.utils import secure_filename
+
+from src.dashboard.stats_cache import DatasetStats
+
+UPLOAD_CHUNK = 4 << 20    # bytes per browser slice (mirrored in chunked_upload.js)
+CHUNK_ROWS   = 200_000    # rows per parse step
+READ_BLOCK   = 1 << 16    # bytes per read from the request stream
+KEEP_JOBS    = 20         # finished jobs kept for the status list
+
+_JOB_ID = re.compile(r'^[0-9a-f]{8,32}$')
+
+
+class IngestJob:
+    """One uploaded file moving through uploading -> parsing -> done | error."""
+
+    def __init__(self, job_id, filename, total):
+        self.id = job_id
+        self.filename = filename
+        self.name = os.path.splitext(secure_filename(filename))[0]
+        self.total = total
+        self.received = 0
+        self.parsed = 0
+        self.rows = 0
+        self.state = 'uploading'
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+
+    @property
+    def progress(self):
+        """0..1; the upload and the parse each count for half."""
+        if self.state == 'done':
+            return 1.0
+        total = max(self.total, 1)
+        if self.state == 'uploading':
+            return 0.5 * self.received / total
+        return 0.5 + 0.5 * min(self.parsed / total, 1.0)
+
+    @property
+    def active(self):
+        return self.state in ('uploading', 'parsing')
+
+
+class UploadManager:
+    """Registers /upload/chunk on the Flask server and runs the ingest jobs."""
+
+    def __init__(self, server, dataset_cache, spool_dir, stats_cache=None):
+        self.datasets = dataset_cache
+        self.spool_dir = spool_dir
+        self.stats_cache = stats_cache
+        self._jobs = {}
+        self._lock = threading.Lock()
+        server.add_url_rule('/upload/chunk', 'upload_chunk', self._chunk, methods=['POST'])
+
+    def jobs(self):
+        """Jobs, newest first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.started, reverse=True)
+
+    def _spool_path(self, job):
+        return os.path.join(self.spool_dir, f"{job.id}.part")
+
+    def _fail(self, job, message, status=400):
+        job.state, job.error, job.finished = 'error', message, time.time()
+        try:
+            os.remove(self._spool_path(job))
+        except FileNotFoundError:
+            pass
+        return jsonify(error=message), status
+
+    def _chunk(self):
+        job_id = request.args.get('id', '')
+        if not _JOB_ID.match(job_id):
+            return jsonify(error='bad upload id'), 400
+        try:
+            offset = int(request.args['offset'])
+            total = int(request.args['total'])
+        except (KeyError, ValueError):
+            return jsonify(error='offset and total are required'), 400
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = self._jobs[job_id] = IngestJob(job_id, request.args.get('name', ''), total)
+                finished = [j for j in self._jobs.values() if not j.active]
+                for old in sorted(finished, key=lambda j: j.started)[:-KEEP_JOBS]:
+                    del self._jobs[old.id]
+        if job.state != 'uploading':
+            return jsonify(error=f'upload is {job.state}'), 409
+        if not job.name or not job.filename.lower().endswith('.csv'):
+            return self._fail(job, 'only .csv files can be uploaded')
+        if offset != job.received:
+            # Out of order or retried slice: tell the client where to resume
+            return jsonify(offset=job.received), 409
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with open(self._spool_path(job), 'ab') as f:
+            while True:
+                block = request.stream.read(READ_BLOCK)
+                if not block:
+                    break
+                f.write(block)
+                job.received += len(block)
+
+        if request.args.get('final'):
+            if job.received != job.total:
+                return self._fail(job, f'received {job.received} of {job.total} bytes')
+            job.state = 'parsing'
+            threading.Thread(target=self._ingest, args=(job,), daemon=True,
+                             name=f'ingest-{job.name}').start()
+        return jsonify(offset=job.received)
+
+    def _ingest(self, job):
+        spool = self._spool_path(job)
+        target = self.datasets.path(job.name)
+        tmp = target + '.part'
+        stats = None
+        try:
+            with open(spool, 'rb') as src, open(tmp, 'w', newline='') as out:
+                for i, chunk in enumerate(pd.read_csv(src, chunksize=CHUNK_ROWS)):
+                    if stats is None:
+                        columns = [c for c in chunk.select_dtypes(include=['number']).columns
+                                   if c != 'timestamp']
+                        stats = DatasetStats(chunk.columns, columns)
+                    stats.update(chunk[stats.columns].apply(pd.to_numeric, errors='coerce')
+                                 .to_numpy(dtype=float))
+                    chunk.to_csv(out, header=(i == 0), index=False)
+                    job.rows += len(chunk)
+                    job.parsed = src.tell()
+            if stats is None:
+                raise ValueError('no rows found')
+            os.replace(tmp, target)
+            self.datasets.invalidate(job.name)
+            if self.stats_cache is not None:
+                self.stats_cache.register(job.name, stats)
+            job.state = 'done'
+        except Exception as e:
+            job.state, job.error = 'error', str(e)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        finally:
+            job.finished = time.time()
+            if os.path.exists(spool):
+                os.remove(spool)
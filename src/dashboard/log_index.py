@@ -0,0 +1,221 @@
+"""
+log_index.py
+
+Paginated, searchable access to large logs for the dashboard log viewer. Each
+file gets a sparse line-offset index (the byte offset of every INDEX_STRIDE-th
+line) built once in fixed-size chunks and extended as the file grows; pages
+are read straight out of an mmap from the nearest index entry. Searches scan
+the file a chunk at a time, keep a cursor so the next page resumes where the
+last one stopped, and give up after MAX_MATCHES hits, so memory stays
+constant however large the log is.
+"""
+
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+INDEX_STRIDE = 1024      # lines between sparse index entries
+CHUNK_SIZE   = 4 << 20   # bytes read per index/search step
+PAGE_SIZE    = 200       # lines per viewer page
+MAX_MATCHES  = 10000     # a search stops after this many matching lines
+SEARCH_CACHE = 8         # search cursors kept per file
+
+
+def _decode(raw):
+    return raw.rstrip(b'\r\n').decode('utf-8', errors='replace')
+
+
+class _Search:
+    """Resumable case-insensitive scan: matching (line_no, offset) pairs found so far."""
+
+    def __init__(self, term):
+        self.needle = term.lower().encode('utf-8')
+        self.offset = 0
+        self.line_no = 0
+        self.hits = []
+        self.complete = False
+
+    def advance(self, fd, size, want):
+        """Scan further until `want` hits are known, the cap is hit, or the file ends."""
+        while not self.complete and len(self.hits) < want:
+            if self.offset >= size:
+                self.complete = True
+                break
+            chunk = os.pread(fd, min(CHUNK_SIZE, size - self.offset), self.offset)
+            if self.offset + len(chunk) < size:
+                # Stop at the last full line so no line straddles two chunks
+                cut = chunk.rfind(b'\n') + 1
+                chunk = chunk[:cut or len(chunk)]
+            lower = chunk.lower()
+            pos = counted = 0
+            line_no = self.line_no
+            while True:
+                pos = lower.find(self.needle, pos)
+                if pos < 0:
+                    break
+                start = lower.rfind(b'\n', 0, pos) + 1
+                line_no += lower.count(b'\n', counted, start)
+                counted = start
+                self.hits.append((line_no, self.offset + start))
+                if len(self.hits) >= MAX_MATCHES:
+                    self.complete = True
+                    break
+                end = lower.find(b'\n', pos)
+                if end < 0:
+                    break
+                pos = end + 1  # one hit per line
+            self.line_no = line_no + lower.count(b'\n', counted)
+            self.offset += len(chunk)
+
+
+class LogIndex:
+    """Sparse line index over one log file; pages and searches are served from disk."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        self.size = 0
+        self._newlines = 0            # complete lines indexed so far
+        self._tail_start = 0          # offset just past the last newline
+        self._index = np.zeros(1, dtype=np.int64)  # offset of line k * INDEX_STRIDE
+        self._searches = OrderedDict()
+
+    @property
+    def version(self):
+        return f"{self.inode}-{self.size}"
+
+    @property
+    def line_count(self):
+        """Lines in the file, counting an unterminated last line."""
+        return self._newlines + (self.size > self._tail_start)
+
+    def refresh(self):
+        """Index whatever was appended since the last call (rebuild if rotated/truncated)."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset(None)
+                return self
+            if st.st_ino != self.inode or st.st_size < self.size:
+                self._reset(st.st_ino)
+            if st.st_size > self.size:
+                self._extend(st.st_size)
+                self._searches.clear()
+        return self
+
+    def _extend(self, size):
+        entries = []
+        with open(self.path, 'rb') as f:
+            fd = f.fileno()
+            pos = self.size
+            while pos < size:
+                chunk = os.pread(fd, min(CHUNK_SIZE, size - pos), pos)
+                if not chunk:
+                    break
+                nl = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10)
+                # Newline i ends line (_newlines + i); the next line starts right after it
+                first = -(self._newlines + 1) % INDEX_STRIDE
+                entries.append(pos + nl[first::INDEX_STRIDE] + 1)
+                if len(nl):
+                    self._tail_start = pos + int(nl[-1]) + 1
+                self._newlines += len(nl)
+                pos += len(chunk)
+            self.size = pos
+        if entries:
+            self._index = np.concatenate([self._index] + entries)
+
+    def _line_offset(self, line_no, mm):
+        """Byte offset where `line_no` starts, walking forward from the nearest index entry."""
+        block = min(line_no // INDEX_STRIDE, len(self._index) - 1)
+        off = int(self._index[block])
+        for _ in range(line_no - block * INDEX_STRIDE):
+            off = mm.find(b'\n', off) + 1
+            if not off:
+                return self.size
+        return off
+
+    def lines(self, start, count):
+        """Up to `count` decoded lines starting at line number `start`."""
+        with self._lock:
+            if self.size == 0 or start >= self.line_count:
+                return []
+            out = []
+            with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                off = self._line_offset(start, mm)
+                end_of_data = min(self.size, len(mm))
+                while len(out) < count and off < end_of_data:
+                    end = mm.find(b'\n', off, end_of_data)
+                    end = end_of_data if end < 0 else end + 1
+                    out.append(_decode(mm[off:end]))
+                    off = end
+            return out
+
+    def page(self, page, page_size=PAGE_SIZE):
+        """(page, first line number, lines) with `page` clamped to the last page."""
+        n_pages = max(1, -(-self.line_count // page_size))
+        page = min(max(page, 0), n_pages - 1)
+        start = page * page_size
+        return page, start, self.lines(start, page_size)
+
+    def tail(self, count=PAGE_SIZE):
+        """(first line number, lines) for the last `count` lines."""
+        start = max(0, self.line_count - count)
+        return start, self.lines(start, count)
+
+    def search(self, term, page, page_size=PAGE_SIZE):
+        """(page, [(line_no, text)], matches found so far, complete) for one page of hits."""
+        with self._lock:
+            key = term.lower()
+            search = self._searches.pop(key, None) or _Search(term)
+            self._searches[key] = search
+            while len(self._searches) > SEARCH_CACHE:
+                self._searches.popitem(last=False)
+            if self.size == 0:
+                return 0, [], 0, True
+            with open(self.path, 'rb') as f:
+                search.advance(f.fileno(), self.size, (max(page, 0) + 1) * page_size)
+                found = len(search.hits)
+                n_pages = max(1, -(-found // page_size))
+                if search.complete:
+                    page = min(page, n_pages - 1)
+                page = max(page, 0)
+                hits = search.hits[page * page_size:(page + 1) * page_size]
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    rows = []
+                    for line_no, off in hits:
+                        end = mm.find(b'\n', off, self.size)
+                        rows.append((line_no, _decode(mm[off:self.size if end < 0 else end])))
+            return page, rows, found, search.complete
+
+
+class LogCatalog:
+    """name -> LogIndex for the log files in one folder."""
+
+    def __init__(self, folder, suffix='.log'):
+        self.folder = folder
+        self.suffix = suffix
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def names(self):
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(f for f in os.listdir(self.folder) if f.endswith(self.suffix))
+
+    def get(self, name):
+        """Refreshed LogIndex for `name`, or None if it is not a log in this folder."""
+        if name not in self.names():
+            return None
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is None:
+                index = self._indexes[name] = LogIndex(os.path.join(self.folder, name))
+        return index.refresh()
@@ -0,0 +1,87 @@
+"""
+push.py
+
+Real-time alert push for the dashboards. A background task follows new alerts
+(the anomaly log via inotify by default, or the ZeroMQ alert bus with
+ALERT_PUSH_SOURCE=bus) and emits each batch to every browser over Socket.IO.
+The browser side (assets/alert_push.js) hands the batch to clientside
+callbacks that extend the open figures and tables in place, so new anomalies
+show up within a fraction of a second without re-rendering the page. The
+Socket.IO client (v4.7.5) is vendored as assets/socket.io.min.js, so Dash
+serves it along with the other assets and no CDN is needed.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from flask_socketio import SocketIO
+
+from src.dashboard.alert_loader import parse_alert_line
+
+ALERT_PUSH_SOURCE = os.getenv("ALERT_PUSH_SOURCE", "file")
+EVENT             = "alerts"
+POLL_TIMEOUT      = 1.0
+
+
+def _row(ts, reg0, reg1, score, frames=1):
+    return {
+        'timestamp': datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f'),
+        'reg0': reg0,
+        'reg1': reg1,
+        'score': score,
+        'frames': frames,
+    }
+
+
+def _file_batches(path):
+    from src.logging.follow import LogFollower
+
+    follower = LogFollower(path)
+    while True:
+        rows = []
+        for line in follower.poll(POLL_TIMEOUT):
+            rec = parse_alert_line(line)
+            if rec is not None:
+                rows.append(_row(rec['timestamp'].timestamp(), rec['reg0'], rec['reg1'], rec['score'],
+                                 rec['frames']))
+        yield rows
+
+
+def _bus_batches():
+    from src.alerts.bus import AlertSubscriber
+
+    sub = AlertSubscriber()
+    while True:
+        rows = []
+        for a in sub.recv_batch(POLL_TIMEOUT):
+            regs = a['registers'] + [None, None]
+            rows.append(_row(a['ts'], regs[0], regs[1], a['score'], a.get('frames', 1)))
+        yield rows
+
+
+class AlertPush:
+    """Attach Socket.IO to the Dash Flask server and stream alerts once a client connects."""
+
+    def __init__(self, server, alerts_path, source=ALERT_PUSH_SOURCE):
+        self.socketio = SocketIO(server, async_mode='threading')
+        self.alerts_path = alerts_path
+        self.source = source
+        self._started = False
+        self._lock = threading.Lock()
+        self.socketio.on_event('connect', self._on_connect)
+
+    def _on_connect(self, auth=None):
+        with self._lock:
+            if not self._started:
+                self._started = True
+                self.socketio.start_background_task(self._forward)
+
+    def _forward(self):
+        batches = _bus_batches() if self.source == 'bus' else _file_batches(self.alerts_path)
+        for rows in batches:
+            if rows:
+                self.socketio.emit(EVENT, rows)
+
+    def run(self, app, **kwargs):
+        self.socketio.run(app.server, allow_unsafe_werkzeug=True, **kwargs)
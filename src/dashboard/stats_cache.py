@@ -0,0 +1,433 @@
+"""
+stats_cache.py
+
+Precomputed statistics for the Statistical Analysis tab. Each dataset is
+summarised once per content hash: streaming moments per column (count, mean,
+M2..M4, min/max), a mergeable histogram per column, the co-moment matrix for
+correlations and the quartiles. The summary is persisted as JSON under
+data/cache/stats, so reopening the tab or restarting the dashboard costs a
+stat() and a dict lookup. When a CSV only grows, the appended rows are folded
+in with the same merge rules instead of re-reading the whole file.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+HIST_BINS  = 256       # histogram bins per column before halving resolution
+HASH_CHUNK = 1 << 20   # bytes per read while hashing
+QUANTILES  = (0.25, 0.5, 0.75)
+
+
+def _merge_moments(na, ma, m2a, m3a, m4a, nb, mb, m2b, m3b, m4b):
+    """Combine central moment sums of two samples (Chan et al. / Pebay)."""
+    n = na + nb
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = np.where(nb > 0, mb - ma, 0.0)
+        delta = np.where(na > 0, delta, 0.0)
+        nn = np.where(n > 0, n, 1)
+        mean = np.where(na > 0, ma, 0.0) + delta * nb / nn
+        mean = np.where(na > 0, mean, np.where(nb > 0, mb, np.nan))
+        m2 = m2a + m2b + delta**2 * na * nb / nn
+        m3 = (m3a + m3b + delta**3 * na * nb * (na - nb) / nn**2
+              + 3 * delta * (na * m2b - nb * m2a) / nn)
+        m4 = (m4a + m4b + delta**4 * na * nb * (na**2 - na * nb + nb**2) / nn**3
+              + 6 * delta**2 * (na**2 * m2b + nb**2 * m2a) / nn**2
+              + 4 * delta * (na * m3b - nb * m3a) / nn)
+    return n, mean, m2, m3, m4
+
+
+class Moments:
+    """Per-column streaming moments; NaNs are counted as missing."""
+
+    FIELDS = ('n', 'mean', 'm2', 'm3', 'm4', 'min', 'max', 'missing')
+
+    def __init__(self, k):
+        self.n = np.zeros(k)
+        self.mean = np.full(k, np.nan)
+        self.m2 = np.zeros(k)
+        self.m3 = np.zeros(k)
+        self.m4 = np.zeros(k)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+        self.missing = np.zeros(k)
+
+    def update(self, X):
+        """Fold in a 2-D float batch (rows x columns)."""
+        valid = ~np.isnan(X)
+        nb = valid.sum(axis=0).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mb = np.nansum(X, axis=0) / nb
+        d = np.where(valid, X - mb, 0.0)
+        self.n, self.mean, self.m2, self.m3, self.m4 = _merge_moments(
+            self.n, self.mean, self.m2, self.m3, self.m4,
+            nb, mb, (d**2).sum(axis=0), (d**3).sum(axis=0), (d**4).sum(axis=0))
+        if len(X):
+            self.min = np.fmin(self.min, np.nanmin(np.where(valid, X, np.inf), axis=0))
+            self.max = np.fmax(self.max, np.nanmax(np.where(valid, X, -np.inf), axis=0))
+        self.missing += (~valid).sum(axis=0)
+        return self
+
+    @property
+    def std(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.n > 1, np.sqrt(self.m2 / (self.n - 1)), np.nan)
+
+    @property
+    def skew(self):
+        """Bias-corrected sample skewness, as pandas.Series.skew."""
+        n = self.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            g1 = np.sqrt(n) * self.m3 / self.m2**1.5
+            out = np.sqrt(n * (n - 1)) / (n - 2) * g1
+        out = np.where(self.m2 < 1e-14, 0.0, out)  # pandas treats this as zero variance
+        return np.where(n > 2, out, np.nan)
+
+    @property
+    def kurtosis(self):
+        """Bias-corrected excess kurtosis, as pandas.Series.kurtosis."""
+        n = self.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            g2 = n * self.m4 / self.m2**2 - 3
+            out = ((n + 1) * g2 + 6) * (n - 1) / ((n - 2) * (n - 3))
+        out = np.where(self.m2 < 1e-14, 0.0, out)  # pandas treats this as zero variance
+        return np.where(n > 3, out, np.nan)
+
+    def to_dict(self):
+        return {f: getattr(self, f).tolist() for f in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, d):
+        m = cls(len(d['n']))
+        for f in cls.FIELDS:
+            setattr(m, f, np.asarray(d[f], dtype=float))
+        return m
+
+
+class Histogram:
+    """Fixed-origin histogram that grows by halving its resolution, so any two with
+    the same origin and base width can be merged exactly."""
+
+    def __init__(self, origin, width):
+        self.origin = float(origin)
+        self.width = float(width)
+        self.kmin = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_values(cls, values):
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls(0.0, 1.0)
+        edges = np.histogram_bin_edges(values, bins='auto')
+        width = (edges[-1] - edges[0]) / max(1, len(edges) - 1)
+        hist = cls(edges[0], width if width > 0 else 1.0)
+        return hist.add(values)
+
+    def _coarsen(self):
+        # Bin k at width w becomes bin k // 2 at width 2w
+        new_kmin = self.kmin // 2
+        idx = (np.arange(self.kmin, self.kmin + len(self.counts)) // 2) - new_kmin
+        merged = np.zeros(idx[-1] + 1 if len(idx) else 0, dtype=np.int64)
+        np.add.at(merged, idx, self.counts)
+        self.kmin, self.counts, self.width = new_kmin, merged, self.width * 2
+
+    def add(self, values, counts=None):
+        values = np.asarray(values, dtype=float)
+        keep = ~np.isnan(values)
+        values = values[keep]
+        weights = np.ones(len(values), dtype=np.int64) if counts is None else np.asarray(counts)[keep]
+        if len(values) == 0:
+            return self
+        lo, hi = values.min(), values.max()
+        while True:
+            k_lo = int(np.floor((lo - self.origin) / self.width))
+            k_hi = int(np.floor((hi - self.origin) / self.width))
+            if len(self.counts):
+                k_lo = min(k_lo, self.kmin)
+                k_hi = max(k_hi, self.kmin + len(self.counts) - 1)
+            if k_hi - k_lo < HIST_BINS:
+                break
+            self._coarsen()
+        if not len(self.counts):
+            self.kmin = k_lo
+        if k_lo < self.kmin or k_hi >= self.kmin + len(self.counts):
+            grown = np.zeros(k_hi - k_lo + 1, dtype=np.int64)
+            grown[self.kmin - k_lo:self.kmin - k_lo + len(self.counts)] = self.counts
+            self.kmin, self.counts = k_lo, grown
+        k = np.floor((values - self.origin) / self.width).astype(np.int64) - self.kmin
+        np.add.at(self.counts, np.clip(k, 0, len(self.counts) - 1), weights)
+        return self
+
+    @property
+    def edges(self):
+        return self.origin + self.width * np.arange(self.kmin, self.kmin + len(self.counts) + 1)
+
+    @property
+    def centers(self):
+        e = self.edges
+        return (e[:-1] + e[1:]) / 2
+
+    def density(self):
+        total = self.counts.sum()
+        return self.counts / (total * self.width) if total else self.counts.astype(float)
+
+    def merge(self, other):
+        """Fold another histogram with the same origin in (resolutions may differ)."""
+        if len(other.counts):
+            while self.width < other.width:
+                self._coarsen()
+            self.add(other.centers, other.counts)
+        return self
+
+    def quantile(self, q):
+        """Linearly interpolated quantile from the bin counts."""
+        total = self.counts.sum()
+        if not total:
+            return np.nan
+        cum = np.concatenate([[0], np.cumsum(self.counts)])
+        return float(np.interp(q * total, cum, self.edges))
+
+    def to_dict(self):
+        return {'origin': self.origin, 'width': self.width, 'kmin': self.kmin,
+                'counts': self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        h = cls(d['origin'], d['width'])
+        h.kmin = d['kmin']
+        h.counts = np.asarray(d['counts'], dtype=np.int64)
+        return h
+
+
+class CoMoments:
+    """Running mean and co-moment matrix over rows complete in every column."""
+
+    def __init__(self, k):
+        self.n = 0
+        self.mean = np.zeros(k)
+        self.C = np.zeros((k, k))
+
+    def update(self, X):
+        X = X[~np.isnan(X).any(axis=1)]
+        nb = len(X)
+        if not nb:
+            return self
+        mb = X.mean(axis=0)
+        d = X - mb
+        delta = mb - self.mean
+        n = self.n + nb
+        self.C += d.T @ d + np.outer(delta, delta) * self.n * nb / n
+        self.mean += delta * nb / n
+        self.n = n
+        return self
+
+    def corr(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s = np.sqrt(np.diag(self.C))
+            return np.clip(self.C / np.outer(s, s), -1, 1)
+
+    def to_dict(self):
+        return {'n': self.n, 'mean': self.mean.tolist(), 'C': self.C.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        c = cls(len(d['mean']))
+        c.n, c.mean, c.C = d['n'], np.asarray(d['mean']), np.asarray(d['C'])
+        return c
+
+
+class DatasetStats:
+    """Everything the stats tab shows for one dataset, mergeable across row batches."""
+
+    def __init__(self, header, columns):
+        self.header = list(header)    # every CSV column, for parsing appended rows
+        self.columns = list(columns)  # the numeric ones summarised here
+        self.rows = 0
+        self.moments = Moments(len(columns))
+        self.comoments = CoMoments(len(columns))
+        self.hists = None
+        self.quantiles = None         # exact quartiles from a full pass, else None
+
+    @classmethod
+    def from_frame(cls, df, header=None):
+        columns = [c for c in df.select_dtypes(include=['number']).columns if c != 'timestamp']
+        stats = cls(header if header is not None else df.columns, columns)
+        X = df[columns].to_numpy(dtype=float)
+        stats.update(X)
+        if columns and len(X):
+            stats.quantiles = np.nanquantile(X, QUANTILES, axis=0).T.tolist()
+        return stats
+
+    def update(self, X):
+        """Fold in a float batch of the numeric columns."""
+        self.rows += len(X)
+        self.moments.update(X)
+        self.comoments.update(X)
+        if self.hists is None:
+            self.hists = [Histogram.from_values(X[:, i]) for i in range(len(self.columns))]
+        else:
+            for i, h in enumerate(self.hists):
+                h.add(X[:, i])
+        self.quantiles = None
+        return self
+
+    def append_csv_rows(self, data):
+        """Fold in raw CSV rows (no header) appended to the file."""
+        df = pd.read_csv(io.BytesIO(data), header=None, names=self.header)
+        X = df[self.columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        return self.update(X)
+
+    def describe(self):
+        """Same shape as DataFrame.describe() for the numeric columns."""
+        m = self.moments
+        if self.quantiles is not None:
+            q = np.asarray(self.quantiles, dtype=float)
+        else:
+            q = np.array([[h.quantile(p) for p in QUANTILES] for h in self.hists or []], dtype=float)
+        q = q.reshape(len(self.columns), len(QUANTILES))
+        rows = {
+            'count': m.n, 'mean': m.mean, 'std': m.std,
+            'min': np.where(m.n > 0, m.min, np.nan),
+            '25%': q[:, 0], '50%': q[:, 1], '75%': q[:, 2],
+            'max': np.where(m.n > 0, m.max, np.nan),
+        }
+        return pd.DataFrame(rows, index=self.columns).T
+
+    def extra(self):
+        m = self.moments
+        return pd.DataFrame({
+            'Variable': self.columns,
+            'Skewness': m.skew,
+            'Kurtosis': m.kurtosis,
+            'Missing Values': m.missing.astype(int),
+            'Missing (%)': 100 * m.missing / self.rows if self.rows else np.zeros(len(self.columns)),
+        })
+
+    def corr(self):
+        return pd.DataFrame(self.comoments.corr(), index=self.columns, columns=self.columns)
+
+    def to_dict(self):
+        return {
+            'header': self.header, 'columns': self.columns, 'rows': self.rows,
+            'moments': self.moments.to_dict(), 'comoments': self.comoments.to_dict(),
+            'hists': [h.to_dict() for h in self.hists or []], 'quantiles': self.quantiles,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls(d['header'], d['columns'])
+        stats.rows = d['rows']
+        stats.moments = Moments.from_dict(d['moments'])
+        stats.comoments = CoMoments.from_dict(d['comoments'])
+        stats.hists = [Histogram.from_dict(h) for h in d['hists']]
+        stats.quantiles = d['quantiles']
+        return stats
+
+
+class _Entry:
+    __slots__ = ('version', 'inode', 'offset', 'prefix_hash', 'stats')
+
+    def __init__(self, version, inode, offset, prefix_hash, stats):
+        self.version, self.inode, self.offset = version, inode, offset
+        self.prefix_hash, self.stats = prefix_hash, stats
+
+
+class StatsCache:
+    """name -> DatasetStats, computed once per file content and persisted under cache_dir."""
+
+    def __init__(self, dataset_cache, cache_dir):
+        self.datasets = dataset_cache
+        self.cache_dir = cache_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _hash(self, path, prefix_len=None):
+        """(digest of the first prefix_len bytes, digest of the file, bytes hashed, ends with newline)."""
+        h = hashlib.blake2b(digest_size=16)
+        prefix, pos, last = None, 0, b''
+        with open(path, 'rb') as f:
+            while True:
+                if prefix_len is not None and prefix is None and pos == prefix_len:
+                    prefix = h.hexdigest()
+                want = HASH_CHUNK if prefix is not None or prefix_len is None else min(HASH_CHUNK, prefix_len - pos)
+                chunk = f.read(want)
+                if not chunk:
+                    break
+                h.update(chunk)
+                pos += len(chunk)
+                last = chunk[-1:]
+        return prefix, h.hexdigest(), pos, last == b'\n'
+
+    def _cache_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _load(self, digest):
+        try:
+            with open(self._cache_path(digest)) as f:
+                return DatasetStats.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _save(self, digest, stats):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self._cache_path(digest) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(stats.to_dict(), f)
+        os.replace(tmp, self._cache_path(digest))
+
+    def register(self, name, stats):
+        """Store stats computed elsewhere (e.g. while ingesting an upload) for the file as it is now."""
+        path = self.datasets.path(name)
+        with self._lock:
+            st = os.stat(path)
+            _, digest, size, whole_rows = self._hash(path)
+            self._save(digest, stats)
+            self._entries[name] = _Entry(f"{st.st_mtime_ns}-{st.st_size}", st.st_ino,
+                                         size if whole_rows else None, digest, stats)
+
+    def get(self, name):
+        """DatasetStats for `name`, or None if the dataset is missing or unreadable."""
+        path = self.datasets.path(name)
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, TypeError):
+            return None
+        version = f"{st.st_mtime_ns}-{st.st_size}"
+        entry = self._entries.get(name)
+        if entry is not None and entry.version == version:
+            return entry.stats
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.version == version:
+                return entry.stats
+            # Appended to in place? Then the bytes already summarised are unchanged
+            appended = (entry is not None and entry.offset is not None
+                        and entry.inode == st.st_ino and entry.offset <= st.st_size)
+            prefix, digest, size, whole_rows = self._hash(path, entry.offset if appended else None)
+            appended = appended and prefix == entry.prefix_hash
+            stats = self._load(digest)
+            if stats is None:
+                try:
+                    if appended:
+                        with open(path, 'rb') as f:
+                            f.seek(entry.offset)
+                            tail = f.read(size - entry.offset)
+                        stats = entry.stats
+                        stats.append_csv_rows(tail)
+                    else:
+                        with open(path, 'rb') as f:
+                            header = pd.read_csv(f, nrows=0).columns
+                        stats = DatasetStats.from_frame(self.datasets.get(name), header)
+                except Exception as e:
+                    print(f"Error computing statistics for {name}: {e}")
+                    return None
+                self._save(digest, stats)
+            # Only offer the append path next time if this snapshot ended on a row boundary
+            self._entries[name] = _Entry(version, st.st_ino, size if whole_rows else None, digest, stats)
+            return stats
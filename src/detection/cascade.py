@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""
+cascade.py
+
+Early-exit wrapper around the IsolationForest: most frames are plainly
+normal, so they are cleared by cheap stages and only the rest pay for the
+full decision_function.
+
+  1. range    every feature inside a box taken from baseline percentiles
+              (shrunk by a deadband) -> normal, no trees evaluated
+  2. screen   the first SCREEN_TREES trees of the same forest (a partial
+              average of the same path lengths) score at least `band` above
+              the threshold -> normal, with the partial score
+  3. full     everything else gets the full model's score
+
+Both stages are calibrated against the full model rather than trusted. The
+calibration set is the baseline plus uniform probes over a box three times
+the baseline's span. The range box is the widest percentile box whose probes
+all score CLEAR_MARGIN above the threshold. The screen band is the largest
+partial score of any probe the full model flags, so no calibration frame
+the full model flags is ever cleared early. The attack traces stay held out;
+`evaluate` checks verdict agreement on them against TOLERANCE.
+
+Cleared frames get a stand-in score (stage 1: the lowest calibrated score
+inside the box; stage 2: the partial score). Both are at least CLEAR_MARGIN
+above the threshold, so they read as comfortably normal to the poll scheduler.
+
+    python -m src.detection.cascade fit          # -> models/cascade.json for the current model
+    python -m src.detection.cascade evaluate     # agreement, stage exits and per-frame cost per attack trace
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.detection.model_registry import FlatIsolationForest, flatten_forest
+
+CASCADE_PATH  = os.getenv("CASCADE", "models/cascade.json")   # "off" disables the cascade
+SCREEN_TREES  = int(os.getenv("CASCADE_SCREEN_TREES", 10))
+CLEAR_MARGIN  = float(os.getenv("CASCADE_MARGIN", 0.05))      # decision_function units
+PERCENTILES   = (0.5, 1, 2.5, 5, 10, 15, 20, 25, 30, 35, 40, 45)   # box candidates, widest first
+DEADBAND      = 0.02     # fraction of the percentile range trimmed from each side of the box
+N_PROBES      = 50_000
+TOLERANCE     = 0.001    # max fraction of frames whose verdict may differ from the full model
+STAGES        = ("range", "screen", "full")
+BASELINE_PATH = "data/raw/baseline.csv"
+ATTACK_FILES  = {
+    "false_data":     "data/raw/false_data.csv",
+    "logic_injection":"data/raw/logic_injection.csv",
+    "dos_flood":      "data/raw/dos_flood.csv",
+    "fuzz_modbus":    "data/raw/fuzz_modbus.csv",
+    "replay_attack":  "data/raw/replay_attack.csv",
+    "multi_register": "data/raw/write_multiple_registers.csv",
+}
+
+
+def flat_forest(model):
+    """The model as a FlatIsolationForest (registry models already are one)."""
+    if isinstance(model, FlatIsolationForest):
+        return model
+    meta = {
+        "version":     None,
+        "features":    [str(c) for c in model.feature_names_in_],
+        "max_samples": int(model.max_samples_),
+        "max_depth":   max(est.tree_.max_depth for est in model.estimators_),
+        "offset":      float(model.offset_),
+    }
+    return FlatIsolationForest(flatten_forest(model), meta)
+
+
+def screen_forest(flat, n_trees):
+    """The first `n_trees` trees of a flat forest, sharing its node arrays."""
+    screen = copy.copy(flat)
+    screen.roots = flat.roots[:n_trees]
+    screen._norm = flat._norm * len(screen.roots) / len(flat.roots)
+    return screen
+
+
+def fingerprint(model):
+    """What a cascade file was fitted against: features, offset and forest size."""
+    flat = model if isinstance(model, FlatIsolationForest) else None
+    return {
+        "features": [str(c) for c in model.feature_names_in_],
+        "offset":   round(float(model.offset_), 12),
+        "trees":    len(flat.roots) if flat is not None else len(model.estimators_),
+    }
+
+
+class CascadeDetector:
+    """decision_function() with range and screen early exits in front of `model`."""
+
+    def __init__(self, model, box_lo, box_hi, box_score, screen_trees, band, threshold=0.0):
+        self.model = model
+        self.feature_names_in_ = np.asarray(model.feature_names_in_, dtype=object)
+        self._features = [str(f) for f in self.feature_names_in_]
+        self.box_lo = np.asarray(box_lo, dtype=float)
+        self.box_hi = np.asarray(box_hi, dtype=float)
+        self.box_score = float(box_score)
+        self.screen_trees = int(screen_trees)
+        self.band = float(band)
+        self.threshold = float(threshold)
+        self.screen = screen_forest(flat_forest(model), self.screen_trees) if self.screen_trees else None
+        self.exits = np.zeros(len(STAGES), dtype=np.int64)   # frames leaving at each stage
+
+    def decision_function(self, X):
+        frame = X if isinstance(X, pd.DataFrame) else None
+        if frame is not None:
+            if list(frame.columns) != self._features:
+                frame = frame[self._features]   # column selection costs more than a range check
+            X = frame.to_numpy(dtype=float)
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        scores = np.full(len(X), self.box_score)
+
+        rest = np.flatnonzero(~((X >= self.box_lo) & (X <= self.box_hi)).all(axis=1))
+        self.exits[0] += len(X) - len(rest)
+        if len(rest) and self.screen is not None:
+            partial = self.screen.decision_function(X[rest])
+            cleared = partial >= self.threshold + self.band
+            scores[rest[cleared]] = partial[cleared]
+            self.exits[1] += int(cleared.sum())
+            rest = rest[~cleared]
+        if len(rest):
+            full_in = frame.iloc[rest] if frame is not None else X[rest]
+            scores[rest] = self.model.decision_function(full_in)
+            self.exits[2] += len(rest)
+        return scores
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < self.threshold, -1, 1)
+
+    def fractions(self):
+        """Share of frames scored so far that exited at each stage."""
+        total = self.exits.sum()
+        return dict(zip(STAGES, (self.exits / total if total else self.exits * 0.0).tolist()))
+
+    def to_dict(self):
+        return {
+            "model":        fingerprint(self.model),
+            "threshold":    self.threshold,
+            "box_lo":       self.box_lo.tolist(),
+            "box_hi":       self.box_hi.tolist(),
+            "box_score":    self.box_score,
+            "screen_trees": self.screen_trees,
+            "band":         self.band,
+        }
+
+    def save(self, path=CASCADE_PATH):
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, model, path=CASCADE_PATH, threshold=0.0):
+        """Cascade for `model` from `path`, or None if disabled, missing or fitted to another model."""
+        if not path or path == "off":
+            return None
+        try:
+            with open(path) as f:
+                cfg = json.load(f)
+        except FileNotFoundError:
+            return None
+        if cfg["model"] != fingerprint(model) or cfg["threshold"] != threshold:
+            print(f"[WARN] {path} was fitted for another model or threshold; scoring every frame in full")
+            return None
+        return cls(model, cfg["box_lo"], cfg["box_hi"], cfg["box_score"], cfg["screen_trees"], cfg["band"],
+                   cfg["threshold"])
+
+
+def probes(baseline, n=N_PROBES, seed=0):
+    """Baseline frames plus uniform probes over a box three times the baseline's span."""
+    lo, hi = baseline.min(axis=0), baseline.max(axis=0)
+    span = np.maximum(hi - lo, 1.0)
+    rng = np.random.default_rng(seed)
+    uniform = rng.uniform(lo - span, hi + span, size=(n, baseline.shape[1]))
+    return np.vstack([baseline, np.round(uniform), uniform])
+
+
+def fit_cascade(model, baseline, threshold=0.0, screen_trees=SCREEN_TREES, margin=CLEAR_MARGIN, n_probes=N_PROBES):
+    """Calibrate the range box and screen band of a cascade for `model` on baseline frames."""
+    baseline = np.asarray(baseline, dtype=float)
+    X = probes(baseline, n_probes)
+    full = flat_forest(model).decision_function(X)
+
+    # 1. Widest percentile box (minus deadband) whose calibration frames all clear the margin
+    box_lo = np.full(X.shape[1], np.inf)
+    box_hi = np.full(X.shape[1], -np.inf)
+    box_score = threshold + margin
+    for q in PERCENTILES:
+        lo, hi = np.percentile(baseline, [q, 100 - q], axis=0)
+        dead = (hi - lo) * DEADBAND
+        lo, hi = lo + dead, hi - dead
+        inside = ((X >= lo) & (X <= hi)).all(axis=1)
+        if inside.any() and full[inside].min() >= threshold + margin:
+            box_lo, box_hi, box_score = lo, hi, float(full[inside].min())
+            break
+
+    # 2. Screen band: above the partial score of every flagged calibration frame
+    band = np.inf
+    if screen_trees:
+        partial = screen_forest(flat_forest(model), screen_trees).decision_function(X)
+        flagged = full < threshold
+        worst = partial[flagged].max() if flagged.any() else -np.inf
+        band = max(margin, float(worst - threshold) + 1e-9)
+    return CascadeDetector(model, box_lo, box_hi, box_score, screen_trees, band, threshold)
+
+
+def load_model():
+    from src.detection import model_registry
+
+    if model_registry.resolve():
+        return model_registry.load()
+    import joblib
+    return joblib.load("models/isoforest.pkl")
+
+
+def evaluate(cascade, files=ATTACK_FILES, timed=200):
+    """Per trace: frames, verdict mismatches vs the full model, stage exits, and the
+    per-frame scoring time of both on the first `timed` frames, one at a time as detect.py polls."""
+    rows = []
+    for name, path in files.items():
+        df = pd.read_csv(path)[list(cascade.feature_names_in_)]
+        full = cascade.model.decision_function(df)
+        cascade.exits[:] = 0
+        fast = cascade.decision_function(df)
+        exits = cascade.exits.copy()
+        mismatches = int(((full < cascade.threshold) != (fast < cascade.threshold)).sum())
+        frames = [df.iloc[i:i + 1] for i in range(min(timed, len(df)))]
+        t0 = time.perf_counter()
+        for frame in frames:
+            cascade.model.decision_function(frame)
+        t_full = (time.perf_counter() - t0) / len(frames)
+        t0 = time.perf_counter()
+        for frame in frames:
+            cascade.decision_function(frame)
+        t_fast = (time.perf_counter() - t0) / len(frames)
+        rows.append((name, len(df), mismatches, exits, t_full, t_fast))
+    cascade.exits[:] = 0
+    return rows
+
+
+def main():
+    p = argparse.ArgumentParser(description="Fit or evaluate the early-exit detection cascade")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    f = sub.add_parser("fit", help="calibrate the cascade for the current model on baseline frames")
+    f.add_argument("--baseline", default=BASELINE_PATH)
+    f.add_argument("--screen-trees", type=int, default=SCREEN_TREES)
+    f.add_argument("--margin", type=float, default=CLEAR_MARGIN)
+    f.add_argument("--threshold", type=float, default=float(os.getenv("ANOMALY_THRESHOLD", 0)))
+    f.add_argument("-o", "--output", default=CASCADE_PATH if CASCADE_PATH != "off" else "models/cascade.json")
+    e = sub.add_parser("evaluate", help="compare cascade and full-model verdicts on the attack traces")
+    e.add_argument("--path", default=CASCADE_PATH if CASCADE_PATH != "off" else "models/cascade.json")
+    e.add_argument("--threshold", type=float, default=float(os.getenv("ANOMALY_THRESHOLD", 0)))
+    e.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = p.parse_args()
+
+    model = load_model()
+    if args.cmd == "fit":
+        features = list(model.feature_names_in_)
+        baseline = pd.read_csv(args.baseline)[features].to_numpy(dtype=float)
+        cascade = fit_cascade(model, baseline, args.threshold, args.screen_trees, args.margin)
+        cascade.save(args.output)
+        box = ", ".join(f"{n} [{lo:.2f}, {hi:.2f}]" for n, lo, hi in zip(features, cascade.box_lo, cascade.box_hi))
+        print(f"Range box: {box} (score >= {cascade.box_score:.4f})")
+        print(f"Screen: {cascade.screen_trees} trees, clears at score >= {cascade.threshold + cascade.band:.4f}")
+        print(f"Saved to {args.output}")
+        return
+
+    cascade = CascadeDetector.load(model, args.path, args.threshold)
+    if cascade is None:
+        sys.exit(f"No usable cascade at {args.path}; run `python -m src.detection.cascade fit` first")
+    print(f"{'trace':16s} {'frames':>6s} {'differ':>6s} {'range':>6s} {'screen':>6s} {'full':>6s} "
+          f"{'full us':>8s} {'cascade us':>10s}")
+    total = differ = 0
+    for name, n, mismatches, exits, t_full, t_fast in evaluate(cascade):
+        share = exits / n
+        print(f"{name:16s} {n:6d} {mismatches:6d} {share[0]:6.1%} {share[1]:6.1%} {share[2]:6.1%} "
+              f"{t_full * 1e6:8.0f} {t_fast * 1e6:10.0f}")
+        total += n
+        differ += mismatches
+    rate = differ / max(total, 1)
+    print(f"Verdicts differ on {differ}/{total} frames ({rate:.3%}, tolerance {args.tolerance:.3%})")
+    if rate > args.tolerance:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
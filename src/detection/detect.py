@@ -4,59 +4,283 @@ detect.py
 
 Polls the PLC’s holding registers in real time, applies the trained IsolationForest,
 and logs anomalies (with SHAP values) to logs/alerts/anomaly.log without warnings.
+
+Alerts are also published on the ZeroMQ alert bus (src/alerts/bus.py) so the
+VLAN manager and dashboards react without tailing the log file, and each SHAP
+vector is appended to the numeric store (src/detection/shap_store.py) that the
+dashboard's attribution views aggregate.
+
+Runtime metrics (poll RTT, scoring/SHAP latency, alerts, reconnects, dropped
+alerts) are served in Prometheus format on METRICS_PORT (default 9101).
+
+Registers are read through a read plan (src/modbus/read_planner.py): by
+default the model's features map to holding registers 0..n-1 and coils 1-4
+(the logic-injection targets) are polled alongside and published with each
+alert; POINTS_FILE supplies an explicit point list instead.
+
+Polls run on a deadline scheduler (src/detection/scheduler.py): the interval
+tightens to POLL_INTERVAL (default 0.1 s) when scores approach the threshold
+or values move quickly, backs off towards POLL_MAX_INTERVAL when the process
+is quiet, and PLC_MAX_RATE caps the Modbus requests per second. With
+MODBUS_WINDOW > 1 the plan's blocks are pipelined on one connection
+(src/modbus/pipeline.py), so a poll costs one round trip.
+
+Consecutive anomalous polls are coalesced into incidents
+(src/detection/incidents.py), written to logs/alerts/incidents.jsonl when
+they close. Only sampled frames (the first, exponentially spaced ones and new
+score peaks) are explained with SHAP, logged and published, each carrying
+the number of anomalous frames it stands for.
+
+Every successful poll (all points) is appended to the compressed register
+history (src/storage/tsdb.py) under the series "<PLC_HOST>:<PLC_PORT>".
+
+Set TRACE_DIR to record sampled per-stage spans of the poll loop (read,
+DataFrame build, scoring, SHAP, log write, publish); see src/telemetry/tracing.py.
+
+Frames are scored through the early-exit cascade (src/detection/cascade.py)
+when models/cascade.json was fitted for the loaded model: baseline range
+checks and a 10-tree screen clear most normal frames before the full forest
+runs. CASCADE=off scores every frame in full.
+
+Set DETECTOR=online to use the streaming EWMA ensemble (models/online.pkl) instead;
+it keeps adapting to the process baseline and freezes while an alert is active.
 """
 
+import os
 import time
 import joblib
-import shap
+import numpy as np
 import pandas as pd
 from pymodbus.client import ModbusTcpClient
+from pymodbus.exceptions import ModbusException
+
+from src.alerts.bus import AlertPublisher, make_alert
+from src.detection.cascade import STAGES, CascadeDetector
+from src.detection.incidents import IncidentTracker
+from src.detection.scheduler import AdaptiveInterval, DeadlineScheduler
+from src.detection.shap_store import ShapWriter
+from src.modbus.pipeline import PipelinedClient
+from src.modbus.read_planner import Point, ReadPlan, load_points
+from src.storage.tsdb import SeriesWriter
+from src.telemetry import metrics, tracing
 
 # PLC connection settings
 PLC_HOST      = "192.168.64.1"
 PLC_PORT      = 502
 PLC_SLAVE     = 1
-POLL_INTERVAL = 0.1  # seconds
 ANOMALY_THRESH = 0   # decision_function < 0 => anomaly
+POINTS_FILE   = os.getenv("POINTS_FILE")  # JSON point list; default: features at holding 0..n-1
+MODBUS_WINDOW = int(os.getenv("MODBUS_WINDOW", 0))  # >1: transactions in flight per poll
+COIL_POINTS   = [Point(f"coil_{a}", "coil", a) for a in (1, 2, 3, 4)]
+
+# Detector selection: "isoforest" (batch-trained) or "online" (streaming)
+DETECTOR    = os.getenv("DETECTOR", "isoforest")
+MODEL_PATHS = {
+    "isoforest": "models/isoforest.pkl",
+    "online":    "models/online.pkl",
+}
+
+# Load model and explainer. IsolationForest comes from the model registry when
+# one is populated: its memory-mapped arrays load in milliseconds and are shared
+# between detector processes; SHAP is only built when the first anomaly needs it.
+_explainer = None
+
+if DETECTOR == "online":
+    if not os.path.exists(MODEL_PATHS[DETECTOR]):
+        raise SystemExit(f"{MODEL_PATHS[DETECTOR]} not found; warm-start the online model first with "
+                         f"python -m src.detection.online_model")
+    clf = joblib.load(MODEL_PATHS[DETECTOR])
+    explain = clf.explain
+else:
+    from src.detection import model_registry
 
-# Load model and explainer
-clf = joblib.load("models/isoforest.pkl")
-explainer = shap.TreeExplainer(clf)
+    if model_registry.resolve():
+        clf = model_registry.load()
+        print(f"Loaded registry model {clf.version}")
+    else:
+        clf = joblib.load(MODEL_PATHS[DETECTOR])
+
+    def explain(df):
+        global _explainer
+        if _explainer is None:
+            import shap
+            estimator = clf if hasattr(clf, "estimators_") else model_registry.load_estimator(clf.version)
+            _explainer = shap.TreeExplainer(estimator)
+        return _explainer.shap_values(df)
 
 # Get the exact feature names the model was trained on
 feature_cols = list(clf.feature_names_in_)
 
+# Early-exit cascade in front of the forest (None: not fitted for this model, or CASCADE=off)
+cascade = CascadeDetector.load(clf, threshold=ANOMALY_THRESH) if DETECTOR == "isoforest" else None
+scorer = cascade or clf
+if cascade is not None:
+    print(f"Scoring through the detection cascade ({cascade.screen_trees}-tree screen)")
+
+# Poll plan: every feature must be a point; other points ride along in alerts
+if POINTS_FILE:
+    plan = ReadPlan(load_points(POINTS_FILE, "plc"))
+else:
+    plan = ReadPlan([Point(f, "holding", i) for i, f in enumerate(feature_cols)] + COIL_POINTS)
+try:
+    feature_idx = plan.index(feature_cols)
+except KeyError as e:
+    raise RuntimeError(f"Point list has no point for model feature {e}")
+extra_idx = [i for i in range(len(plan)) if i not in set(feature_idx)]
+print(f"Read plan: {plan.describe()}")
+
+# Alert bus publisher (non-blocking; a missing broker never stalls detection)
+publisher = AlertPublisher()
+
+# Per-alert SHAP vectors, aligned to feature_cols
+try:
+    shap_writer = ShapWriter(feature_cols)
+except ValueError as e:
+    print(f"SHAP store disabled: {e}")
+    shap_writer = None
+
+# Register history for training and dashboards
+history = SeriesWriter(f"{PLC_HOST}:{PLC_PORT}", plan.names)
+
+# Anomalous polls coalesce into incidents; only sampled frames take the alert path
+incidents = IncidentTracker(feature_cols, publisher=publisher)
+
+# Telemetry
+POLLS       = metrics.counter("detect_polls_total", "Register reads attempted")
+POLL_ERRORS = metrics.counter("detect_poll_errors_total", "Register reads that failed or came back short")
+RECONNECTS  = metrics.counter("detect_reconnects_total", "PLC reconnect attempts")
+ALERTS      = metrics.counter("detect_alerts_total", "Anomalies detected")
+SAMPLED     = metrics.counter("detect_alerts_sampled_total", "Anomalous frames logged, explained and published")
+INCIDENTS   = metrics.counter("detect_incidents_total", "Incidents closed and written")
+POLL_RTT    = metrics.histogram("detect_poll_rtt_seconds", "Modbus read round trip")
+SCORE_TIME  = metrics.histogram("detect_score_seconds", "decision_function latency per frame")
+SHAP_TIME   = metrics.histogram("detect_shap_seconds", "SHAP explanation latency per alert")
+metrics.counter("detect_alerts_dropped_total", "Alerts the bus publisher dropped (broker slow or down)") \
+    .set_function(lambda: publisher.dropped)
+metrics.gauge("detect_requests_per_poll", "Modbus requests per poll after range coalescing").set(len(plan.blocks))
+
+# Adaptive poll schedule for the single PLC
+scheduler = DeadlineScheduler()
+scheduler.add("plc", AdaptiveInterval(threshold=ANOMALY_THRESH), cost=len(plan.blocks))
+metrics.gauge("detect_poll_interval_seconds", "Current adaptive poll interval") \
+    .set_function(lambda: scheduler.interval("plc"))
+metrics.counter("detect_throttled_seconds_total", "Time polls waited on the PLC request-rate cap") \
+    .set_function(lambda: scheduler.throttled)
+if cascade is not None:
+    exits = metrics.gauge("detect_cascade_exit_ratio", "Share of scored frames leaving the cascade at each stage",
+                          ["stage"])
+    for stage in STAGES:
+        exits.labels(stage).set_function(lambda stage=stage: cascade.fractions()[stage])
+metrics.serve_from_env(9101)
+tracer = tracing.get_tracer("detect")
+
 # Connect to PLC
-client = ModbusTcpClient(PLC_HOST, port=PLC_PORT)
+if MODBUS_WINDOW > 1:
+    client = PipelinedClient(PLC_HOST, port=PLC_PORT, window=MODBUS_WINDOW)
+else:
+    client = ModbusTcpClient(PLC_HOST, port=PLC_PORT)
 if not client.connect():
     raise RuntimeError(f"Unable to connect to PLC at {PLC_HOST}:{PLC_PORT}")
 
-print("Connected to PLC; starting real-time detection...")
+print(f"Connected to PLC; starting real-time detection ({DETECTOR})...")
+
+def alert(fr, ts, regs, score, df, frames, points=None):
+    """Explain, log, store and publish one alert standing for `frames` anomalous frames; returns its SHAP."""
+    t0 = time.perf_counter()
+    with fr.span("shap"):
+        shap_vals = explain(df)
+    SHAP_TIME.observe(time.perf_counter() - t0)
+    with fr.span("log_write"):
+        with open("logs/alerts/anomaly.log", "a") as f:
+            f.write(f"{ts},{regs},{score},{shap_vals},{frames}\n")
+        if shap_writer is not None:
+            shap_writer.append(ts, score, shap_vals, device=f"{PLC_HOST}:{PLC_PORT}", frames=frames)
+    with fr.span("publish"):
+        publisher.publish(make_alert(ts, regs, score, shap_vals, device=f"{PLC_HOST}:{PLC_PORT}",
+                                     features=feature_cols, points=points, frames=frames))
+    print(f"[ANOMALY] {ts}: regs={regs}, score={score:.4f} ({frames} frames)")
+    return shap_vals
+
+
+def close_incidents(closed, fr=tracing.NULL_SPAN):
+    """Alert the unsampled tails of closed incidents; returns how many incidents closed."""
+    for tail in closed.tails:
+        regs = [int(v) if float(v).is_integer() else float(v) for v in tail.registers]
+        alert(fr, tail.ts, regs, tail.score, pd.DataFrame([regs], columns=feature_cols), tail.frames)
+    return len(closed.incidents)
 
-try:
-    while True:
-        rr = client.read_holding_registers(address=0, count=len(feature_cols), slave=PLC_SLAVE)
-        if rr.isError() or len(rr.registers) != len(feature_cols):
-            # Skip iteration on error or unexpected register count
-            time.sleep(POLL_INTERVAL)
-            continue
 
-        # Build a DataFrame so feature names match exactly
-        df = pd.DataFrame([rr.registers], columns=feature_cols)
-        score = clf.decision_function(df)[0]
+def poll_once(fr):
+    """One read-score-alert cycle; returns (score, feature values), or None if the read failed."""
+    POLLS.inc()
+    t0 = time.perf_counter()
+    try:
+        with fr.span("modbus_read"):
+            values = plan.read(client, PLC_SLAVE)
+    except ModbusException as e:
+        # Connection lost: count it, reconnect and try again next interval
+        POLL_ERRORS.inc()
+        RECONNECTS.inc()
+        print(f"[WARN] PLC read failed ({e}); reconnecting")
+        with fr.span("reconnect"):
+            client.close()
+            client.connect()
+        return None
+    POLL_RTT.observe(time.perf_counter() - t0)
+    features = values[feature_idx]
+    if np.isnan(features).any():
+        # Skip iteration if a block holding a feature came back with an error
+        POLL_ERRORS.inc()
+        return None
+    ts = time.time()
+    history.append(ts, values)
+    regs = [int(v) if float(v).is_integer() else float(v) for v in features]
 
-        if score < ANOMALY_THRESH:
-            shap_vals = explainer.shap_values(df)
-            ts = time.time()
-            with open("logs/alerts/anomaly.log", "a") as f:
-                f.write(f"{ts},{rr.registers},{score},{shap_vals}\n")
-            print(f"[ANOMALY] {ts}: regs={rr.registers}, score={score:.4f}")
+    # Build a DataFrame so feature names match exactly
+    with fr.span("build_frame"):
+        df = pd.DataFrame([regs], columns=feature_cols)
+    t0 = time.perf_counter()
+    with fr.span("score"):
+        score = scorer.decision_function(df)[0]
+    SCORE_TIME.observe(time.perf_counter() - t0)
+    anomalous = score < ANOMALY_THRESH
 
-        time.sleep(POLL_INTERVAL)
+    if anomalous:
+        ALERTS.inc()
+        fr.set(score=float(score), registers=regs)
+        sample = incidents.observe(f"{PLC_HOST}:{PLC_PORT}", ts, score, regs)
+        if sample is not None:
+            SAMPLED.inc()
+            shap_vals = alert(fr, ts, regs, score, df, sample.frames,
+                              points={plan.names[i]: values[i] for i in extra_idx})
+            incidents.explained(sample, shap_vals)
+
+    if DETECTOR == "online":
+        # Learning is suspended while alerts are active so attacks can't
+        # become the new baseline
+        with fr.span("observe"):
+            clf.observe(regs, anomalous)
+    return score, features
+
+try:
+    while True:
+        scheduler.wait()
+        with tracer.frame() as fr:
+            result = poll_once(fr)
+        scheduler.done("plc", *(result or ()))
+        INCIDENTS.inc(close_incidents(incidents.expire(time.time())))
 
 except KeyboardInterrupt:
     print("Detection stopped by user.")
 
 finally:
     client.close()
+    INCIDENTS.inc(close_incidents(incidents.close()))
+    publisher.close()
+    history.close()
+    if shap_writer is not None:
+        shap_writer.close()
     print("PLC connection closed.")
+    if DETECTOR == "online":
+        joblib.dump(clf, MODEL_PATHS["online"])
+        print(f"Online model state saved to {MODEL_PATHS['online']}")
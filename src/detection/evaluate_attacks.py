@@ -3,8 +3,14 @@
 import pandas as pd
 import joblib
 
-# 1. Load the trained model
-clf = joblib.load("models/isoforest.pkl")
+from src.detection import model_registry
+
+# 1. Load the trained model (latest registry version if there is one)
+if model_registry.resolve():
+    clf = model_registry.load()
+    print(f"Using registry model {clf.version}")
+else:
+    clf = joblib.load("models/isoforest.pkl")
 
 # 2. Get the feature names the model expects
 #    (requires scikit-learn ≥1.0)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""
+model_registry.py
+
+Local, content-addressed store for trained IsolationForest models.
+
+Each version lives in models/registry/<version>/ and holds:
+  meta.json        features, training data hash, metrics, timestamp
+  *.npy            the forest flattened into plain numeric node arrays
+  estimator.joblib the original scikit-learn object (needed by SHAP)
+
+The node arrays are loaded with np.load(mmap_mode='r'), so every detector
+process on a host shares one page-cached copy and starts without unpickling
+the forest.
+
+    python -m src.detection.model_registry list
+    python -m src.detection.model_registry import models/isoforest.pkl --data data/raw/baseline.csv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+REGISTRY_DIR = os.path.join("models", "registry")
+LATEST_FILE  = "LATEST"
+ARRAYS       = ("left", "right", "feature", "threshold", "leaf_depth", "roots")
+
+
+def _average_path_length(n):
+    """Expected path length of an unsuccessful BST search over n samples."""
+    n = np.asarray(n, dtype=float)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+def flatten_forest(model):
+    """
+    Concatenate every tree of a fitted IsolationForest into flat node arrays.
+    Leaves point to themselves so traversal can run a fixed number of steps,
+    and feature ids are mapped back to the model's column order.
+    """
+    lefts, rights, feats, thrs, depths, roots = [], [], [], [], [], []
+    offset = 0
+    for est, est_feats in zip(model.estimators_, model.estimators_features_):
+        tree = est.tree_
+        n = tree.node_count
+        idx = np.arange(n)
+        is_leaf = tree.children_left == -1
+
+        depth = np.zeros(n)
+        for node in range(n):  # children always follow their parent
+            if not is_leaf[node]:
+                depth[tree.children_left[node]] = depth[node] + 1
+                depth[tree.children_right[node]] = depth[node] + 1
+
+        lefts.append(np.where(is_leaf, idx, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, idx, tree.children_right) + offset)
+        feats.append(np.where(is_leaf, 0, np.asarray(est_feats)[np.maximum(tree.feature, 0)]))
+        thrs.append(np.where(is_leaf, np.inf, tree.threshold))
+        depths.append(np.where(is_leaf, depth + _average_path_length(tree.n_node_samples), 0.0))
+        roots.append(offset)
+        offset += n
+
+    return {
+        "left":       np.concatenate(lefts).astype(np.int32),
+        "right":      np.concatenate(rights).astype(np.int32),
+        "feature":    np.concatenate(feats).astype(np.int32),
+        "threshold":  np.concatenate(thrs).astype(np.float64),
+        "leaf_depth": np.concatenate(depths).astype(np.float64),
+        "roots":      np.asarray(roots, dtype=np.int32),
+    }
+
+
+class FlatIsolationForest:
+    """Read-only IsolationForest scorer over (memory-mapped) flat node arrays."""
+
+    def __init__(self, arrays, meta):
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.leaf_depth = arrays["leaf_depth"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(meta["max_depth"])
+        self.offset_ = float(meta["offset"])
+        self.feature_names_in_ = np.asarray(meta["features"], dtype=object)
+        self.version = meta["version"]
+        self._norm = len(self.roots) * float(_average_path_length([meta["max_samples"]])[0])
+
+    def score_samples(self, X):
+        if isinstance(X, pd.DataFrame):
+            X = X[list(self.feature_names_in_)].to_numpy()
+        # scikit-learn compares in float32; do the same so verdicts match exactly
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32)).astype(np.float64)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        depth = self.leaf_depth[node].sum(axis=1)
+        return -np.power(2.0, -depth / self._norm)
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def register(model, data_path=None, metrics=None, root=REGISTRY_DIR):
+    """Store a fitted model and make it the latest version. Returns the version id."""
+    arrays = flatten_forest(model)
+    features = [str(c) for c in model.feature_names_in_]
+
+    h = hashlib.sha256()
+    for name in ARRAYS:
+        h.update(arrays[name].tobytes())
+    h.update(json.dumps([features, float(model.offset_)]).encode())
+    version = h.hexdigest()[:12]
+
+    vdir = os.path.join(root, version)
+    if not os.path.isdir(vdir):
+        tmp = f"{vdir}.tmp{os.getpid()}"
+        os.makedirs(tmp)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp, f"{name}.npy"), arrays[name])
+        joblib.dump(model, os.path.join(tmp, "estimator.joblib"))
+        meta = {
+            "version":       version,
+            "features":      features,
+            "created":       time.time(),
+            "data_path":     data_path,
+            "data_sha256":   _file_sha256(data_path) if data_path else None,
+            "metrics":       metrics or {},
+            "n_estimators":  len(model.estimators_),
+            "max_samples":   int(model.max_samples_),
+            "max_depth":     max(est.tree_.max_depth for est in model.estimators_),
+            "offset":        float(model.offset_),
+        }
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, vdir)
+
+    with open(os.path.join(root, LATEST_FILE), "w") as f:
+        f.write(version)
+    return version
+
+
+def resolve(version=None, root=REGISTRY_DIR):
+    """Return the requested version id, or the latest one (None if empty)."""
+    if version:
+        return version
+    try:
+        with open(os.path.join(root, LATEST_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_meta(version=None, root=REGISTRY_DIR):
+    with open(os.path.join(root, resolve(version, root), "meta.json")) as f:
+        return json.load(f)
+
+
+def list_versions(root=REGISTRY_DIR):
+    if not os.path.isdir(root):
+        return []
+    metas = []
+    for name in os.listdir(root):
+        if os.path.isfile(os.path.join(root, name, "meta.json")):
+            metas.append(read_meta(name, root))
+    return sorted(metas, key=lambda m: m["created"])
+
+
+def load(version=None, root=REGISTRY_DIR, mmap=True):
+    """Open a version as a FlatIsolationForest backed by memory-mapped arrays."""
+    meta = read_meta(version, root)
+    vdir = os.path.join(root, meta["version"])
+    mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(vdir, f"{name}.npy"), mmap_mode=mode) for name in ARRAYS}
+    return FlatIsolationForest(arrays, meta)
+
+
+def load_estimator(version=None, root=REGISTRY_DIR):
+    """Unpickle the original scikit-learn model (slow; only for SHAP/retraining)."""
+    return joblib.load(os.path.join(root, resolve(version, root), "estimator.joblib"))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Inspect and populate the local model registry")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="List registered versions")
+    imp = sub.add_parser("import", help="Register an existing joblib model")
+    imp.add_argument("path")
+    imp.add_argument("--data", help="CSV the model was trained on (hashed into metadata)")
+    args = p.parse_args()
+
+    if args.cmd == "list":
+        latest = resolve()
+        for meta in list_versions():
+            mark = "*" if meta["version"] == latest else " "
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meta["created"]))
+            print(f"{mark} {meta['version']}  {created}  features={meta['features']}  metrics={meta['metrics']}")
+    else:
+        version = register(joblib.load(args.path), data_path=args.data)
+        print(f"Registered {args.path} as {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+online_model.py
+
+Streaming anomaly detector that follows slow process drift (seasonal temperature,
+shift changes) without batch retraining. Each feature keeps an ensemble of
+exponentially weighted robust location/scale estimates at several time constants;
+a frame is scored by how many robust standard deviations it sits from them.
+
+Updates are O(members x features) per sample with fixed memory, and the scoring
+interface mirrors the pickled IsolationForest (decision_function < 0 => anomaly),
+so detect.py can swap one for the other.
+
+    python -m src.detection.online_model      # warm-start on baseline.csv
+"""
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Smoothing factors of the ensemble members: slow members remember hours of
+# baseline, fast members track shift-level changes.
+DEFAULT_ALPHAS = (0.001, 0.01, 0.05)
+Z_LIMIT        = 6.0    # mean robust z above this => anomaly
+CLIP           = 3.0    # residuals are winsorised at CLIP*scale before updating
+HOLDOFF        = 50     # normal frames required before learning resumes
+MIN_SCALE      = 1e-3
+
+# Mean absolute deviation -> standard deviation for Gaussian data
+MAD_TO_STD = np.sqrt(np.pi / 2)
+
+
+class EWMAEnsembleDetector:
+    """Robust EWMA z-score ensemble with freezable updates."""
+
+    def __init__(self, alphas=DEFAULT_ALPHAS, z_limit=Z_LIMIT, clip=CLIP, holdoff=HOLDOFF):
+        self.alphas = np.asarray(alphas, dtype=float)[:, None]
+        self.z_limit = float(z_limit)
+        self.clip = float(clip)
+        self.holdoff = int(holdoff)
+        # decision_function = score_samples - offset_, as for IsolationForest
+        self.offset_ = -self.z_limit
+        self.frozen = False
+        self.n_seen_ = 0
+        self._calm = 0
+
+    def fit(self, X):
+        """Initialise every ensemble member from a batch of normal data."""
+        X, names = self._as_array(X)
+        if names is not None:
+            self.feature_names_in_ = np.asarray(names, dtype=object)
+        center = np.median(X, axis=0)
+        scale = np.median(np.abs(X - center), axis=0) * 1.4826
+        scale = np.maximum(scale, MIN_SCALE)
+        k = len(self.alphas)
+        self.center_ = np.tile(center, (k, 1))
+        self.scale_ = np.tile(scale, (k, 1))
+        self.n_seen_ = len(X)
+        return self
+
+    def learn_one(self, x):
+        """Fold a single sample into the running estimates (no-op while frozen)."""
+        if self.frozen:
+            return
+        x = np.asarray(x, dtype=float)
+        limit = self.clip * self.scale_
+        resid = np.clip(x - self.center_, -limit, limit)
+        self.center_ += self.alphas * resid
+        self.scale_ += self.alphas * (np.abs(resid) * MAD_TO_STD - self.scale_)
+        np.maximum(self.scale_, MIN_SCALE, out=self.scale_)
+        self.n_seen_ += 1
+
+    def partial_fit(self, X):
+        X, _ = self._as_array(X)
+        for row in X:
+            self.learn_one(row)
+        return self
+
+    def observe(self, x, anomalous):
+        """
+        Learn from a scored sample unless an alert is active. Any anomalous frame
+        freezes the baseline; learning resumes after `holdoff` consecutive normal
+        frames so an attack cannot drag the estimates towards itself.
+        """
+        if anomalous:
+            self.frozen = True
+            self._calm = 0
+            return
+        if self.frozen:
+            self._calm += 1
+            if self._calm < self.holdoff:
+                return
+            self.frozen = False
+        self.learn_one(x)
+
+    def freeze(self):
+        self.frozen = True
+        self._calm = 0
+
+    def unfreeze(self):
+        self.frozen = False
+
+    def _z(self, X):
+        X, _ = self._as_array(X)
+        # (n_samples, n_members, n_features)
+        return np.abs(X[:, None, :] - self.center_) / self.scale_
+
+    def score_samples(self, X):
+        """Opposite of the ensemble-mean of the worst per-feature robust z-score."""
+        return -self._z(X).max(axis=2).mean(axis=1)
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    def explain(self, X):
+        """Per-feature attributions (negative pushes towards anomaly), SHAP-shaped."""
+        return -self._z(X).mean(axis=1)
+
+    def _as_array(self, X):
+        if isinstance(X, pd.DataFrame):
+            return X.to_numpy(dtype=float), list(X.columns)
+        X = np.asarray(X, dtype=float)
+        return (X[None, :] if X.ndim == 1 else X), None
+
+
+if __name__ == "__main__":
+    df_full = pd.read_csv("data/raw/baseline.csv")
+    numeric_cols = df_full.select_dtypes(include=['number']).columns.tolist()
+    print(f"Warm-starting online detector on {numeric_cols} ({len(df_full)} samples)")
+
+    model = EWMAEnsembleDetector().fit(df_full[numeric_cols])
+    joblib.dump(model, "models/online.pkl")
+    print("Model saved to models/online.pkl")
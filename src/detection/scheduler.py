@@ -0,0 +1,140 @@
+"""
+scheduler.py
+
+Deadline-based, adaptive poll scheduling for the detectors.
+
+Each device has its own interval. It drops straight to MIN_INTERVAL when the
+last score came within SCORE_MARGIN of the anomaly threshold (or crossed it)
+or a value moved by more than CHANGE_RATIO, and otherwise grows by BACKOFF
+per quiet poll up to MAX_INTERVAL, so a steady process is polled gently and
+an attack is sampled at the full rate from its first suspicious frame.
+
+Polls are due at absolute deadlines (previous deadline + interval), so work
+time does not stretch the period; a poll that is late by more than one
+interval is re-anchored to now instead of bursting to catch up. A token
+bucket caps the aggregate request rate to the PLCs at MAX_REQUEST_RATE (each
+poll costs its number of Modbus requests); when the cap binds, polls wait.
+"""
+
+import heapq
+import os
+import time
+
+MIN_INTERVAL     = float(os.getenv("POLL_INTERVAL", 0.1))      # fastest per-device period (s)
+MAX_INTERVAL     = float(os.getenv("POLL_MAX_INTERVAL", 1.0))  # slowest period when quiet (s)
+MAX_REQUEST_RATE = float(os.getenv("PLC_MAX_RATE", 50))        # Modbus requests/s over all devices
+BACKOFF          = 1.25   # interval growth per quiet poll
+SCORE_MARGIN     = 0.05   # score - threshold below this counts as "near the threshold"
+CHANGE_RATIO     = 0.05   # relative change of any value that counts as fast movement
+
+
+class AdaptiveInterval:
+    """Poll interval of one device, driven by its scores and value changes."""
+
+    def __init__(self, threshold=0.0, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 backoff=BACKOFF, margin=SCORE_MARGIN, change=CHANGE_RATIO):
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff = backoff
+        self.margin = margin
+        self.change = change
+        self.interval = min_interval
+        self._prev = None
+
+    def update(self, score=None, values=None):
+        """Fold in one poll result (None for a failed poll); returns the next interval."""
+        urgent = False
+        if score is not None and score - self.threshold < self.margin:
+            urgent = True
+        if values is not None:
+            prev, self._prev = self._prev, [float(v) for v in values]
+            if prev is not None and len(prev) == len(self._prev):
+                urgent |= any(abs(v - p) > self.change * max(abs(p), 1.0) for v, p in zip(self._prev, prev))
+        if urgent:
+            self.interval = self.min_interval
+        else:
+            # Quiet (or failing) device: back off gently
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        return self.interval
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`.
+
+    A cost larger than the burst waits for a full bucket and is then charged
+    in full, leaving the bucket in debt, so the long-run rate stays at `rate`.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate / 10))
+        self.tokens = self.burst
+        self.clock = clock
+        self.stamp = clock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, cost=1.0):
+        """Seconds until `cost` tokens (at most a full bucket) are available (0 if now)."""
+        self._refill(self.clock())
+        missing = min(cost, self.burst) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, cost=1.0):
+        self._refill(self.clock())
+        self.tokens -= cost
+
+
+class DeadlineScheduler:
+    """Earliest-deadline-first polling of many devices under one request-rate cap."""
+
+    def __init__(self, max_rate=MAX_REQUEST_RATE, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.bucket = TokenBucket(max_rate, burst, clock) if max_rate and max_rate > 0 else None
+        self.policies = {}
+        self.costs = {}
+        self.deadlines = {}
+        self._heap = []
+        self.late_polls = 0     # polls re-anchored because they fell more than an interval behind
+        self.throttled = 0.0    # seconds spent waiting on the rate cap
+
+    def add(self, key, policy=None, cost=1, start=None):
+        """Schedule device `key`; `cost` is the number of requests one poll makes."""
+        self.policies[key] = policy or AdaptiveInterval()
+        self.costs[key] = cost
+        due = self.clock() if start is None else start
+        self.deadlines[key] = due
+        heapq.heappush(self._heap, (due, key))
+
+    def interval(self, key):
+        return self.policies[key].interval
+
+    def wait(self):
+        """Block until the next device is due and the rate cap allows it; returns its key."""
+        due, key = heapq.heappop(self._heap)
+        now = self.clock()
+        if due > now:
+            self.sleep(due - now)
+        if self.bucket is not None:
+            delay = self.bucket.delay(self.costs[key])
+            if delay > 0:
+                self.throttled += delay
+                self.sleep(delay)
+            self.bucket.take(self.costs[key])
+        return key
+
+    def done(self, key, score=None, values=None):
+        """Report the poll of `key` and schedule its next deadline."""
+        interval = self.policies[key].update(score, values)
+        due = self.deadlines[key] + interval
+        now = self.clock()
+        if due < now - interval:
+            self.late_polls += 1
+            due = now
+        self.deadlines[key] = due
+        heapq.heappush(self._heap, (due, key))
+        return due
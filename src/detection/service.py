@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+"""
+service.py
+
+Multi-process detection service: one poller process ingests register frames
+from every PLC and N scoring workers run the model. Frames travel through
+per-worker shared-memory ring buffers (no pickling), and each device is pinned
+to one worker by a stable hash so its frames stay in order.
+
+    python -m src.detection.service --workers 4
+    python -m src.detection.service --workers 4 --replay data/raw/fuzz_modbus.csv --devices 64
+
+DEVICES lists the PLCs as "name=host:port:slave,..." (defaults to PLC_HOST/PLC_PORT/PLC_SLAVE).
+Each device is polled through a read plan (src/modbus/read_planner.py): the model
+features at holding registers 0..n-1, or that device's list in POINTS_FILE.
+The supervisor serves per-worker throughput, alerts, ring depth and dropped
+frames in Prometheus format on METRICS_PORT (default 9105).
+
+The poller schedules each device on its own adaptive deadline
+(src/detection/scheduler.py): workers feed the lowest score of each device
+back through shared memory, and a device is polled at the full POLL_INTERVAL
+rate while its scores sit near the threshold or its values move quickly,
+backing off towards POLL_MAX_INTERVAL otherwise. PLC_MAX_RATE caps the
+Modbus requests per second across all devices, and MODBUS_WINDOW > 1
+pipelines each poll's blocks on one connection (src/modbus/pipeline.py).
+Polled values are appended to the register history (src/storage/tsdb.py),
+one series per device name. Each worker coalesces its devices' anomalous
+frames into incidents (src/detection/incidents.py) and explains, logs and
+publishes only the sampled ones. Workers score through the early-exit
+cascade (src/detection/cascade.py) when one is fitted for the model.
+"""
+
+import argparse
+import os
+import signal
+import time
+import zlib
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+POLL_INTERVAL  = float(os.getenv("POLL_INTERVAL", 0.1))
+ANOMALY_THRESH = float(os.getenv("ANOMALY_THRESHOLD", 0))
+LOG_PATH       = os.getenv("LOG_PATH", "logs/alerts/anomaly.log")
+POINTS_FILE    = os.getenv("POINTS_FILE")
+MODBUS_WINDOW  = int(os.getenv("MODBUS_WINDOW", 0))
+RING_CAPACITY  = 4096   # frames per worker
+BATCH_SIZE     = 256    # frames scored per decision_function call
+IDLE_SLEEP     = 0.0005 # worker back-off when its ring is empty
+STATS_INTERVAL = 5.0
+METRICS_PORT   = 9105
+
+
+class FrameRing:
+    """
+    Single-producer/single-consumer ring of fixed-width float64 frames in shared
+    memory. Layout: [head, tail, dropped] uint64 counters followed by
+    `capacity` slots of (device, timestamp, values...). The producer only moves
+    head and the consumer only moves tail, so no lock is needed.
+    """
+
+    HEADER = 3
+
+    def __init__(self, n_values, capacity=RING_CAPACITY, name=None):
+        self.n_values = n_values
+        self.capacity = capacity
+        width = 2 + n_values
+        size = self.HEADER * 8 + capacity * width * 8
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.counters = np.ndarray((self.HEADER,), dtype=np.uint64, buffer=self.shm.buf)
+        self.slots = np.ndarray((capacity, width), dtype=np.float64,
+                                buffer=self.shm.buf, offset=self.HEADER * 8)
+        if name is None:
+            self.counters[:] = 0
+
+    @property
+    def spec(self):
+        """Arguments needed to attach to this ring from another process."""
+        return (self.n_values, self.capacity, self.shm.name)
+
+    @classmethod
+    def attach(cls, spec):
+        n_values, capacity, name = spec
+        return cls(n_values, capacity, name)
+
+    def push(self, device, ts, values):
+        head, tail = int(self.counters[0]), int(self.counters[1])
+        if head - tail >= self.capacity:
+            self.counters[2] += 1
+            return False
+        slot = self.slots[head % self.capacity]
+        slot[0] = device
+        slot[1] = ts
+        slot[2:] = values
+        self.counters[0] = head + 1  # publish only after the slot is written
+        return True
+
+    def pop_batch(self, max_frames=BATCH_SIZE):
+        head, tail = int(self.counters[0]), int(self.counters[1])
+        n = min(head - tail, max_frames)
+        if n <= 0:
+            return None
+        idx = (tail + np.arange(n)) % self.capacity
+        frames = self.slots[idx]  # fancy indexing copies out of the ring
+        self.counters[1] = tail + n
+        return frames
+
+    def depth(self):
+        return int(self.counters[0]) - int(self.counters[1])
+
+    def dropped(self):
+        return int(self.counters[2])
+
+    def close(self, unlink=False):
+        # Drop the numpy views first or SharedMemory.close() refuses to unmap
+        del self.counters, self.slots
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def parse_devices(spec):
+    """'plc1=10.0.0.5:502:1,plc2=10.0.0.6:502:1' -> [(name, host, port, slave), ...]"""
+    devices = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, addr = item.split("=", 1)
+        host, port, slave = (addr.split(":") + ["502", "1"])[:3]
+        devices.append((name, host, int(port), int(slave)))
+    return devices
+
+
+def shard_of(device_name, n_workers):
+    # crc32 rather than hash(): it must agree across processes
+    return zlib.crc32(device_name.encode()) % n_workers
+
+
+def _child_init():
+    # Ctrl+C goes to the whole process group; let the supervisor shut us down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def load_model():
+    from src.detection import model_registry
+
+    if model_registry.resolve():
+        return model_registry.load()
+    import joblib
+    return joblib.load("models/isoforest.pkl")
+
+
+def device_plan(name, features):
+    """Read plan for one device and the positions of the model features in its values."""
+    from src.modbus.read_planner import Point, ReadPlan, load_points
+
+    if POINTS_FILE:
+        plan = ReadPlan(load_points(POINTS_FILE, name))
+    else:
+        plan = ReadPlan([Point(f, "holding", i) for i, f in enumerate(features)])
+    return plan, np.array(plan.index(features))
+
+
+def poller(devices, ring_specs, features, device_scores, stop):
+    """Ingest process: poll each device on its adaptive deadline and route frames to workers."""
+    _child_init()
+    from pymodbus.client import ModbusTcpClient
+    from pymodbus.exceptions import ModbusException
+    from src.detection.scheduler import AdaptiveInterval, DeadlineScheduler
+    from src.modbus.pipeline import PipelinedClient
+    from src.storage.tsdb import SeriesWriter
+
+    rings = [FrameRing.attach(spec) for spec in ring_specs]
+    clients = []
+    scheduler = DeadlineScheduler()
+    history = {}
+    for idx, (name, host, port, slave) in enumerate(devices):
+        if MODBUS_WINDOW > 1:
+            client = PipelinedClient(host, port=port, window=MODBUS_WINDOW)
+        else:
+            client = ModbusTcpClient(host, port=port)
+        if not client.connect():
+            print(f"[WARN] Unable to connect to {name} at {host}:{port}")
+        plan, feature_idx = device_plan(name, features)
+        history[idx] = SeriesWriter(name, plan.names)
+        clients.append((idx, name, slave, client, plan, feature_idx, rings[shard_of(name, len(rings))]))
+        scheduler.add(idx, AdaptiveInterval(threshold=ANOMALY_THRESH, min_interval=POLL_INTERVAL),
+                      cost=len(plan.blocks))
+
+    try:
+        while not stop.is_set():
+            idx, name, slave, client, plan, feature_idx, ring = clients[scheduler.wait()]
+            try:
+                points = plan.read(client, slave)
+            except ModbusException:
+                # the client reconnects on the next request
+                scheduler.done(idx)
+                continue
+            values = points[feature_idx]
+            if np.isnan(values).any():
+                scheduler.done(idx)
+                continue
+            ts = time.time()
+            ring.push(idx, ts, values)
+            history[idx].append(ts, points)
+            scheduler.done(idx, device_scores[idx], values)
+    finally:
+        for _, _, _, client, *_ in clients:
+            client.close()
+        for writer in history.values():
+            writer.close()
+        for ring in rings:
+            ring.close()
+
+
+def replay_poller(path, n_devices, ring_specs, n_values, stop):
+    """Ingest process that replays a CSV as fast as the workers accept it (for load tests)."""
+    _child_init()
+    rows = pd.read_csv(path).select_dtypes(include=['number']).to_numpy()[:, :n_values]
+    rings = [FrameRing.attach(spec) for spec in ring_specs]
+    routes = [rings[shard_of(f"replay{d}", len(rings))] for d in range(n_devices)]
+    i = 0
+    try:
+        while not stop.is_set():
+            dev = i % n_devices
+            ring = routes[dev]
+            if ring.depth() >= ring.capacity:
+                # Apply backpressure instead of counting replayed frames as dropped
+                time.sleep(IDLE_SLEEP)
+                continue
+            ring.push(dev, time.time(), rows[i % len(rows)])
+            i += 1
+    finally:
+        for ring in rings:
+            ring.close()
+
+
+def worker(wid, ring_spec, device_names, stats, exits, device_scores, stop):
+    """Scoring process: drain the ring in batches, score, log and publish anomalies."""
+    _child_init()
+    from src.alerts.bus import AlertPublisher, make_alert
+    from src.detection.cascade import CascadeDetector
+    from src.detection.incidents import IncidentTracker
+    from src.detection.shap_store import ShapWriter
+    from src.telemetry import tracing
+
+    publisher = AlertPublisher()
+    clf = load_model()
+    feature_cols = list(clf.feature_names_in_)
+    cascade = CascadeDetector.load(clf, threshold=ANOMALY_THRESH)
+    scorer = cascade or clf
+    try:
+        shap_writer = ShapWriter(feature_cols)
+    except ValueError as e:
+        print(f"[worker {wid}] SHAP store disabled: {e}")
+        shap_writer = None
+    explainer = None
+    incidents = IncidentTracker(feature_cols, publisher=publisher)
+    tracer = tracing.get_tracer(f"service-w{wid}")
+    ring = FrameRing.attach(ring_spec)
+    last_score = np.frombuffer(device_scores, dtype=np.float64)
+
+    def alert(fr, ts, scores, X, devices, counts):
+        """Explain, log, store and publish one alert per row of X; returns their SHAP rows."""
+        nonlocal explainer
+        with fr.span("shap"):
+            if explainer is None:
+                import shap
+                from src.detection import model_registry
+                estimator = clf if hasattr(clf, "estimators_") else model_registry.load_estimator(clf.version)
+                explainer = shap.TreeExplainer(estimator)
+            shap_vals = explainer.shap_values(X)
+        with fr.span("format_publish"):
+            lines = []
+            for j, row in enumerate(X.to_numpy()):
+                regs = [int(v) if float(v).is_integer() else float(v) for v in row]
+                lines.append(f"{ts[j]},{regs},{scores[j]},{shap_vals[j:j + 1]},{counts[j]}\n")
+                publisher.publish(make_alert(ts[j], regs, scores[j], shap_vals[j:j + 1], device=devices[j],
+                                             features=feature_cols, frames=counts[j]))
+        with fr.span("log_write"):
+            with open(LOG_PATH, "a") as f:
+                f.write("".join(lines))
+            if shap_writer is not None:
+                shap_writer.append_many(ts, scores, shap_vals, devices, counts)
+        return shap_vals
+
+    def close_incidents(closed, fr=tracing.NULL_SPAN):
+        # Unsampled tails of closed incidents are alerted like samples
+        tails = closed.tails
+        if tails:
+            alert(fr, [t.ts for t in tails], [t.score for t in tails],
+                  pd.DataFrame([t.registers for t in tails], columns=feature_cols),
+                  [t.incident.device for t in tails], [t.frames for t in tails])
+
+    try:
+        while not stop.is_set():
+            frames = ring.pop_batch()
+            if frames is None:
+                close_incidents(incidents.expire(time.time()))
+                time.sleep(IDLE_SLEEP)
+                continue
+            with tracer.frame() as fr:
+                fr.set(frames=len(frames))
+                with fr.span("build_frame"):
+                    X = pd.DataFrame(frames[:, 2:], columns=feature_cols)
+                with fr.span("score"):
+                    scores = scorer.decision_function(X)
+                if cascade is not None:
+                    exits[wid * 3:wid * 3 + 3] = cascade.exits.tolist()
+                # Lowest score per device in the batch steers the poller's
+                # schedule; reduced aside so the poller never sees a partial
+                # value, and devices not in the batch keep their last score
+                devs, inv = np.unique(frames[:, 0].astype(np.intp), return_inverse=True)
+                low = np.full(len(devs), np.inf)
+                np.minimum.at(low, inv, scores)
+                last_score[devs] = low
+                hits = np.flatnonzero(scores < ANOMALY_THRESH)
+                sampled = []
+                if len(hits):
+                    # Coalesce into incidents: only sampled frames are explained, logged and published
+                    for i in hits:
+                        sample = incidents.observe(device_names[int(frames[i, 0])], frames[i, 1], scores[i],
+                                                   frames[i, 2:])
+                        if sample is not None:
+                            sampled.append((i, sample))
+                    stats[wid * 3 + 1] += len(hits)
+                if sampled:
+                    picked = np.array([i for i, _ in sampled])
+                    shap_vals = alert(fr, frames[picked, 1], scores[picked], X.iloc[picked],
+                                      [device_names[int(d)] for d in frames[picked, 0]],
+                                      [sample.frames for _, sample in sampled])
+                    # Measured once the alerts are explained, published and logged
+                    stats[wid * 3 + 2] = time.time() - frames[picked[-1], 1]
+                    for j, (_, sample) in enumerate(sampled):
+                        incidents.explained(sample, shap_vals[j])
+                close_incidents(incidents.expire(time.time()), fr)
+            stats[wid * 3] += len(frames)
+    finally:
+        close_incidents(incidents.close())
+        publisher.close()
+        if shap_writer is not None:
+            shap_writer.close()
+        ring.close()
+        tracing.flush()
+
+
+def register_metrics(rings, stats, exits):
+    """Scrape-time views of the shared stats array and rings (workers are other processes)."""
+    from src.detection.cascade import STAGES
+    from src.telemetry import metrics
+
+    frames = metrics.counter("service_frames_total", "Frames scored", ["worker"])
+    alerts = metrics.counter("service_alerts_total", "Anomalies detected", ["worker"])
+    latency = metrics.gauge("service_alert_latency_seconds", "Frame timestamp to logged alert, last alert",
+                            ["worker"])
+    depth = metrics.gauge("service_ring_depth", "Frames queued for the worker", ["worker"])
+    dropped = metrics.counter("service_frames_dropped_total", "Frames dropped because the ring was full",
+                              ["worker"])
+    cascade = metrics.counter("service_cascade_exits_total", "Frames leaving the detection cascade per stage",
+                              ["worker", "stage"])
+    for w, ring in enumerate(rings):
+        frames.labels(w).set_function(lambda w=w: stats[w * 3])
+        alerts.labels(w).set_function(lambda w=w: stats[w * 3 + 1])
+        latency.labels(w).set_function(lambda w=w: stats[w * 3 + 2])
+        depth.labels(w).set_function(ring.depth)
+        dropped.labels(w).set_function(ring.dropped)
+        for i, stage in enumerate(STAGES):
+            cascade.labels(w, stage).set_function(lambda w=w, i=i: exits[w * 3 + i])
+    metrics.serve_from_env(METRICS_PORT)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Sharded multi-process anomaly detection service")
+    p.add_argument("-w", "--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    p.add_argument("--replay", help="Replay a CSV instead of polling PLCs (load testing)")
+    p.add_argument("--devices", type=int, default=16, help="Virtual devices when replaying")
+    args = p.parse_args()
+
+    features = list(load_model().feature_names_in_)
+    n_values = len(features)
+    if args.replay:
+        device_names = [f"replay{d}" for d in range(args.devices)]
+    else:
+        default = f"plc={os.getenv('PLC_HOST', '127.0.0.1')}:{os.getenv('PLC_PORT', 502)}:{os.getenv('PLC_SLAVE', 1)}"
+        devices = parse_devices(os.getenv("DEVICES", default))
+        device_names = [d[0] for d in devices]
+
+    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    rings = [FrameRing(n_values) for _ in range(args.workers)]
+    # processed frames, alerts, last alert latency per worker
+    stats = mp.Array('d', args.workers * 3, lock=False)
+    # frames leaving the cascade at the range, screen and full stage per worker
+    exits = mp.Array('d', args.workers * 3, lock=False)
+    # latest (lowest in batch) score per device, written by workers for the poller
+    device_scores = mp.Array('d', [np.inf] * len(device_names), lock=False)
+    stop = mp.Event()
+
+    procs = [mp.Process(target=worker, args=(w, rings[w].spec, device_names, stats, exits, device_scores, stop), daemon=True)
+             for w in range(args.workers)]
+    if args.replay:
+        ingest = (replay_poller, (args.replay, args.devices, [r.spec for r in rings], n_values, stop))
+    else:
+        ingest = (poller, (devices, [r.spec for r in rings], features, device_scores, stop))
+    procs.append(mp.Process(target=ingest[0], args=ingest[1], daemon=True))
+    for proc in procs:
+        proc.start()
+
+    register_metrics(rings, stats, exits)
+    print(f"Detection service running: {len(device_names)} devices, {args.workers} workers")
+    prev = [0.0] * args.workers
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            parts = []
+            for w, ring in enumerate(rings):
+                done = stats[w * 3]
+                rate = (done - prev[w]) / STATS_INTERVAL
+                prev[w] = done
+                parts.append(f"w{w}: depth={ring.depth()} dropped={ring.dropped()} "
+                             f"{rate:,.0f} fr/s alerts={stats[w * 3 + 1]:.0f} "
+                             f"lat={stats[w * 3 + 2] * 1000:.1f}ms")
+            print("[STATS] " + " | ".join(parts))
+    except KeyboardInterrupt:
+        print("Detection service stopped by user.")
+    finally:
+        stop.set()
+        for proc in procs:
+            proc.join(timeout=2)
+        for ring in rings:
+            ring.close(unlink=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+"""
+shap_store.py
+
+Numeric store for per-alert SHAP vectors. Detectors append one fixed-size
+binary record per alert (timestamp, score, frames, device, float32 SHAP row
+aligned to the model's feature names in meta.json) to
+logs/alerts/shap/records.bin with O_APPEND, so any number of detector
+processes can write without coordination. `frames` is how many anomalous
+frames the (sampled) alert stands for; stores created before it was recorded
+have no such field and count one frame per record.
+
+Readers fold new records into running aggregates: mean |SHAP| per feature
+overall, per device and per BUCKET_SECONDS time bucket. Incidents are not
+regrouped here; the detectors record them, with a representative SHAP vector,
+in incidents.jsonl (src/detection/incidents.py). The aggregates are
+persisted with a row watermark in aggregates.json, so a dashboard restart only
+folds the records appended since. No SHAP text is parsed on the read path.
+
+    python -m src.detection.shap_store backfill     # import SHAP text from anomaly.log
+    python -m src.detection.shap_store summary
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+SHAP_STORE     = os.getenv("SHAP_STORE", "logs/alerts/shap")
+BUCKET_SECONDS = 60      # time bucket for attribution over time
+FOLD_CHUNK     = 100_000 # records read per fold step
+SAVE_INTERVAL  = 10.0    # seconds between aggregate snapshots
+DEVICE_BYTES   = 32
+
+
+def record_dtype(n_features, frames=True):
+    fields = [("ts", "<f8"), ("score", "<f4")]
+    if frames:
+        fields.append(("frames", "<u4"))
+    fields += [("device", f"S{DEVICE_BYTES}"), ("shap", "<f4", (n_features,))]
+    return np.dtype(fields)
+
+
+def _meta_dtype(meta):
+    return record_dtype(len(meta["features"]), meta.get("frames", False))
+
+
+def record_frames(recs):
+    """Anomalous frames each record stands for (1 per record in older stores)."""
+    if "frames" in recs.dtype.names:
+        return recs["frames"].astype(np.int64)
+    return np.ones(len(recs), dtype=np.int64)
+
+
+def _paths(root):
+    return (os.path.join(root, "meta.json"),
+            os.path.join(root, "records.bin"),
+            os.path.join(root, "aggregates.json"))
+
+
+def read_meta(root=SHAP_STORE):
+    try:
+        with open(_paths(root)[0]) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _ensure_meta(root, features):
+    """Create meta.json for `features`, or check an existing store uses the same ones."""
+    meta_path = _paths(root)[0]
+    meta = read_meta(root)
+    if meta is None:
+        os.makedirs(root, exist_ok=True)
+        tmp = f"{meta_path}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump({"features": features, "frames": True, "created": time.time()}, f)
+        try:
+            os.link(tmp, meta_path)  # atomic; loses cleanly to a concurrent creator
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+        meta = read_meta(root)
+    if meta["features"] != features:
+        raise ValueError(f"SHAP store {root} holds features {meta['features']}, not {features}; "
+                         f"point SHAP_STORE at a new directory for this model")
+    return meta
+
+
+class ShapWriter:
+    """Append SHAP rows for alerts; one os.write per batch keeps records whole."""
+
+    def __init__(self, features, root=SHAP_STORE):
+        self.features = [str(f) for f in features]
+        self.dtype = _meta_dtype(_ensure_meta(root, self.features))
+        self.fd = os.open(_paths(root)[1], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, ts, score, shap_row, device="plc", frames=1):
+        self.append_many([ts], [score], [np.asarray(shap_row, dtype=float).reshape(-1)], [device], [frames])
+
+    def append_many(self, ts, scores, shap_rows, devices, frames=None):
+        rec = np.zeros(len(ts), dtype=self.dtype)
+        rec["ts"] = ts
+        rec["score"] = scores
+        if "frames" in self.dtype.names:
+            rec["frames"] = 1 if frames is None else frames
+        rec["device"] = [str(d).encode()[:DEVICE_BYTES] for d in devices]
+        rec["shap"] = np.asarray(shap_rows, dtype=np.float32).reshape(len(ts), len(self.features))
+        os.write(self.fd, rec.tobytes())
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ShapAggregates:
+    """Running sums of |SHAP| and SHAP, overall and by device and time bucket."""
+
+    def __init__(self, features):
+        self.features = list(features)
+        k = len(self.features)
+        self.rows = 0
+        self.count = 0
+        self.sum_abs = np.zeros(k)
+        self.sum = np.zeros(k)
+        self.devices = {}    # device -> [count, sum_abs, sum]
+        self.buckets = {}    # bucket start -> [count, sum_abs]
+
+    def fold(self, recs):
+        """Add a batch of records (record_dtype) in file order."""
+        if not len(recs):
+            return self
+        shap = recs["shap"].astype(float)
+        absv = np.abs(shap)
+        self.rows += len(recs)
+        self.count += len(recs)
+        self.sum_abs += absv.sum(axis=0)
+        self.sum += shap.sum(axis=0)
+
+        names, inv = np.unique(recs["device"], return_inverse=True)
+        for j, raw in enumerate(names):
+            sel = inv == j
+            entry = self.devices.setdefault(raw.decode(), [0, np.zeros(len(self.features)),
+                                                           np.zeros(len(self.features))])
+            entry[0] += int(sel.sum())
+            entry[1] += absv[sel].sum(axis=0)
+            entry[2] += shap[sel].sum(axis=0)
+
+        starts = (np.floor(recs["ts"] / BUCKET_SECONDS) * BUCKET_SECONDS).astype(np.int64)
+        ubuckets, binv = np.unique(starts, return_inverse=True)
+        bsum = np.zeros((len(ubuckets), len(self.features)))
+        np.add.at(bsum, binv, absv)
+        bcount = np.bincount(binv)
+        for b, c, s in zip(ubuckets.tolist(), bcount.tolist(), bsum):
+            entry = self.buckets.setdefault(b, [0, np.zeros(len(self.features))])
+            entry[0] += c
+            entry[1] += s
+        return self
+
+    def mean_abs(self, device=None):
+        """Mean |SHAP| per feature, overall or for one device."""
+        if device is None:
+            return self.sum_abs / self.count if self.count else self.sum_abs
+        count, sum_abs, _ = self.devices[device]
+        return sum_abs / count
+
+    def bucket_series(self):
+        """(bucket start times, mean |SHAP| matrix buckets x features)."""
+        keys = sorted(self.buckets)
+        if not keys:
+            return [], np.zeros((0, len(self.features)))
+        return keys, np.array([self.buckets[b][1] / self.buckets[b][0] for b in keys])
+
+    def to_dict(self):
+        return {
+            "features": self.features, "rows": self.rows, "count": self.count,
+            "sum_abs": self.sum_abs.tolist(), "sum": self.sum.tolist(),
+            "devices": {d: [c, a.tolist(), s.tolist()] for d, (c, a, s) in self.devices.items()},
+            "buckets": {str(b): [c, s.tolist()] for b, (c, s) in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        agg = cls(d["features"])
+        agg.rows, agg.count = d["rows"], d["count"]
+        agg.sum_abs, agg.sum = np.asarray(d["sum_abs"]), np.asarray(d["sum"])
+        agg.devices = {dev: [c, np.asarray(a), np.asarray(s)] for dev, (c, a, s) in d["devices"].items()}
+        agg.buckets = {int(b): [c, np.asarray(s)] for b, (c, s) in d["buckets"].items()}
+        return agg
+
+
+class ShapStore:
+    """Reader side: keeps ShapAggregates in step with records.bin."""
+
+    def __init__(self, root=SHAP_STORE):
+        self.root = root
+        self.features = None
+        self.aggregates = None
+        self._dtype = None
+        self._saved = 0.0
+
+    def refresh(self, save=True):
+        """Fold records appended since the last call; returns self."""
+        meta_path, rec_path, agg_path = _paths(self.root)
+        if self.features is None:
+            meta = read_meta(self.root)
+            if meta is None:
+                return self
+            self.features = meta["features"]
+            self._dtype = _meta_dtype(meta)
+            try:
+                with open(agg_path) as f:
+                    agg = ShapAggregates.from_dict(json.load(f))
+                if agg.features == self.features:
+                    self.aggregates = agg
+            except (FileNotFoundError, ValueError, KeyError):
+                pass
+            if self.aggregates is None:
+                self.aggregates = ShapAggregates(self.features)
+        try:
+            n = os.path.getsize(rec_path) // self._dtype.itemsize
+        except FileNotFoundError:
+            n = 0
+        if n < self.aggregates.rows:
+            # Store was reset underneath us: start over
+            self.aggregates = ShapAggregates(self.features)
+        if n > self.aggregates.rows:
+            while self.aggregates.rows < n:
+                start = self.aggregates.rows
+                self.aggregates.fold(self.records(start, min(n, start + FOLD_CHUNK)))
+            if save and time.time() - self._saved > SAVE_INTERVAL:
+                self.save()
+        return self
+
+    def records(self, start, stop):
+        """Records [start, stop) as a structured array."""
+        rec_path = _paths(self.root)[1]
+        return np.fromfile(rec_path, dtype=self._dtype, count=max(0, stop - start),
+                           offset=start * self._dtype.itemsize)
+
+    def save(self):
+        if self.aggregates is None:
+            return
+        agg_path = _paths(self.root)[2]
+        tmp = f"{agg_path}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(self.aggregates.to_dict(), f)
+        os.replace(tmp, agg_path)
+        self._saved = time.time()
+
+
+def parse_shap_text(text):
+    """'[[-3.87 -3.78]]' (numpy repr in the alert log) -> list of floats."""
+    return [float(v) for v in text.replace("[", " ").replace("]", " ").replace(",", " ").split()]
+
+
+def _default_features(n):
+    from src.detection import model_registry
+
+    version = model_registry.resolve()
+    if version:
+        features = model_registry.read_meta(version)["features"]
+        if len(features) == n:
+            return features
+    return [f"reg{i}" for i in range(n)]
+
+
+def backfill(log_path, root=SHAP_STORE, device="plc", features=None, force=False):
+    """Import the SHAP text of an existing anomaly log; returns the number of records written."""
+    from src.dashboard.alert_loader import parse_alert_line
+
+    rec_path = _paths(root)[1]
+    if os.path.exists(rec_path) and os.path.getsize(rec_path) and not force:
+        raise SystemExit(f"{rec_path} already has records; use --force to rebuild")
+    rows = []
+    with open(log_path, errors="replace") as f:
+        for line in f:
+            rec = parse_alert_line(line)
+            if rec is None or rec["score"] is None:
+                continue
+            values = parse_shap_text(rec["shap"] or "")
+            if values:
+                rows.append((rec["timestamp"].timestamp(), rec["score"], values, rec["frames"]))
+    if not rows:
+        return 0
+    k = len(rows[0][2])
+    rows = [r for r in rows if len(r[2]) == k]
+    if force and os.path.isdir(root):
+        for path in _paths(root):
+            if os.path.exists(path):
+                os.remove(path)
+    writer = ShapWriter(features or _default_features(k), root)
+    try:
+        for i in range(0, len(rows), FOLD_CHUNK):
+            batch = rows[i:i + FOLD_CHUNK]
+            writer.append_many([r[0] for r in batch], [r[1] for r in batch],
+                               [r[2] for r in batch], [device] * len(batch), [r[3] for r in batch])
+    finally:
+        writer.close()
+    return len(rows)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Per-alert SHAP vector store")
+    p.add_argument("--root", default=SHAP_STORE)
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("backfill", help="import SHAP values from the text anomaly log")
+    b.add_argument("--log", default="logs/alerts/anomaly.log")
+    b.add_argument("--device", default="plc")
+    b.add_argument("--features", help="comma-separated feature names (default: registry model)")
+    b.add_argument("--force", action="store_true", help="replace existing records")
+    sub.add_parser("summary", help="print the aggregated attributions")
+    args = p.parse_args()
+
+    if args.cmd == "backfill":
+        features = args.features.split(",") if args.features else None
+        n = backfill(args.log, args.root, args.device, features, args.force)
+        store = ShapStore(args.root).refresh(save=False)
+        store.save()
+        print(f"Imported {n} SHAP rows into {args.root}")
+    else:
+        store = ShapStore(args.root).refresh()
+        agg = store.aggregates
+        if agg is None or not agg.count:
+            print("No SHAP records")
+            return
+        print(f"{agg.count} alerts, {len(agg.devices)} devices")
+        for name, value in sorted(zip(agg.features, agg.mean_abs()), key=lambda x: -x[1]):
+            print(f"  {name:20s} mean|SHAP| {value:.4f}")
+        store.save()
+
+
+if __name__ == "__main__":
+    main()
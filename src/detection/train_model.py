@@ -1,9 +1,28 @@
+import os
+
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 import joblib
 
-# 1. Load the CSV
-df_full = pd.read_csv("data/raw/baseline.csv")
+from src.detection import model_registry
+from src.detection.cascade import CASCADE_PATH, fit_cascade
+
+DATA_PATH = "data/raw/baseline.csv"
+# Train on a register-history series (src/storage/tsdb.py) instead of the CSV:
+# TRAIN_SERIES=<series> [TRAIN_START/TRAIN_END=epoch or ISO] [TRAIN_FIELDS=reg0,reg1]
+TRAIN_SERIES = os.getenv("TRAIN_SERIES")
+# Alert threshold of the detection service; the cascade is calibrated for it
+ANOMALY_THRESH = float(os.getenv("ANOMALY_THRESHOLD", 0))
+
+# 1. Load the CSV (or the series' time range)
+if TRAIN_SERIES:
+    from src.storage.tsdb import TSDB, parse_time
+
+    fields = os.getenv("TRAIN_FIELDS")
+    df_full = TSDB().frame(TRAIN_SERIES, parse_time(os.getenv("TRAIN_START")), parse_time(os.getenv("TRAIN_END")),
+                           fields=fields.split(",") if fields else None).drop(columns="timestamp").dropna()
+else:
+    df_full = pd.read_csv(DATA_PATH)
 
 # 2. Select only numeric columns (here 'func_code')
 numeric_cols = df_full.select_dtypes(include=['number']).columns.tolist()
@@ -18,3 +37,19 @@ model.fit(df)
 # 4. Save the model
 joblib.dump(model, "models/isoforest.pkl")
 print("Model saved to models/isoforest.pkl")
+
+# 5. Register a versioned, memory-mappable copy
+metrics = {
+    "train_samples":      len(df),
+    "train_anomaly_rate": float((model.decision_function(df) < 0).mean()),
+}
+if TRAIN_SERIES:
+    metrics["train_series"] = TRAIN_SERIES
+version = model_registry.register(model, data_path=None if TRAIN_SERIES else DATA_PATH, metrics=metrics)
+print(f"Registered model version {version} in {model_registry.REGISTRY_DIR}")
+
+# 6. Recalibrate the early-exit cascade (src/detection/cascade.py) for the new model
+if CASCADE_PATH != "off":
+    cascade = fit_cascade(model, df.to_numpy(dtype=float), threshold=ANOMALY_THRESH)
+    cascade.save(CASCADE_PATH)
+    print(f"Cascade saved to {CASCADE_PATH} (screen clears at score >= {cascade.threshold + cascade.band:.4f})")
@@ -0,0 +1,223 @@
+"""
+policy.py
+
+Isolation decision engine. Every device runs its own state machine
+
+    normal -> suspect -> isolated -> recovering -> normal
+                 |                       |
+                 +--> normal (quiet)     +--> isolated (relapse)
+
+driven by a sliding window of alert counts and aggregated anomaly scores, so a
+single stray alert never isolates a PLC and an alert storm triggers exactly one
+action. Actions run on a background thread through a pluggable backend; alert
+ingestion never blocks on them. Alert-to-action latency is recorded per action.
+"""
+
+import os
+import queue
+import shlex
+import subprocess
+import threading
+import time
+from collections import deque
+
+from src.telemetry import metrics
+
+NORMAL, SUSPECT, ISOLATED, RECOVERING = "normal", "suspect", "isolated", "recovering"
+
+WINDOW_SECONDS  = float(os.getenv("ISOLATION_WINDOW", 10))      # sliding alert window
+BUCKET_SECONDS  = 1.0                                           # window resolution
+ISOLATE_COUNT   = int(os.getenv("ISOLATION_MIN_ALERTS", 20))    # alerts in window => isolate
+ISOLATE_SCORE   = float(os.getenv("ISOLATION_MIN_SCORE", 2.0))  # sum of -score in window => isolate
+QUIET_SECONDS   = float(os.getenv("ISOLATION_QUIET", 30))       # alert-free time before recovering
+PROBATION       = float(os.getenv("ISOLATION_PROBATION", 30))   # recovering time before restore
+LATENCY_SAMPLES = 10000
+
+ACTIONS         = metrics.counter("isolation_actions_total", "Isolate/restore actions executed", ["action"])
+ACTION_FAILURES = metrics.counter("isolation_action_failures_total", "Isolate/restore actions that raised", ["action"])
+ACTION_LATENCY  = metrics.histogram("isolation_action_latency_seconds", "Alert timestamp to completed action",
+                                    ["action"])
+
+
+class DeviceState:
+    """Per-device state plus a ring of per-second alert counts and score sums."""
+
+    __slots__ = ("state", "counts", "scores", "bucket", "total_count", "total_score",
+                 "last_alert", "since", "trigger_ts")
+
+    def __init__(self, n_buckets):
+        self.state = NORMAL
+        self.counts = [0] * n_buckets
+        self.scores = [0.0] * n_buckets
+        self.bucket = None
+        self.total_count = 0
+        self.total_score = 0.0
+        self.last_alert = 0.0
+        self.since = 0.0
+        self.trigger_ts = 0.0
+
+    def advance(self, bucket):
+        """Expire buckets that slid out of the window (amortised O(1))."""
+        if self.bucket is None:
+            self.bucket = bucket
+            return
+        n = len(self.counts)
+        for b in range(self.bucket + 1, min(bucket, self.bucket + n) + 1):
+            slot = b % n
+            self.total_count -= self.counts[slot]
+            self.total_score -= self.scores[slot]
+            self.counts[slot] = 0
+            self.scores[slot] = 0.0
+        self.bucket = max(self.bucket, bucket)
+
+
+class SimulatedBackend:
+    """Default backend: log what would be done (ISOLATION_MODE=simulate)."""
+
+    def isolate(self, device):
+        print(f"[INFO] (Simulated) Isolating {device} - no physical interface present")
+
+    def restore(self, device):
+        print(f"[INFO] (Simulated) Restoring {device}")
+
+
+class CommandBackend:
+    """
+    Run a local command per action (ISOLATION_MODE=command), e.g.
+    ISOLATION_CMD="ip link set {device} down" RESTORE_CMD="ip link set {device} up".
+    """
+
+    def __init__(self, isolate_cmd=None, restore_cmd=None):
+        self.isolate_cmd = isolate_cmd or os.environ["ISOLATION_CMD"]
+        self.restore_cmd = restore_cmd or os.environ["RESTORE_CMD"]
+
+    def _run(self, template, device):
+        subprocess.run(shlex.split(template.format(device=device)), check=True, timeout=30)
+
+    def isolate(self, device):
+        self._run(self.isolate_cmd, device)
+
+    def restore(self, device):
+        self._run(self.restore_cmd, device)
+
+
+BACKENDS = {
+    "simulate": SimulatedBackend,
+    "command":  CommandBackend,
+}
+
+
+class ActionDispatcher:
+    """Executes isolate/restore actions off the ingest path and times them."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.queue = queue.Queue()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.failures = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, action, device, alert_ts):
+        self.queue.put((action, device, alert_ts))
+
+    def _run(self):
+        while True:
+            action, device, alert_ts = self.queue.get()
+            try:
+                getattr(self.backend, action)(device)
+                latency = time.time() - alert_ts
+                self.latencies.append(latency)
+                ACTIONS.labels(action).inc()
+                ACTION_LATENCY.labels(action).observe(latency)
+            except Exception as e:
+                self.failures += 1
+                ACTION_FAILURES.labels(action).inc()
+                print(f"[ERROR] {action} {device} failed: {e}")
+
+    def latency_percentiles(self, pcts=(50, 99)):
+        data = sorted(self.latencies)
+        if not data:
+            return {}
+        return {p: data[min(len(data) - 1, int(len(data) * p / 100))] for p in pcts}
+
+
+class IsolationPolicy:
+    """Feed alerts with ingest(); call tick() periodically to age out quiet devices."""
+
+    def __init__(self, dispatcher, window=WINDOW_SECONDS, bucket=BUCKET_SECONDS):
+        self.dispatcher = dispatcher
+        self.bucket_seconds = bucket
+        self.n_buckets = max(1, int(round(window / bucket)))
+        self.devices = {}
+        self.alerts_seen = 0
+
+    def _device(self, name):
+        dev = self.devices.get(name)
+        if dev is None:
+            dev = self.devices[name] = DeviceState(self.n_buckets)
+        return dev
+
+    def _transition(self, name, dev, state, now):
+        print(f"[POLICY] {name}: {dev.state} -> {state} "
+              f"({dev.total_count} alerts, score {dev.total_score:.2f} in window)")
+        dev.state = state
+        dev.since = now
+
+    def ingest(self, device, ts, score, frames=1):
+        """Account one alert (ts = detection time, score = decision_function value);
+        a sampled alert standing for `frames` anomalous frames counts that many times."""
+        self.alerts_seen += frames
+        dev = self._device(device)
+        b = int(ts // self.bucket_seconds)
+        dev.advance(b)
+        slot = b % self.n_buckets
+        dev.counts[slot] += frames
+        dev.total_count += frames
+        severity = -score * frames if score < 0 else 0.0
+        dev.scores[slot] += severity
+        dev.total_score += severity
+        if ts > dev.last_alert:
+            dev.last_alert = ts
+
+        state = dev.state
+        if state == ISOLATED:
+            return
+        over = dev.total_count >= ISOLATE_COUNT or dev.total_score >= ISOLATE_SCORE
+        if state == NORMAL:
+            self._transition(device, dev, ISOLATED if over else SUSPECT, ts)
+            if over:
+                self.dispatcher.submit("isolate", device, ts)
+        elif over and state == SUSPECT:
+            self._transition(device, dev, ISOLATED, ts)
+            self.dispatcher.submit("isolate", device, ts)
+        elif over and state == RECOVERING:
+            # Still isolated on the network: no action needed, restart the clock
+            self._transition(device, dev, ISOLATED, ts)
+
+    def ingest_batch(self, alerts):
+        """alerts: iterable of (device, ts, score) or (device, ts, score, frames)."""
+        ingest = self.ingest
+        for alert in alerts:
+            ingest(*alert)
+
+    def tick(self, now=None):
+        """Advance time-based transitions (quiet suspect, recovery, restore)."""
+        now = time.time() if now is None else now
+        b = int(now // self.bucket_seconds)
+        for name, dev in self.devices.items():
+            dev.advance(b)
+            quiet = now - dev.last_alert
+            if dev.state == SUSPECT and dev.total_count == 0:
+                self._transition(name, dev, NORMAL, now)
+            elif dev.state == ISOLATED and quiet >= QUIET_SECONDS:
+                self._transition(name, dev, RECOVERING, now)
+            elif dev.state == RECOVERING and now - dev.since >= PROBATION and quiet >= PROBATION:
+                self._transition(name, dev, NORMAL, now)
+                self.dispatcher.submit("restore", name, now)
+
+    def summary(self):
+        states = {}
+        for dev in list(self.devices.values()):  # also read from the metrics thread
+            states[dev.state] = states.get(dev.state, 0) + 1
+        return states
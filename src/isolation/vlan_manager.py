@@ -1,36 +1,113 @@
-import time
+import argparse
 import os
+import time
 
-ANOMALY_LOG_PATH = '/home/airobot/projects/ICS-CyberDefender/logs/alerts/anomaly.log'
-SLEEP_INTERVAL = 2
+from dotenv import load_dotenv
 
-def tail_f(filename):
-    with open(filename, 'r') as f:
-        f.seek(0, os.SEEK_END)
-        while True:
-            line = f.readline()
-            if not line:
-                time.sleep(SLEEP_INTERVAL)
-                continue
-            yield line
+from src.isolation.policy import (BACKENDS, ISOLATED, NORMAL, RECOVERING, SUSPECT, ActionDispatcher,
+                                  IsolationPolicy)
+from src.logging.follow import LogFollower
+from src.telemetry import metrics
 
-def main():
-    print("[INFO] VLAN Manager started. Monitoring anomaly log...")
-    isolated = False
+load_dotenv()
+
+ROOT_DIR = os.path.abspath(os.path.join(__file__, '..', '..', '..'))
+ANOMALY_LOG_PATH = os.path.join(ROOT_DIR, os.getenv('LOG_PATH', os.path.join('logs', 'alerts', 'anomaly.log')))
+ISOLATION_MODE = os.getenv('ISOLATION_MODE', 'simulate')
+TICK_INTERVAL = 1.0     # seconds between policy time-based checks
+STATS_INTERVAL = 10.0
+LOG_DEVICE = 'plc'      # anomaly.log lines carry no device id
+METRICS_PORT = 9103
+
+INGEST_TIME = metrics.histogram('isolation_ingest_seconds', 'Policy update time per alert batch')
+ALERT_LAG   = metrics.histogram('isolation_alert_lag_seconds', 'Detection to policy ingest delay (newest alert of a batch)')
+
+def register_metrics(policy, dispatcher):
+    """Scrape-time views of the policy and dispatcher state."""
+    metrics.counter('isolation_alerts_total', 'Alerts ingested by the policy') \
+        .set_function(lambda: policy.alerts_seen)
+    metrics.gauge('isolation_action_queue_depth', 'Actions waiting for the backend') \
+        .set_function(dispatcher.queue.qsize)
+    devices = metrics.gauge('isolation_devices', 'Devices per policy state', ['state'])
+    for state in (NORMAL, SUSPECT, ISOLATED, RECOVERING):
+        devices.labels(state).set_function(lambda state=state: policy.summary().get(state, 0))
+
+def parse_log_line(line):
+    """'ts,[r0, r1, ...],score,shap[,frames]' -> (device, ts, score, frames), or None if malformed.
+
+    Detectors log only sampled frames of an incident; the trailing field is
+    how many anomalous frames the line stands for (1 on older lines).
+    """
+    head, sep, rest = line.partition(',')
+    regs_end = rest.find('],')
+    if not sep or regs_end < 0:
+        return None
+    score, _, tail = rest[regs_end + 2:].partition(',')
+    _, comma, frames = tail.rpartition(',')
+    frames = int(frames) if comma and frames.strip().isdigit() else 1
+    try:
+        return LOG_DEVICE, float(head), float(score.strip().strip('[]')), frames
+    except ValueError:
+        return None
 
-    while not os.path.exists(ANOMALY_LOG_PATH):
+def follow_log():
+    """Legacy source: yield batches of (device, ts, score, frames) appended to the anomaly log.
+
+    The follower wakes on inotify as soon as the detector appends, copes with
+    the log being rotated, truncated or not created yet, and hands over every
+    line of a burst in one batch. Empty batches mark idle ticks.
+    """
+    if not os.path.exists(ANOMALY_LOG_PATH):
         print(f"[WARN] Waiting for anomaly log at {ANOMALY_LOG_PATH}")
-        time.sleep(SLEEP_INTERVAL)
-
-    for line in tail_f(ANOMALY_LOG_PATH):
-        line = line.strip()
-        if line:
-            print(f"[ALERT] Anomaly detected: {line}")
-            if not isolated:
-                print("[INFO] (Simulated) Isolating PLC interface - no physical interface present")
-                isolated = True
-            else:
-                print("[INFO] Interface already (simulated) isolated")
+
+    follower = LogFollower(ANOMALY_LOG_PATH)
+    while True:
+        lines = follower.poll(TICK_INTERVAL)
+        yield [a for a in map(parse_log_line, lines) if a is not None]
+
+def follow_bus():
+    """Yield batches of (device, ts, score, frames) as soon as detectors publish them."""
+    from src.alerts.bus import AlertSubscriber
+
+    sub = AlertSubscriber()
+    while True:
+        yield [(a['device'], a['ts'], a['score'], a.get('frames', 1)) for a in sub.recv_batch(TICK_INTERVAL)]
+
+def main():
+    p = argparse.ArgumentParser(description="Isolate PLC interfaces when anomalies are reported")
+    p.add_argument("--source", choices=["bus", "file"], default="bus",
+                   help="Receive alerts from the ZeroMQ bus (default) or by following the anomaly log")
+    args = p.parse_args()
+
+    dispatcher = ActionDispatcher(BACKENDS[ISOLATION_MODE]())
+    policy = IsolationPolicy(dispatcher)
+    register_metrics(policy, dispatcher)
+    metrics.serve_from_env(METRICS_PORT)
+    print(f"[INFO] VLAN Manager started ({ISOLATION_MODE}). Monitoring alerts ({args.source})...")
+
+    batches = follow_bus() if args.source == "bus" else follow_log()
+    last_tick = last_stats = time.monotonic()
+    seen = 0
+    try:
+        for batch in batches:
+            if batch:
+                t0 = time.perf_counter()
+                policy.ingest_batch(batch)
+                INGEST_TIME.observe(time.perf_counter() - t0)
+                ALERT_LAG.observe(time.time() - max(a[1] for a in batch))
+            now = time.monotonic()
+            if now - last_tick >= TICK_INTERVAL:
+                policy.tick()
+                last_tick = now
+            if now - last_stats >= STATS_INTERVAL:
+                rate = (policy.alerts_seen - seen) / (now - last_stats)
+                lat = dispatcher.latency_percentiles()
+                lat_txt = ", ".join(f"p{p}={v * 1000:.1f}ms" for p, v in lat.items()) or "n/a"
+                print(f"[STATS] {rate:,.0f} alerts/s | devices {policy.summary()} | "
+                      f"alert->action {lat_txt} | pending actions {dispatcher.queue.qsize()}")
+                seen, last_stats = policy.alerts_seen, now
+    except KeyboardInterrupt:
+        print("[INFO] VLAN Manager stopped.")
 
 if __name__ == '__main__':
     main()
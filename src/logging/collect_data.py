@@ -1,23 +1,76 @@
 """
 Collect baseline data from live PLC simulator
 Run plc_simulator.py first in another terminal
+Metrics (poll RTT, errors, reconnects, buffered samples) on METRICS_PORT (default 9102)
+Sampled per-poll stage spans with TRACE_DIR set (src/telemetry/tracing.py)
+Points are read through a coalesced read plan (src/modbus/read_planner.py);
+POINTS_FILE may remap them as long as it keeps the REGISTER_POINTS names
+Raw point values also go to the register history (src/storage/tsdb.py), series "<HOST>:<PORT>"
 """
+import numpy as np
 import pandas as pd
 import time
 from pymodbus.client import ModbusTcpClient
+from pymodbus.exceptions import ModbusException
 from dotenv import load_dotenv
 import os
 
+from src.modbus.read_planner import Point, ReadPlan, load_points
+from src.storage.tsdb import SeriesWriter
+from src.telemetry import metrics, tracing
+
 load_dotenv()
 
 HOST = os.getenv("PLC_HOST", "127.0.0.1")
 PORT = int(os.getenv("PLC_PORT", 5020))
 SLAVE = int(os.getenv("PLC_SLAVE", 1))
+POINTS_FILE = os.getenv("POINTS_FILE")
+
+# Process values (with deltas in every record) and the coils logic injection toggles
+REGISTER_POINTS = ["reg_temp", "reg_pressure", "reg_flow", "reg_level", "reg_status"]
+DEFAULT_POINTS = [Point(name, "holding", i) for i, name in enumerate(REGISTER_POINTS)] + \
+                 [Point(f"coil_{a}", "coil", a) for a in (1, 2, 3, 4)]
+
+POLLS       = metrics.counter("collect_polls_total", "Register reads attempted")
+POLL_ERRORS = metrics.counter("collect_poll_errors_total", "Register reads that failed")
+RECONNECTS  = metrics.counter("collect_reconnects_total", "PLC reconnect attempts")
+POLL_RTT    = metrics.histogram("collect_poll_rtt_seconds", "Modbus read round trip")
+BUFFERED    = metrics.gauge("collect_samples_buffered", "Samples held in memory until the CSV is written")
+tracer      = tracing.get_tracer("collect")
+
+def make_record(ts, vals, prev_vals, prev_time, label=0, extra=None):
+    """Feature row for one poll: raw registers, inter-arrival time and deltas to the previous
+    poll; `extra` ({name: value}, e.g. coils) is appended as plain columns."""
+    inter_arrival = (ts - prev_time) if prev_time else 0.0
+    delta = [abs(vals[i] - prev_vals[i]) for i in range(5)] if prev_vals else [0]*5
+
+    record = {
+        "timestamp":        ts,
+        "inter_arrival_ms": inter_arrival * 1000,
+        "reg_temp":         vals[0],
+        "reg_pressure":     vals[1],
+        "reg_flow":         vals[2],
+        "reg_level":        vals[3],
+        "reg_status":       vals[4],
+        "delta_temp":       delta[0],
+        "delta_pressure":   delta[1],
+        "delta_flow":       delta[2],
+        "delta_level":      delta[3],
+        "label":            label   # 0=normal, 1=attack
+    }
+    if extra:
+        record.update(extra)
+    return record
 
 def collect(duration_seconds=300, interval=0.5, label=0, output_file="data/raw/baseline.csv"):
+    metrics.serve_from_env(9102)
+    plan = ReadPlan(load_points(POINTS_FILE, "plc") if POINTS_FILE else DEFAULT_POINTS)
+    reg_idx = plan.index(REGISTER_POINTS)
+    extra_idx = [i for i in range(len(plan)) if i not in set(reg_idx)]
+    history = SeriesWriter(f"{HOST}:{PORT}", plan.names)
     client = ModbusTcpClient(HOST, port=PORT)
     client.connect()
-    print(f"Connected to PLC at {HOST}:{PORT}")
+    print(f"Connected to PLC at {HOST}:{PORT}; read plan: {plan.describe()}")
     print(f"Collecting {duration_seconds}s of data → {output_file}")
 
     records = []
@@ -26,39 +79,43 @@ def collect(duration_seconds=300, interval=0.5, label=0, output_file="data/raw/b
     prev_time = None
 
     while time.time() - start < duration_seconds:
-        ts = time.time()
-        rr = client.read_holding_registers(address=0, count=5, slave=SLAVE)
-
-        if not rr.isError():
-            vals = rr.registers
-            inter_arrival = (ts - prev_time) if prev_time else 0.0
-            delta = [abs(vals[i] - prev_vals[i]) for i in range(5)] if prev_vals else [0]*5
+        with tracer.frame() as fr:
+            ts = time.time()
+            POLLS.inc()
+            try:
+                with fr.span("modbus_read"):
+                    values = plan.read(client, SLAVE)
+            except ModbusException as e:
+                RECONNECTS.inc()
+                print(f"  [WARN] read failed ({e}); reconnecting")
+                with fr.span("reconnect"):
+                    client.close()
+                    client.connect()
+                values = None
+            else:
+                POLL_RTT.observe(time.time() - ts)
 
-            record = {
-                "timestamp":        ts,
-                "inter_arrival_ms": inter_arrival * 1000,
-                "reg_temp":         vals[0],
-                "reg_pressure":     vals[1],
-                "reg_flow":         vals[2],
-                "reg_level":        vals[3],
-                "reg_status":       vals[4],
-                "delta_temp":       delta[0],
-                "delta_pressure":   delta[1],
-                "delta_flow":       delta[2],
-                "delta_level":      delta[3],
-                "label":            label   # 0=normal, 1=attack
-            }
-            records.append(record)
-            prev_vals = vals
-            prev_time = ts
+            if values is None or np.isnan(values[reg_idx]).any():
+                POLL_ERRORS.inc()
+            else:
+                history.append(ts, values)
+                vals = [int(v) if float(v).is_integer() else float(v) for v in values[reg_idx]]
+                with fr.span("build_record"):
+                    extra = {plan.names[i]: int(values[i]) if float(values[i]).is_integer() else values[i]
+                             for i in extra_idx}
+                    records.append(make_record(ts, vals, prev_vals, prev_time, label, extra))
+                BUFFERED.set(len(records))
+                prev_vals = vals
+                prev_time = ts
 
-            elapsed = time.time() - start
-            if len(records) % 50 == 0:
-                print(f"  [{elapsed:.0f}s] {len(records)} samples | temp={vals[0]} pressure={vals[1]} flow={vals[2]}")
+                elapsed = time.time() - start
+                if len(records) % 50 == 0:
+                    print(f"  [{elapsed:.0f}s] {len(records)} samples | temp={vals[0]} pressure={vals[1]} flow={vals[2]}")
 
         time.sleep(interval)
 
     client.close()
+    history.close()
     df = pd.DataFrame(records)
     df.to_csv(output_file, index=False)
     print(f"\nSaved {len(df)} samples → {output_file}")
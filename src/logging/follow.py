@@ -0,0 +1,183 @@
+"""
+follow.py
+
+Event-driven `tail -F`. On Linux the follower blocks on inotify and wakes the
+moment data is appended (elsewhere it falls back to short polling). Appended
+data is read in large blocks and returned as batches of complete lines, and the
+follower survives truncation, rotation (rename or delete) and a file that does
+not exist yet.
+
+    for lines in LogFollower("logs/alerts/anomaly.log"):
+        ...   # every complete line appended since the last wakeup
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+READ_BLOCK    = 1 << 20  # bytes per os.read() while draining
+POLL_FALLBACK = 0.05     # seconds between stat() checks without inotify
+
+# <sys/inotify.h>
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_NONBLOCK    = os.O_NONBLOCK
+IN_CLOEXEC     = 0o2000000
+_EVENT         = struct.Struct("iIII")
+
+# Watching the directory (not the file) sees appends, truncation and the file
+# being renamed, deleted or recreated with a single watch descriptor.
+DIR_MASK = IN_MODIFY | IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+
+
+class _Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        return wd
+
+    def wait(self, timeout=None):
+        """Block until events arrive; return [(mask, name), ...] ([] on timeout)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(buf):
+                _, mask, _, length = _EVENT.unpack_from(buf, pos)
+                pos += _EVENT.size
+                name = buf[pos:pos + length].rstrip(b"\0").decode(errors="replace")
+                pos += length
+                events.append((mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LogFollower:
+    """Iterate over batches of newly appended lines of `path`."""
+
+    def __init__(self, path, from_end=True, block_size=READ_BLOCK):
+        self.path = os.path.abspath(path)
+        self.dirname, self.basename = os.path.split(self.path)
+        self.block_size = block_size
+        self.fd = None
+        self.inode = None
+        self.pos = 0
+        self._partial = b""
+        try:
+            self._notify = _Inotify()
+            os.makedirs(self.dirname, exist_ok=True)
+            self._notify.add_watch(self.dirname, DIR_MASK)
+        except (OSError, AttributeError):
+            self._notify = None
+        self._open(seek_end=from_end)
+
+    def _open(self, seek_end=False):
+        try:
+            fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+        except FileNotFoundError:
+            return False
+        st = os.fstat(fd)
+        self.fd, self.inode = fd, st.st_ino
+        self.pos = os.lseek(fd, 0, os.SEEK_END) if seek_end else 0
+        self._partial = b""
+        return True
+
+    def _close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = self.inode = None
+
+    def _drain(self):
+        """Read everything appended since the last call, in large blocks."""
+        if self.fd is None:
+            return []
+        if os.fstat(self.fd).st_size < self.pos:
+            # Truncated in place (copytruncate, `> file`): start over
+            self.pos = os.lseek(self.fd, 0, os.SEEK_SET)
+            self._partial = b""
+        chunks = []
+        while True:
+            chunk = os.pread(self.fd, self.block_size, self.pos)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            self.pos += len(chunk)
+        if not chunks:
+            return []
+        data = self._partial + b"".join(chunks)
+        cut = data.rfind(b"\n") + 1
+        self._partial = data[cut:]
+        if not cut:
+            return []
+        return data[:cut].decode("utf-8", errors="replace").splitlines()
+
+    def _reopen_if_replaced(self):
+        """Handle rotation: finish the old file, then switch to the new one."""
+        lines = []
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self.inode:
+            lines = self._drain()
+            self._close()
+            if inode is not None:
+                self._open(seek_end=False)
+                lines += self._drain()
+        return lines
+
+    def poll(self, timeout=None):
+        """Wait up to `timeout` seconds for new lines; returns a (possibly empty) list."""
+        if self._notify is None:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                lines = self._reopen_if_replaced() + self._drain()
+                if lines or (deadline is not None and time.monotonic() >= deadline):
+                    return lines
+                time.sleep(POLL_FALLBACK)
+
+        lines = self._reopen_if_replaced() + self._drain()
+        if lines:
+            return lines
+        events = self._notify.wait(timeout)
+        relevant = [mask for mask, name in events if name == self.basename or mask & IN_Q_OVERFLOW]
+        if not relevant:
+            return []
+        if any(mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_Q_OVERFLOW) for mask in relevant):
+            return self._reopen_if_replaced() + self._drain()
+        return self._drain()
+
+    def __iter__(self):
+        while True:
+            lines = self.poll()
+            if lines:
+                yield lines
+
+    def close(self):
+        self._close()
+        if self._notify is not None:
+            self._notify.close()
@@ -1,9 +1,40 @@
 #!/usr/bin/env python3
+"""
+Parse every Modbus-TCP frame of a pcap into CSV.
+
+    python -m src.logging.parse_modbus -i capture.pcap -o frames.csv
+
+With TRACE_DIR set, sampled packets are traced through their decode, extract
+and write stages (src/telemetry/tracing.py).
+"""
 import argparse
 import pyshark
 import csv
 import sys
 
+from src.telemetry import tracing
+
+FIELDNAMES = ["timestamp","func_code","registers","coils"]
+
+def parse_packet(pkt):
+    """One pyshark Modbus packet -> CSV row dict (missing fields left empty)."""
+    row = {k:"" for k in FIELDNAMES}
+    # timestamp
+    row["timestamp"] = pkt.sniff_time.strftime("%Y-%m-%d %H:%M:%S.%f")
+    # modbus layer
+    mb = pkt.modbus
+    row["func_code"] = getattr(mb, "func_code", "")
+    # registers (holding or input)
+    regs = getattr(mb, "register_value", None)
+    if regs:
+        # pyshark returns list for multi-values
+        row["registers"] = ";".join(regs) if isinstance(regs, list) else regs
+    # coils
+    coils = getattr(mb, "coil", None) or getattr(mb, "coil_value", None)
+    if coils:
+        row["coils"] = ";".join(coils) if isinstance(coils, list) else coils
+    return row
+
 def main():
     p = argparse.ArgumentParser(
         description="Parse every Modbus-TCP frame into CSV (no skips)")
@@ -18,30 +49,23 @@ def main():
         print(f"ERROR opening pcap: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # Define our columns
-    fieldnames = ["timestamp","func_code","registers","coils"]
+    tracer = tracing.get_tracer("parse_modbus")
     with open(args.output, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
         writer.writeheader()
 
-        for pkt in cap:
-            row = {k:"" for k in fieldnames}
-            # timestamp
-            row["timestamp"] = pkt.sniff_time.strftime("%Y-%m-%d %H:%M:%S.%f")
-            # modbus layer
-            mb = pkt.modbus
-            row["func_code"] = getattr(mb, "func_code", "")
-            # registers (holding or input)
-            regs = getattr(mb, "register_value", None)
-            if regs:
-                # pyshark returns list for multi-values
-                row["registers"] = ";".join(regs) if isinstance(regs, list) else regs
-            # coils
-            coils = getattr(mb, "coil", None) or getattr(mb, "coil_value", None)
-            if coils:
-                row["coils"] = ";".join(coils) if isinstance(coils, list) else coils
-
-            writer.writerow(row)
+        packets = iter(cap)
+        while True:
+            with tracer.frame() as fr:
+                # tshark dissects lazily, so fetching the packet is the decode cost
+                with fr.span("decode"):
+                    pkt = next(packets, None)
+                if pkt is None:
+                    break
+                with fr.span("extract"):
+                    row = parse_packet(pkt)
+                with fr.span("write_row"):
+                    writer.writerow(row)
 
     print(f"Done. Parsed all Modbus frames to {args.output}")
 
@@ -1,9 +1,59 @@
-from pymodbus.server import StartTcpServer
+from pymodbus.server import ModbusTcpServer
+from pymodbus.server.async_io import ModbusServerRequestHandler
 from pymodbus.datastore import ModbusSlaveContext, ModbusServerContext
 from pymodbus.datastore import ModbusSequentialDataBlock
-import random, time, threading
+from pymodbus.exceptions import ModbusException
+import asyncio, random, time, threading
+
+from src.telemetry import metrics
+
+METRICS_PORT = 9104
+
+UPDATES      = metrics.counter("plc_sim_updates_total", "Process value update ticks")
+UPDATE_LAG   = metrics.histogram("plc_sim_update_lag_seconds", "How much later than scheduled each update tick ran")
+REGS_READ    = metrics.counter("plc_sim_registers_read_total", "Holding registers read by clients")
+REGS_WRITTEN = metrics.counter("plc_sim_registers_written_total", "Holding registers written by clients")
+
+# Set in the updater thread so its own register accesses are not counted as client traffic
+_internal = threading.local()
+
+class CountingDataBlock(ModbusSequentialDataBlock):
+    """Holding registers that count client reads and writes."""
+
+    def getValues(self, address, count=1):
+        if not getattr(_internal, "active", False):
+            REGS_READ.inc(count)
+        return super().getValues(address, count)
+
+    def setValues(self, address, values):
+        if not getattr(_internal, "active", False):
+            REGS_WRITTEN.inc(len(values) if isinstance(values, list) else 1)
+        super().setValues(address, values)
+
+class PipelinedRequestHandler(ModbusServerRequestHandler):
+    """Serves every complete request in the receive buffer. The stock handler
+    decodes one frame per TCP read, so pipelined requests (src/modbus/pipeline.py)
+    would sit in the buffer until the client sent more bytes."""
+
+    async def inner_handle(self):
+        await super().inner_handle()
+        while self.databuffer:
+            try:
+                used_len, pdu = self.framer.processIncomingFrame(self.databuffer)
+            except ModbusException:
+                return  # the next read resynchronises through the stock handler
+            if not used_len:
+                return
+            self.databuffer = self.databuffer[used_len:]
+            if pdu:
+                self.execute(pdu, None)
+
+class PipelinedTcpServer(ModbusTcpServer):
+    def callback_new_connection(self):
+        return PipelinedRequestHandler(self)
 
 def dynamic_updater(context):
+    _internal.active = True
     while True:
         slave = context[0x01]
         current = slave.getValues(3, 0, count=5)
@@ -15,16 +65,22 @@ def dynamic_updater(context):
             max(0, min(50,   current[4] + random.randint(0, 1))),
         ]
         slave.setValues(3, 0, new_vals)
+        UPDATES.inc()
+        t0 = time.monotonic()
         time.sleep(0.1)
+        UPDATE_LAG.observe(max(0.0, time.monotonic() - t0 - 0.1))
 
 def run_simulator():
-    block = ModbusSequentialDataBlock(0, [100, 250, 80, 60, 1] + [0]*95)
+    block = CountingDataBlock(0, [100, 250, 80, 60, 1] + [0]*95)
     store = ModbusSlaveContext(hr=block)
     context = ModbusServerContext(slaves={0x01: store}, single=False)
     t = threading.Thread(target=dynamic_updater, args=(context,), daemon=True)
     t.start()
+    metrics.serve_from_env(METRICS_PORT)
     print("PLC Simulator running on 127.0.0.1:5020")
-    StartTcpServer(context=context, address=("127.0.0.1", 5020))
+    async def serve():
+        await PipelinedTcpServer(context, address=("127.0.0.1", 5020)).serve_forever()
+    asyncio.run(serve())
 
 if __name__ == "__main__":
-    run_simulator()
\ No newline at end of file
+    run_simulator()
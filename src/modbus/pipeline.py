@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+pipeline.py
+
+Modbus/TCP client that keeps up to `window` transactions outstanding on one
+connection instead of waiting for each response before sending the next
+request. Responses are matched to requests by MBAP transaction ID, so they
+may arrive in any order; a transaction without a response after `timeout`
+seconds completes as a timed-out error response, and a response that turns
+up later is discarded. With window=1 it behaves like a plain request/response
+client, so throughput gains come only from overlapping round trips.
+
+The single-request methods mirror pymodbus (read_holding_registers(address=,
+count=, slave=) returning an object with isError(), .registers / .bits), and
+call_many() pipelines a list of such calls; ReadPlan.read() uses it to put
+every block of a poll on the wire at once.
+
+    with PipelinedClient("127.0.0.1", 5020, window=16) as client:
+        responses = client.call_many([("read_holding_registers", {"address": 0, "count": 5})] * 1000)
+
+    python -m src.modbus.pipeline --port 5020 --windows 1,2,4,8,16,32   # throughput per window
+"""
+
+import argparse
+import itertools
+import select
+import selectors
+import socket
+import struct
+import time
+
+from pymodbus.exceptions import ConnectionException
+
+MBAP = struct.Struct(">HHHB")   # transaction id, protocol id (0), length, unit id
+WINDOW  = 8
+TIMEOUT = 3.0   # seconds per transaction
+
+# method -> (function code, bit response)
+FUNCTIONS = {
+    "read_coils":               (0x01, True),
+    "read_discrete_inputs":     (0x02, True),
+    "read_holding_registers":   (0x03, False),
+    "read_input_registers":     (0x04, False),
+    "write_coil":               (0x05, False),
+    "write_register":           (0x06, False),
+    "write_registers":          (0x10, False),
+}
+
+
+class Response:
+    """Decoded response PDU, shaped like the pymodbus response objects we use."""
+
+    __slots__ = ("function_code", "exception_code", "registers", "bits", "address", "count", "timed_out")
+
+    def __init__(self, function_code, exception_code=0, registers=(), bits=(), address=None, count=None,
+                 timed_out=False):
+        self.function_code = function_code
+        self.exception_code = exception_code
+        self.registers = list(registers)
+        self.bits = list(bits)
+        self.address = address
+        self.count = count
+        self.timed_out = timed_out
+
+    def isError(self):
+        return self.timed_out or self.function_code & 0x80 != 0
+
+    def __repr__(self):
+        if self.timed_out:
+            return f"Response(fc={self.function_code}, timed out)"
+        if self.isError():
+            return f"Response(fc={self.function_code}, exception={self.exception_code})"
+        return f"Response(fc={self.function_code}, registers={self.registers}, bits={self.bits})"
+
+
+def encode_request(method, address, count=1, value=None, values=None):
+    """Request PDU (function code + data) for one pymodbus-style call."""
+    fc = FUNCTIONS[method][0]
+    if fc <= 0x04:
+        return struct.pack(">BHH", fc, address, count)
+    if fc == 0x05:
+        return struct.pack(">BHH", fc, address, 0xFF00 if value else 0x0000)
+    if fc == 0x06:
+        return struct.pack(">BHH", fc, address, value & 0xFFFF)
+    values = list(values)
+    return struct.pack(f">BHHB{len(values)}H", fc, address, len(values), 2 * len(values),
+                       *(v & 0xFFFF for v in values))
+
+
+def decode_response(pdu):
+    fc = pdu[0]
+    if fc & 0x80:
+        return Response(fc, exception_code=pdu[1] if len(pdu) > 1 else 0)
+    if fc in (0x01, 0x02):
+        data = pdu[2:2 + pdu[1]]
+        return Response(fc, bits=[bool(byte >> i & 1) for byte in data for i in range(8)])
+    if fc in (0x03, 0x04):
+        n = pdu[1] // 2
+        return Response(fc, registers=struct.unpack_from(f">{n}H", pdu, 2))
+    address, value = struct.unpack_from(">HH", pdu, 1)
+    if fc == 0x10:
+        return Response(fc, address=address, count=value)
+    return Response(fc, address=address, registers=(value,))
+
+
+class PipelinedClient:
+    """One Modbus/TCP connection with up to `window` transactions in flight."""
+
+    def __init__(self, host, port=502, window=WINDOW, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.window = max(1, int(window))
+        self.timeout = timeout
+        self.sock = None
+        self._tids = itertools.count(1)
+        self._buf = bytearray()
+        self.timeouts = 0   # transactions that got no response in time
+        self.strays = 0     # responses whose transaction had already timed out (or was never sent)
+
+    def connect(self):
+        if self.sock is None:
+            try:
+                self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            except OSError:
+                return False
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sock.setblocking(False)
+            self._buf.clear()
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        if not self.connect():
+            raise ConnectionException(f"{self.host}:{self.port}")
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _next_tid(self, pending):
+        # 16-bit ids wrap; skip any still in flight
+        while True:
+            tid = next(self._tids) & 0xFFFF
+            if tid and tid not in pending:
+                return tid
+
+    def transact(self, requests):
+        """Yield (index, Response) for [(unit, pdu)] in completion order, `window` at a time."""
+        if not self.connect():
+            raise ConnectionException(f"Unable to connect to {self.host}:{self.port}")
+        requests = iter(enumerate(requests))
+        pending = {}   # tid -> (index, function code, deadline)
+        exhausted = False
+        sel = selectors.DefaultSelector()
+        sel.register(self.sock, selectors.EVENT_READ)
+        try:
+            while True:
+                if not exhausted and len(pending) < self.window:
+                    out = bytearray()
+                    deadline = time.monotonic() + self.timeout
+                    for index, (unit, pdu) in itertools.islice(requests, self.window - len(pending)):
+                        tid = self._next_tid(pending)
+                        pending[tid] = (index, pdu[0], deadline)
+                        out += MBAP.pack(tid, 0, len(pdu) + 1, unit) + pdu
+                    if out:
+                        self._send(out)
+                    else:
+                        exhausted = True
+                if not pending:
+                    return
+                wait = min(d for _, _, d in pending.values()) - time.monotonic()
+                if wait > 0 and sel.select(wait):
+                    self._recv()
+                for tid, pdu in self._frames():
+                    entry = pending.pop(tid, None)
+                    if entry is None:
+                        self.strays += 1
+                    else:
+                        yield entry[0], decode_response(pdu)
+                now = time.monotonic()
+                for tid in [t for t, (_, _, d) in pending.items() if d <= now]:
+                    index, fc, _ = pending.pop(tid)
+                    self.timeouts += 1
+                    yield index, Response(fc, timed_out=True)
+        finally:
+            sel.close()
+
+    def _send(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                sent = self.sock.send(view)
+            except BlockingIOError:
+                # Send buffer full: wait until the server has read some of it
+                select.select([], [self.sock], [], self.timeout)
+                continue
+            except OSError as e:
+                self.close()
+                raise ConnectionException(str(e))
+            view = view[sent:]
+
+    def _recv(self):
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.close()
+            raise ConnectionException(str(e))
+        if not data:
+            self.close()
+            raise ConnectionException(f"{self.host}:{self.port} closed the connection")
+        self._buf += data
+
+    def _frames(self):
+        buf = self._buf
+        pos = 0
+        while len(buf) - pos >= MBAP.size:
+            tid, _, length, _ = MBAP.unpack_from(buf, pos)
+            end = pos + 6 + length
+            if len(buf) < end:
+                break
+            yield tid, bytes(buf[pos + MBAP.size:end])
+            pos = end
+        del buf[:pos]
+
+    def call_many(self, calls):
+        """Pipeline [(method, kwargs)] pymodbus-style calls; responses in call order."""
+        requests = []
+        for method, kw in calls:
+            kw = dict(kw)
+            unit = kw.pop("slave", 1)
+            requests.append((unit, encode_request(method, **kw)))
+        out = [None] * len(requests)
+        for index, response in self.transact(requests):
+            out[index] = response
+        return out
+
+    def _call(self, method, **kw):
+        return self.call_many([(method, kw)])[0]
+
+    def read_coils(self, address, count=1, slave=1):
+        return self._call("read_coils", address=address, count=count, slave=slave)
+
+    def read_discrete_inputs(self, address, count=1, slave=1):
+        return self._call("read_discrete_inputs", address=address, count=count, slave=slave)
+
+    def read_holding_registers(self, address, count=1, slave=1):
+        return self._call("read_holding_registers", address=address, count=count, slave=slave)
+
+    def read_input_registers(self, address, count=1, slave=1):
+        return self._call("read_input_registers", address=address, count=count, slave=slave)
+
+    def write_coil(self, address, value, slave=1):
+        return self._call("write_coil", address=address, value=value, slave=slave)
+
+    def write_register(self, address, value, slave=1):
+        return self._call("write_register", address=address, value=value, slave=slave)
+
+    def write_registers(self, address, values, slave=1):
+        return self._call("write_registers", address=address, values=values, slave=slave)
+
+
+def throughput(host, port, window, n_requests, slave=1, count=5):
+    """Holding-register reads per second over one connection with `window` in flight."""
+    calls = [("read_holding_registers", {"address": 0, "count": count, "slave": slave})] * n_requests
+    with PipelinedClient(host, port, window=window) as client:
+        client.call_many(calls[:window])   # warm-up
+        t0 = time.perf_counter()
+        responses = client.call_many(calls)
+        elapsed = time.perf_counter() - t0
+    errors = sum(r.isError() for r in responses)
+    return n_requests / elapsed, errors
+
+
+def main():
+    p = argparse.ArgumentParser(description="Measure pipelined Modbus read throughput per window size")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=5020)
+    p.add_argument("--slave", type=int, default=1)
+    p.add_argument("--windows", default="1,2,4,8,16,32", help="comma-separated window sizes")
+    p.add_argument("-n", "--requests", type=int, default=2000, help="reads per window size")
+    args = p.parse_args()
+    base = None
+    print(f"{'window':>6s} {'req/s':>10s} {'speedup':>8s} {'errors':>7s}")
+    for window in (int(w) for w in args.windows.split(",")):
+        rate, errors = throughput(args.host, args.port, window, args.requests, args.slave)
+        base = base or rate
+        print(f"{window:6d} {rate:10,.0f} {rate / base:7.1f}x {errors:7d}")
+
+
+if __name__ == "__main__":
+    main()
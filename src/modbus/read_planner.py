@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+read_planner.py
+
+Plans the Modbus reads for a declarative point list. Each point names a
+table (coil, discrete, holding, input), an address, a type (bool, uint16,
+int16, uint32, int32, float32; 32-bit types span two registers, high word
+first) and optional scale/offset. Points of one table are sorted and merged
+into blocks, letting a block absorb gaps of up to MAX_GAP_REGISTERS /
+MAX_GAP_BITS unused addresses (reading a few spare registers is far cheaper
+than another round trip) while staying within the protocol limits of 125
+registers / 2000 bits per request. A poll then costs one request per block
+instead of one per point, and each response is scattered back into a float
+array aligned with the point list.
+
+Point lists can be JSON: a list of points, or {device: [points], "default": [points]}.
+
+    [{"name": "reg_temp", "table": "holding", "address": 0},
+     {"name": "flow",     "table": "input",   "address": 10, "type": "float32", "scale": 0.1},
+     {"name": "coil_1",   "table": "coil",    "address": 1}]
+
+    python -m src.modbus.read_planner points.json [--device plc]    # print the plan
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+MAX_GAP_REGISTERS = 16    # unused registers a block may span to save a request
+MAX_GAP_BITS      = 256   # same for coils / discrete inputs (1/16 of a register each)
+
+# table -> (client method, max count per request, bit table)
+TABLES = {
+    "coil":     ("read_coils",             2000, True),
+    "discrete": ("read_discrete_inputs",   2000, True),
+    "holding":  ("read_holding_registers", 125,  False),
+    "input":    ("read_input_registers",   125,  False),
+}
+TABLE_ALIASES = {"co": "coil", "coils": "coil", "di": "discrete", "hr": "holding", "ir": "input"}
+TYPE_WIDTH = {"bool": 1, "uint16": 1, "int16": 1, "uint32": 2, "int32": 2, "float32": 2}
+
+
+class Point:
+    """One value to poll; `width` is the number of addresses it occupies."""
+
+    __slots__ = ("name", "table", "address", "type", "scale", "offset", "width")
+
+    def __init__(self, name, table, address, type=None, scale=1.0, offset=0.0):
+        table = TABLE_ALIASES.get(table, table)
+        if table not in TABLES:
+            raise ValueError(f"{name}: unknown table {table!r}")
+        bits = TABLES[table][2]
+        type = type or ("bool" if bits else "uint16")
+        if type not in TYPE_WIDTH:
+            raise ValueError(f"{name}: unknown type {type!r}")
+        if bits != (type == "bool"):
+            raise ValueError(f"{name}: {type} points cannot live in the {table} table")
+        if not 0 <= int(address) <= 0xFFFF:
+            raise ValueError(f"{name}: address {address} out of range")
+        self.name = str(name)
+        self.table = table
+        self.address = int(address)
+        self.type = type
+        self.scale = float(scale)
+        self.offset = float(offset)
+        self.width = TYPE_WIDTH[type]
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["name"], d.get("table", "holding"), d["address"], d.get("type"),
+                   d.get("scale", 1.0), d.get("offset", 0.0))
+
+    def __repr__(self):
+        return f"Point({self.name!r}, {self.table!r}, {self.address}, {self.type!r})"
+
+
+class Block:
+    """One read request and where its values go."""
+
+    __slots__ = ("table", "start", "count", "_groups")
+
+    def __init__(self, table, start, count, members):
+        self.table = table
+        self.start = start
+        self.count = count
+        # type -> (indices into the value array, offsets into the response)
+        groups = {}
+        for index, point in members:
+            dest, pos = groups.setdefault(point.type, ([], []))
+            dest.append(index)
+            pos.append(point.address - start)
+        self._groups = [(t, np.array(d, dtype=np.intp), np.array(p, dtype=np.intp))
+                        for t, (d, p) in groups.items()]
+
+    def scatter(self, raw, out):
+        """Decode a response (bits or registers) into out[index] for every member."""
+        if TABLES[self.table][2]:
+            bits = np.asarray(raw[:self.count], dtype=bool)
+            for _, dest, pos in self._groups:
+                out[dest] = bits[pos]
+            return
+        regs = np.asarray(raw[:self.count], dtype=np.uint16)
+        for kind, dest, pos in self._groups:
+            if kind == "uint16":
+                out[dest] = regs[pos]
+            elif kind == "int16":
+                out[dest] = regs.view(np.int16)[pos]
+            else:
+                words = (regs[pos].astype(np.uint32) << 16) | regs[pos + 1]
+                out[dest] = words if kind == "uint32" else words.view(np.int32 if kind == "int32" else np.float32)
+
+    def __repr__(self):
+        return f"Block({self.table}, start={self.start}, count={self.count})"
+
+
+def plan_blocks(points, max_gap_registers=MAX_GAP_REGISTERS, max_gap_bits=MAX_GAP_BITS):
+    """Fewest blocks covering `points`: greedy left-to-right merge per table."""
+    by_table = {}
+    for index, point in enumerate(points):
+        by_table.setdefault(point.table, []).append((index, point))
+    blocks = []
+    for table in TABLES:
+        members = sorted(by_table.get(table, ()), key=lambda m: m[1].address)
+        if not members:
+            continue
+        _, limit, bits = TABLES[table]
+        max_gap = max_gap_bits if bits else max_gap_registers
+        current = [members[0]]
+        start, end = members[0][1].address, members[0][1].address + members[0][1].width
+        for index, point in members[1:]:
+            p_end = point.address + point.width
+            if point.address - end <= max_gap and max(end, p_end) - start <= limit:
+                current.append((index, point))
+                end = max(end, p_end)
+                continue
+            blocks.append(Block(table, start, end - start, current))
+            current = [(index, point)]
+            start, end = point.address, p_end
+        blocks.append(Block(table, start, end - start, current))
+    return blocks
+
+
+class ReadPlan:
+    """Point list compiled into blocks; read() polls a device in len(blocks) requests."""
+
+    def __init__(self, points, max_gap_registers=MAX_GAP_REGISTERS, max_gap_bits=MAX_GAP_BITS):
+        self.points = [p if isinstance(p, Point) else Point.from_dict(p) for p in points]
+        names = [p.name for p in self.points]
+        if len(set(names)) != len(names):
+            raise ValueError("point names must be unique")
+        self.names = names
+        self.blocks = plan_blocks(self.points, max_gap_registers, max_gap_bits)
+        self.scale = np.array([p.scale for p in self.points])
+        self.offset = np.array([p.offset for p in self.points])
+        self._scaled = bool(np.any(self.scale != 1.0) or np.any(self.offset != 0.0))
+        self.failed_blocks = 0
+
+    def __len__(self):
+        return len(self.points)
+
+    def index(self, names):
+        """Positions of `names` in the value array (KeyError if one is missing)."""
+        lookup = {n: i for i, n in enumerate(self.names)}
+        return [lookup[n] for n in names]
+
+    def decode(self, responses):
+        """[raw bits/registers per block] -> scaled float array; None responses give NaN."""
+        out = np.full(len(self.points), np.nan)
+        for block, raw in zip(self.blocks, responses):
+            if raw is not None:
+                block.scatter(raw, out)
+        if self._scaled:
+            out = out * self.scale + self.offset
+        return out
+
+    def read(self, client, slave=1):
+        """Poll every block; values of blocks that returned an error are NaN.
+
+        Connection errors (pymodbus ModbusException) propagate to the caller.
+        A PipelinedClient (src/modbus/pipeline.py) gets every block in one
+        call_many(), so the poll costs about one round trip instead of one per block.
+        """
+        calls = [(TABLES[block.table][0], {"address": block.start, "count": block.count, "slave": slave})
+                 for block in self.blocks]
+        if hasattr(client, "call_many"):
+            results = client.call_many(calls)
+        else:
+            results = [getattr(client, method)(**kw) for method, kw in calls]
+        responses = []
+        for block, rr in zip(self.blocks, results):
+            if rr.isError():
+                self.failed_blocks += 1
+                responses.append(None)
+            else:
+                responses.append(rr.bits if TABLES[block.table][2] else rr.registers)
+        return self.decode(responses)
+
+    def describe(self):
+        lines = [f"{len(self.points)} points in {len(self.blocks)} requests"]
+        for block in self.blocks:
+            lines.append(f"  {TABLES[block.table][0]}(address={block.start}, count={block.count})")
+        return "\n".join(lines)
+
+
+def load_points(path, device="default"):
+    """Point dicts for `device` from a JSON point list."""
+    with open(path) as f:
+        spec = json.load(f)
+    if isinstance(spec, dict):
+        if device in spec:
+            spec = spec[device]
+        elif "default" in spec:
+            spec = spec["default"]
+        else:
+            raise KeyError(f"{path} has no points for {device!r} and no default")
+    return [Point.from_dict(d) for d in spec]
+
+
+def main():
+    p = argparse.ArgumentParser(description="Show the Modbus requests planned for a point list")
+    p.add_argument("points", help="JSON point list")
+    p.add_argument("--device", default="default")
+    p.add_argument("--max-gap", type=int, default=MAX_GAP_REGISTERS, help="register gap to bridge")
+    args = p.parse_args()
+    plan = ReadPlan(load_points(args.points, args.device), max_gap_registers=args.max_gap)
+    print(plan.describe())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+"""
+rollup.py
+
+Multi-resolution aggregates of the register history (src/storage/tsdb.py)
+for long time ranges. Each series keeps 1 s, 1 min and 1 h buckets. Every
+bucket holds count, sum (for the mean), min, max and last per field, plus
+the number of anomalous frames (alerts from the SHAP store,
+src/detection/shap_store.py, each weighted by the frames it stands for) for
+that device. The pseudo-series "*" counts the anomalies of every device.
+
+refresh() folds only what arrived since the last call: the TSDB blocks after
+each series' watermark and the SHAP records after the alert watermark. Each
+fold merges into the tail buckets only, so its cost follows the new data.
+Fine levels are trimmed to RETENTION. The state is pickled to
+ROLLUP_DIR every SAVE_INTERVAL, so a restart resumes from the watermarks.
+
+query() picks the coarsest resolution that still gives at least one bucket
+per plotted point over the requested range (and still covers it), so a week
+at 10 Hz is drawn from a few thousand 1 min buckets instead of six million
+rows. Ranges too short for 1 s buckets are read raw from the TSDB.
+
+    python -m src.storage.rollup refresh
+    python -m src.storage.rollup query <series> --start ... --end ... [--points 2400]
+"""
+
+import argparse
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.detection.shap_store import record_frames
+from src.storage.tsdb import TSDB, TS_SCALE, local_datetimes, parse_time
+
+ROLLUP_DIR    = os.getenv("ROLLUP_DIR", "data/cache/rollups")
+RESOLUTIONS   = (1, 60, 3600)                               # seconds per bucket
+RETENTION     = {1: 6 * 3600, 60: 90 * 86400, 3600: None}  # seconds kept (None: forever)
+SAVE_INTERVAL = 60.0
+ALL_SERIES    = "*"
+ALERT_CHUNK   = 100_000
+STATE_VERSION = 2
+
+
+class Rollup:
+    """Buckets of one resolution, sorted by bucket index."""
+
+    def __init__(self, resolution, n_fields, retention=None):
+        self.resolution = resolution
+        self.retention = retention
+        self.cols = _empty(n_fields)
+
+    def __len__(self):
+        return len(self.cols["bucket"])
+
+    def add_field(self):
+        n = len(self)
+        for name, fill in (("count", 0), ("sum", 0.0), ("min", np.nan), ("max", np.nan), ("last", np.nan)):
+            col = self.cols[name]
+            self.cols[name] = np.hstack([col, np.full((n, 1), fill, dtype=col.dtype)])
+
+    def fold(self, t, values=None, anomalies=None):
+        """Merge rows (epoch seconds, (n, fields) values) or alert times (values None)."""
+        if not len(t):
+            return
+        new = _reduce(self._partials(np.asarray(t, dtype=np.float64), values, anomalies))
+        split = np.searchsorted(self.cols["bucket"], new["bucket"][0])
+        head = {k: v[:split] for k, v in self.cols.items()}
+        tail = {k: v[split:] for k, v in self.cols.items()}
+        merged = _reduce(_concat(tail, new)) if len(tail["bucket"]) else new
+        self.cols = _concat(head, merged)
+        if self.retention is not None:
+            keep = self.cols["bucket"] >= self.cols["bucket"][-1] - self.retention // self.resolution
+            if not keep.all():
+                self.cols = {k: v[keep] for k, v in self.cols.items()}
+
+    def _partials(self, t, values, anomalies):
+        n, n_fields = len(t), self.cols["count"].shape[1]
+        if values is None:
+            # Alerts: they count, but carry no values and never become "last"
+            values = np.full((n, n_fields), np.nan)
+            last_t = np.full(n, -np.inf)
+            anomalies = np.ones(n, dtype=np.int64) if anomalies is None else anomalies
+        else:
+            values = np.asarray(values, dtype=np.float64).reshape(n, n_fields)
+            last_t = t
+            anomalies = np.zeros(n, dtype=np.int64) if anomalies is None else anomalies
+        valid = ~np.isnan(values)
+        return {
+            "bucket": np.floor(t / self.resolution).astype(np.int64),
+            "last_t": last_t,
+            "count": valid.astype(np.int64),
+            "sum": np.where(valid, values, 0.0),
+            "min": values,
+            "max": values,
+            "last": values,
+            "anomalies": np.asarray(anomalies, dtype=np.int64),
+        }
+
+    def covers(self, t):
+        """True if buckets from time `t` on are still retained."""
+        return len(self) > 0 and self.cols["bucket"][0] <= np.floor(t / self.resolution)
+
+    def slice(self, start=None, end=None):
+        b = self.cols["bucket"]
+        lo = 0 if start is None else np.searchsorted(b, np.floor(start / self.resolution), "left")
+        hi = len(b) if end is None else np.searchsorted(b, np.floor(end / self.resolution), "right")
+        return {k: v[lo:hi] for k, v in self.cols.items()}
+
+
+def _empty(n_fields):
+    return {
+        "bucket": np.zeros(0, dtype=np.int64),
+        "last_t": np.zeros(0),
+        "count": np.zeros((0, n_fields), dtype=np.int64),
+        "sum": np.zeros((0, n_fields)),
+        "min": np.zeros((0, n_fields)),
+        "max": np.zeros((0, n_fields)),
+        "last": np.zeros((0, n_fields)),
+        "anomalies": np.zeros(0, dtype=np.int64),
+    }
+
+
+def _concat(a, b):
+    return {k: np.concatenate([a[k], b[k]]) for k in a}
+
+
+def _reduce(parts):
+    """Combine partial aggregates that share a bucket; the newest `last` wins."""
+    order = np.lexsort((parts["last_t"], parts["bucket"]))
+    p = {k: v[order] for k, v in parts.items()}
+    starts = np.flatnonzero(np.r_[True, np.diff(p["bucket"]) != 0])
+    ends = np.r_[starts[1:], len(order)] - 1
+    return {
+        "bucket": p["bucket"][starts],
+        "last_t": p["last_t"][ends],
+        "count": np.add.reduceat(p["count"], starts, axis=0),
+        "sum": np.add.reduceat(p["sum"], starts, axis=0),
+        "min": np.fmin.reduceat(p["min"], starts, axis=0),
+        "max": np.fmax.reduceat(p["max"], starts, axis=0),
+        "last": p["last"][ends],
+        "anomalies": np.add.reduceat(p["anomalies"], starts),
+    }
+
+
+class SeriesRollups:
+    """All resolutions of one series; fields are added as they appear."""
+
+    def __init__(self, fields=()):
+        self.fields = list(fields)
+        self.first = None   # earliest time folded (epoch seconds)
+        self.levels = {res: Rollup(res, len(self.fields), RETENTION.get(res)) for res in RESOLUTIONS}
+
+    def _columns(self, names):
+        for name in names:
+            if name not in self.fields:
+                self.fields.append(name)
+                for level in self.levels.values():
+                    level.add_field()
+        index = {f: i for i, f in enumerate(self.fields)}
+        return [index[n] for n in names]
+
+    def fold(self, t, cols):
+        """Rows: epoch seconds and {field: values}."""
+        idx = self._columns(list(cols))
+        values = np.full((len(t), len(self.fields)), np.nan)
+        for j, name in zip(idx, cols):
+            values[:, j] = cols[name]
+        for level in self.levels.values():
+            level.fold(t, values)
+        self._seen(t)
+
+    def fold_anomalies(self, t, frames=None):
+        """Alert times, each counting `frames` anomalies (default 1)."""
+        for level in self.levels.values():
+            level.fold(t, anomalies=frames)
+        self._seen(t)
+
+    def _seen(self, t):
+        if len(t):
+            first = float(np.min(t))
+            self.first = first if self.first is None else min(self.first, first)
+
+    def choose(self, start, end, n_points):
+        """Coarsest resolution with >= n_points buckets over [start, end] that is
+        still retained there; 0 if even 1 s buckets would be too coarse (read raw)."""
+        first = self.first
+        if first is None:
+            return 0
+        start = max(start, first)
+        span = max(end - start, 0)
+        if span / RESOLUTIONS[0] < n_points:
+            return 0
+        retained = [res for res in RESOLUTIONS if self.levels[res].covers(start)]
+        fine_enough = [res for res in retained if span / res >= n_points]
+        if fine_enough:
+            return max(fine_enough)
+        return min(retained) if retained else RESOLUTIONS[-1]
+
+    def frame(self, resolution, start=None, end=None, factor=1):
+        """Buckets as a DataFrame: timestamp (bucket start), per field mean/min/max/count/last, anomalies.
+
+        factor > 1 merges that many consecutive buckets, for ranges where the
+        chosen level still has far more buckets than points to draw.
+        """
+        cols = self.levels[resolution].slice(start, end)
+        if factor > 1 and len(cols["bucket"]):
+            cols = _reduce({**cols, "bucket": cols["bucket"] // factor})
+            resolution *= factor
+        data = {"timestamp": local_datetimes(cols["bucket"] * resolution)}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = cols["sum"] / cols["count"]
+        for j, name in enumerate(self.fields):
+            data[name] = mean[:, j]
+            data[f"{name}_min"] = cols["min"][:, j]
+            data[f"{name}_max"] = cols["max"][:, j]
+            data[f"{name}_count"] = cols["count"][:, j]
+            data[f"{name}_last"] = cols["last"][:, j]
+        data["anomalies"] = cols["anomalies"]
+        return pd.DataFrame(data)
+
+
+class RollupStore:
+    """Rollups of every TSDB series plus anomaly counts, kept in step by refresh()."""
+
+    def __init__(self, tsdb=None, shap_store=None, root=ROLLUP_DIR):
+        self.db = tsdb or TSDB()
+        self.shap_store = shap_store
+        self.root = root
+        self.series = {}      # name -> SeriesRollups
+        self.watermarks = {}  # name -> TSDB blocks folded
+        self.alert_rows = 0   # SHAP records folded
+        self._saved = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def path(self):
+        return os.path.join(self.root, "rollups.pkl")
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return
+        if state.get("version") != STATE_VERSION or state.get("resolutions") != RESOLUTIONS:
+            return
+        self.series = state["series"]
+        self.watermarks = state["watermarks"]
+        self.alert_rows = state["alert_rows"]
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}"
+        with self._lock:
+            state = {"version": STATE_VERSION, "resolutions": RESOLUTIONS, "series": self.series,
+                     "watermarks": self.watermarks, "alert_rows": self.alert_rows}
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self._saved = time.time()
+
+    def refresh(self, save=True):
+        """Fold TSDB blocks and alerts that arrived since the last call; returns self."""
+        changed = False
+        with self._lock:
+            for name in self.db.series():
+                blocks = self.db.blocks(name)
+                if not blocks and name not in self.series:
+                    continue   # writer has not flushed yet; its name is known once it has
+                done = self.watermarks.get(name, 0)
+                if len(blocks) < done:
+                    # Series was rewritten: rebuild it
+                    self.series.pop(name, None)
+                    done = 0
+                rollups = self.series.setdefault(name, SeriesRollups())
+                for _, t, cols in self.db.read_blocks(name, blocks[done:]):
+                    rollups.fold(t / TS_SCALE, cols)
+                    changed = True
+                self.watermarks[name] = len(blocks)
+            changed |= self._fold_alerts()
+        if save and changed and time.time() - self._saved > SAVE_INTERVAL:
+            self.save()
+        return self
+
+    def _fold_alerts(self):
+        if self.shap_store is None:
+            return False
+        agg = self.shap_store.refresh().aggregates
+        n = agg.rows if agg is not None else 0
+        if n < self.alert_rows:
+            # SHAP store was reset: anomaly counts start over
+            for rollups in self.series.values():
+                for level in rollups.levels.values():
+                    level.cols["anomalies"][:] = 0
+            self.alert_rows = 0
+        if n == self.alert_rows:
+            return False
+        while self.alert_rows < n:
+            recs = self.shap_store.records(self.alert_rows, min(n, self.alert_rows + ALERT_CHUNK))
+            if not len(recs):
+                break
+            # Detectors store only sampled frames; each counts the frames it stands for
+            frames = record_frames(recs)
+            self.series.setdefault(ALL_SERIES, SeriesRollups()).fold_anomalies(recs["ts"], frames)
+            devices, inv = np.unique(recs["device"], return_inverse=True)
+            for j, raw in enumerate(devices):
+                sel = inv == j
+                self.series.setdefault(raw.decode(), SeriesRollups()).fold_anomalies(recs["ts"][sel], frames[sel])
+            self.alert_rows += len(recs)
+        return True
+
+    def query(self, series, start=None, end=None, n_points=2400):
+        """(resolution, DataFrame) for [start, end] (epoch seconds, None = open).
+
+        Resolution 0 means raw TSDB rows (timestamp plus one column per field);
+        otherwise the frame is SeriesRollups.frame() with buckets of that many
+        seconds, at most about 2 * n_points of them.
+        """
+        with self._lock:
+            covered = self.span(series)
+            if covered is not None:
+                rollups = self.series[series]
+                lo = covered[0] if start is None else max(start, covered[0])
+                hi = covered[1] if end is None else min(end, covered[1])
+                resolution = rollups.choose(lo, hi, n_points)
+                if resolution:
+                    factor = max(1, int((hi - lo) / resolution // n_points))
+                    return resolution * factor, rollups.frame(resolution, start, end, factor)
+        return 0, self.db.frame(series, start, end)
+
+    def span(self, series):
+        """(first, last) epoch seconds covered by a series' rollups, or None."""
+        rollups = self.series.get(series)
+        if rollups is None or rollups.first is None:
+            return None
+        finest = rollups.levels[RESOLUTIONS[0]]
+        return rollups.first, (finest.cols["bucket"][-1] + 1) * finest.resolution
+
+
+def main():
+    p = argparse.ArgumentParser(description="Multi-resolution rollups of the register history")
+    p.add_argument("--root", default=ROLLUP_DIR)
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("refresh", help="fold new history and alerts, then save")
+    q = sub.add_parser("query", help="print the buckets chosen for a range")
+    q.add_argument("series")
+    q.add_argument("--start")
+    q.add_argument("--end")
+    q.add_argument("--points", type=int, default=2400)
+    args = p.parse_args()
+
+    from src.detection.shap_store import ShapStore
+
+    store = RollupStore(shap_store=ShapStore(), root=args.root)
+    t0 = time.perf_counter()
+    store.refresh(save=False)
+    store.save()
+    if args.cmd == "refresh":
+        for name, rollups in sorted(store.series.items()):
+            sizes = ", ".join(f"{res}s: {len(level):,}" for res, level in rollups.levels.items())
+            print(f"{name}: fields {rollups.fields}; buckets {sizes}")
+        print(f"Refreshed in {time.perf_counter() - t0:.2f}s -> {store.path}")
+    else:
+        resolution, df = store.query(args.series, parse_time(args.start), parse_time(args.end), args.points)
+        print(f"{len(df):,} rows at {'raw' if resolution == 0 else f'{resolution}s'} resolution")
+        print(df.head(10).to_string())
+
+
+if __name__ == "__main__":
+    main()
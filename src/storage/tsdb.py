@@ -0,0 +1,541 @@
+#!/usr/bin/env python
+"""
+tsdb.py
+
+Embedded, append-only time-series store for per-device register streams.
+Each series is one file, data/tsdb/<series>.tsdb, holding a sequence of
+self-describing blocks of up to BLOCK_ROWS rows:
+
+    header   magic, rows, t_min, t_max (ms), meta length, payload length
+    meta     JSON: series name as written, field names and per-field min/max
+    payload  timestamps: first value, first delta, then delta-of-deltas
+             each field:  integer columns as deltas, float columns as the XOR
+                          of consecutive IEEE-754 bit patterns (common trailing
+                          zero bits dropped)
+
+Delta-of-deltas and deltas are zigzag-mapped and bit-packed at the smallest
+width that fits the block. Regular polls therefore cost a few bits per
+timestamp, and slowly moving registers a few bits per value.
+
+Writers buffer rows and append whole blocks with one O_APPEND write. Several
+processes can write to the same series, and blocks may carry different
+field lists. Each writer holds a shared flock on the series file; a new
+writer cuts off a partial block left by a crash (or a corrupt header, with
+a warning) only if it can take the lock exclusively, so it never truncates
+a block another writer is still appending.
+
+File names are the series name with characters outside [A-Za-z0-9_.-]
+replaced; TSDB.series() reports the name as written, so it matches the
+device names detectors use elsewhere (SHAP store, alerts). Readers build the
+block index (time range, fields, min/max) from the headers alone and only
+decode the blocks a scan needs. A scan can also prune blocks by value range.
+
+    writer = SeriesWriter("192.168.64.1:502", ["reg0", "reg1"])
+    writer.append(time.time(), [101, 97]); writer.close()
+    df = TSDB().frame("192.168.64.1:502", start=t0, end=t1)
+
+    python -m src.storage.tsdb import data/raw/baseline.csv --series baseline
+    python -m src.storage.tsdb info
+    python -m src.storage.tsdb export baseline -o baseline.csv [--start ... --end ...]
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import re
+import struct
+import time
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+
+TSDB_DIR      = os.getenv("TSDB_DIR", "data/tsdb")
+BLOCK_ROWS    = 1024    # rows per block
+FLUSH_SECONDS = 30.0    # longest a row waits in a writer's buffer
+TS_SCALE      = 1000    # stored timestamp units per second (ms)
+MAGIC         = b"TSB1"
+HEADER        = struct.Struct("<4sIqqII")   # magic, rows, t_min, t_max, meta bytes, payload bytes
+COLUMN        = struct.Struct("<BBBq")      # kind, bit width, shift, first value (raw int64 bits)
+INT, FLOAT    = 0, 1
+SUFFIX        = ".tsdb"
+
+
+def series_path(series, root=TSDB_DIR):
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]", "_", str(series)) + SUFFIX)
+
+
+# --- Bit-level column codecs ---------------------------------------------------
+
+def _zigzag(x):
+    x = x.astype(np.int64)
+    return ((x << 1) ^ (x >> 63)).view(np.uint64)
+
+
+def _unzigzag(u):
+    u = u.astype(np.uint64)
+    return (u >> np.uint64(1)).view(np.int64) ^ -(u & np.uint64(1)).view(np.int64)
+
+
+def _width(u):
+    top = int(u.max()) if len(u) else 0
+    return top.bit_length()
+
+
+def _pack(u, width):
+    """uint64 array -> bytes holding the low `width` bits of every value."""
+    if width == 0 or not len(u):
+        return b""
+    bits = np.unpackbits(u.astype(">u8").view(np.uint8).reshape(-1, 8), axis=1)[:, 64 - width:]
+    return np.packbits(bits.ravel()).tobytes()
+
+
+def _unpack(buf, n, width):
+    if width == 0 or n == 0:
+        return np.zeros(n, dtype=np.uint64)
+    bits = np.unpackbits(np.frombuffer(buf, dtype=np.uint8), count=n * width).reshape(n, width)
+    full = np.zeros((n, 64), dtype=np.uint8)
+    full[:, 64 - width:] = bits
+    return np.packbits(full, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def _packed_len(n, width):
+    return (n * width + 7) // 8
+
+
+def encode_timestamps(t):
+    """int64 timestamps -> first value, first delta, bit-packed delta-of-deltas."""
+    t = np.asarray(t, dtype=np.int64)
+    first = int(t[0])
+    d0 = int(t[1] - t[0]) if len(t) > 1 else 0
+    dod = _zigzag(np.diff(t, n=2)) if len(t) > 2 else np.zeros(0, dtype=np.uint64)
+    width = _width(dod)
+    return struct.pack("<qqB", first, d0, width) + _pack(dod, width)
+
+
+def decode_timestamps(buf, pos, n):
+    first, d0, width = struct.unpack_from("<qqB", buf, pos)
+    pos += 17
+    size = _packed_len(max(n - 2, 0), width)
+    dod = _unzigzag(_unpack(buf[pos:pos + size], max(n - 2, 0), width))
+    deltas = np.concatenate([[d0], d0 + np.cumsum(dod)]) if n > 1 else np.zeros(0, dtype=np.int64)
+    t = np.concatenate([[first], first + np.cumsum(deltas[:n - 1])]).astype(np.int64)
+    return t, pos + size
+
+
+def encode_column(v):
+    """float64 column -> bytes; integral columns are delta coded, others XOR coded."""
+    v = np.asarray(v, dtype=np.float64)
+    if np.isfinite(v).all() and (v == np.round(v)).all() and np.abs(v).max() < 2 ** 53:
+        ints = v.astype(np.int64)
+        u = _zigzag(np.diff(ints))
+        width = _width(u)
+        return COLUMN.pack(INT, width, 0, int(ints[0])) + _pack(u, width)
+    bits = v.view(np.uint64)
+    x = bits[1:] ^ bits[:-1]
+    shift = 0
+    nz = x[x != 0]
+    if len(nz):
+        # Trailing zero bits shared by every XOR in the block
+        low = np.bitwise_or.reduce(nz)
+        shift = (int(low) & -int(low)).bit_length() - 1
+        x = x >> np.uint64(shift)
+    width = _width(x)
+    return COLUMN.pack(FLOAT, width, shift, int(bits[0].view(np.int64))) + _pack(x, width)
+
+
+def decode_column(buf, pos, n):
+    kind, width, shift, first = COLUMN.unpack_from(buf, pos)
+    pos += COLUMN.size
+    size = _packed_len(n - 1, width)
+    u = _unpack(buf[pos:pos + size], n - 1, width)
+    if kind == INT:
+        out = np.concatenate([[first], first + np.cumsum(_unzigzag(u))]).astype(np.float64)
+    else:
+        x = np.concatenate([[np.int64(first).view(np.uint64)], u << np.uint64(shift)])
+        out = np.bitwise_xor.accumulate(x).view(np.float64)
+    return out, pos + size
+
+
+def encode_block(t_ms, fields, values, series=None):
+    """One block: t_ms int64 (n,), values float64 (n, len(fields))."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+        mins = np.nanmin(values, axis=0)
+        maxs = np.nanmax(values, axis=0)
+    meta = json.dumps({
+        "series": series,
+        "fields": list(fields),
+        "min": [None if np.isnan(m) else float(m) for m in mins],
+        "max": [None if np.isnan(m) else float(m) for m in maxs],
+    }).encode()
+    payload = encode_timestamps(t_ms) + b"".join(encode_column(values[:, j]) for j in range(len(fields)))
+    return HEADER.pack(MAGIC, len(t_ms), int(t_ms.min()), int(t_ms.max()), len(meta), len(payload)) + meta + payload
+
+
+class BlockInfo:
+    __slots__ = ("offset", "rows", "t_min", "t_max", "series", "fields", "min", "max", "payload_offset",
+                 "payload_len")
+
+    def __repr__(self):
+        return f"BlockInfo(offset={self.offset}, rows={self.rows}, t=[{self.t_min}, {self.t_max}])"
+
+
+class CorruptBlock(ValueError):
+    """A block header with a bad magic; `offset` is where the readable blocks end."""
+
+    def __init__(self, path, offset):
+        super().__init__(f"{path}: corrupt block header at offset {offset}")
+        self.offset = offset
+
+
+def read_index(f, offset=0):
+    """BlockInfo for every complete block from `offset`; returns (blocks, end offset)."""
+    blocks = []
+    f.seek(offset)
+    while True:
+        head = f.read(HEADER.size)
+        if len(head) < HEADER.size:
+            break
+        magic, rows, t_min, t_max, meta_len, payload_len = HEADER.unpack(head)
+        if magic != MAGIC:
+            raise CorruptBlock(f.name, offset)
+        meta = f.read(meta_len)
+        end = offset + HEADER.size + meta_len + payload_len
+        if len(meta) < meta_len or os.fstat(f.fileno()).st_size < end:
+            break  # torn tail: a block still being written, or a crash mid-write
+        meta = json.loads(meta)
+        info = BlockInfo()
+        info.offset, info.rows, info.t_min, info.t_max = offset, rows, t_min, t_max
+        info.series = meta.get("series")   # absent in blocks written before it was recorded
+        info.fields = meta["fields"]
+        info.min = [np.nan if m is None else m for m in meta["min"]]
+        info.max = [np.nan if m is None else m for m in meta["max"]]
+        info.payload_offset = offset + HEADER.size + meta_len
+        info.payload_len = payload_len
+        blocks.append(info)
+        offset = end
+        f.seek(offset)
+    return blocks, offset
+
+
+def decode_block(info, payload):
+    t, pos = decode_timestamps(payload, 0, info.rows)
+    cols = {}
+    for name in info.fields:
+        cols[name], pos = decode_column(payload, pos, info.rows)
+    return t, cols
+
+
+# --- Writing -------------------------------------------------------------------
+
+class SeriesWriter:
+    """Buffers rows for one series and appends them as compressed blocks."""
+
+    def __init__(self, series, fields, root=TSDB_DIR, block_rows=BLOCK_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.series = str(series)
+        self.fields = [str(f) for f in fields]
+        if len(set(self.fields)) != len(self.fields):
+            raise ValueError("field names must be unique")
+        self.block_rows = block_rows
+        self.flush_seconds = flush_seconds
+        self.path = series_path(series, root)
+        os.makedirs(root, exist_ok=True)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # Writers hold a shared lock for their lifetime; the tail is only
+        # repaired by a writer that finds no other one on the series
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            pass
+        else:
+            self._truncate_torn_tail()
+        fcntl.flock(self.fd, fcntl.LOCK_SH)
+        self._ts = []
+        self._rows = []
+        self._flushed = time.monotonic()
+
+    def _truncate_torn_tail(self):
+        # A crash mid-write leaves a partial block that would hide every later one
+        with open(self.path, "rb") as f:
+            try:
+                _, end = read_index(f)
+            except CorruptBlock as e:
+                # Nothing past a corrupt header is readable; keep the blocks before it
+                print(f"[WARN] {e}; truncating {self.path} to {e.offset:,} bytes")
+                end = e.offset
+            size = os.fstat(f.fileno()).st_size
+        if end < size:
+            os.truncate(self.path, end)
+
+    def append(self, ts, values):
+        """One row: `ts` in epoch seconds, `values` aligned with fields (NaN for missing)."""
+        self._ts.append(ts)
+        self._rows.append(values)
+        if len(self._ts) >= self.block_rows or time.monotonic() - self._flushed >= self.flush_seconds:
+            self.flush()
+
+    def append_many(self, ts, values):
+        ts = np.asarray(ts, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(ts), len(self.fields))
+        self.flush()
+        for i in range(0, len(ts), self.block_rows):
+            self._write(ts[i:i + self.block_rows], values[i:i + self.block_rows])
+
+    def flush(self):
+        if self._ts:
+            self._write(np.asarray(self._ts, dtype=np.float64),
+                        np.asarray(self._rows, dtype=np.float64).reshape(len(self._ts), len(self.fields)))
+            self._ts, self._rows = [], []
+        self._flushed = time.monotonic()
+
+    def _write(self, ts, values):
+        if len(ts):
+            os.write(self.fd, encode_block(np.round(ts * TS_SCALE).astype(np.int64), self.fields, values,
+                                             self.series))
+
+    def close(self):
+        self.flush()
+        os.close(self.fd)
+
+
+# --- Reading -------------------------------------------------------------------
+
+class TSDB:
+    """Read side: cached block indexes, extended incrementally as series grow."""
+
+    def __init__(self, root=TSDB_DIR):
+        self.root = root
+        self._index = {}   # path -> (scanned offset, [BlockInfo])
+
+    def series(self):
+        """Series names as written (from the first block), else the file name."""
+        if not os.path.isdir(self.root):
+            return []
+        names = []
+        for e in os.scandir(self.root):
+            if e.name.endswith(SUFFIX):
+                stem = e.name[:-len(SUFFIX)]
+                blocks = self.blocks(stem)
+                names.append((blocks[0].series if blocks else None) or stem)
+        return sorted(names)
+
+    def blocks(self, series):
+        path = series_path(series, self.root)
+        offset, blocks = self._index.get(path, (0, []))
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return []
+        if size < offset:
+            offset, blocks = 0, []   # rewritten
+        if size > offset:
+            with open(path, "rb") as f:
+                new, offset = read_index(f, offset)
+            blocks = blocks + new
+            self._index[path] = (offset, blocks)
+        return blocks
+
+    def fields(self, series):
+        seen = {}
+        for b in self.blocks(series):
+            seen.update(dict.fromkeys(b.fields))
+        return list(seen)
+
+    def select(self, series, start=None, end=None, where=None):
+        """Blocks overlapping [start, end] (epoch seconds) whose min/max can satisfy `where`."""
+        lo = -2 ** 63 if start is None else int(np.floor(start * TS_SCALE))
+        hi = 2 ** 63 - 1 if end is None else int(np.ceil(end * TS_SCALE))
+        out = []
+        for b in self.blocks(series):
+            if b.t_max < lo or b.t_min > hi:
+                continue
+            if where and not all(_may_match(b, name, rng) for name, rng in where.items()):
+                continue
+            out.append(b)
+        return out
+
+    def read_blocks(self, series, blocks):
+        """Yield (BlockInfo, stored int timestamps, {field: values}) for each of `blocks`."""
+        if not blocks:
+            return
+        with open(series_path(series, self.root), "rb") as f:
+            for b in blocks:
+                f.seek(b.payload_offset)
+                t, cols = decode_block(b, f.read(b.payload_len))
+                yield b, t, cols
+
+    def scan(self, series, start=None, end=None, fields=None, where=None):
+        """(timestamps in epoch seconds, {field: float64 array}) for rows in [start, end], time-ordered.
+
+        `where` is {field: (lo, hi)} (either bound may be None): blocks whose
+        min/max exclude the range are skipped without decoding, and only rows
+        inside every range are returned.
+        """
+        blocks = self.select(series, start, end, where)
+        names = list(fields) if fields is not None else self.fields(series)
+        decode = names + [n for n in (where or {}) if n not in names]
+        ts_parts, col_parts = [], {n: [] for n in decode}
+        for b, t, cols in self.read_blocks(series, blocks):
+            ts_parts.append(t)
+            for n in decode:
+                col_parts[n].append(cols.get(n, np.full(b.rows, np.nan)))
+        if not ts_parts:
+            return np.zeros(0), {n: np.zeros(0) for n in names}
+        t = np.concatenate(ts_parts)
+        cols = {n: np.concatenate(parts) for n, parts in col_parts.items()}
+        mask = np.ones(len(t), dtype=bool)
+        if start is not None:
+            mask &= t >= int(np.floor(start * TS_SCALE))
+        if end is not None:
+            mask &= t <= int(np.ceil(end * TS_SCALE))
+        for name, (lo, hi) in (where or {}).items():
+            if lo is not None:
+                mask &= cols[name] >= lo
+            if hi is not None:
+                mask &= cols[name] <= hi
+        t = t[mask]
+        cols = {n: cols[n][mask] for n in names}
+        if (np.diff(t) < 0).any():
+            # Blocks from concurrent writers may interleave in time
+            order = np.argsort(t, kind="stable")
+            t, cols = t[order], {n: c[order] for n, c in cols.items()}
+        return t / TS_SCALE, cols
+
+    def frame(self, series, start=None, end=None, fields=None, where=None):
+        """scan() as a DataFrame with a datetime 'timestamp' column first."""
+        t, cols = self.scan(series, start, end, fields, where)
+        df = pd.DataFrame(cols)
+        df.insert(0, "timestamp", _datetimes(np.round(t * TS_SCALE).astype(np.int64)))
+        return df
+
+    def info(self, series):
+        blocks = self.blocks(series)
+        rows = sum(b.rows for b in blocks)
+        return {
+            "series": series,
+            "blocks": len(blocks),
+            "rows": rows,
+            "fields": self.fields(series),
+            "bytes": os.path.getsize(series_path(series, self.root)),
+            "start": min((b.t_min for b in blocks), default=None),
+            "end": max((b.t_max for b in blocks), default=None),
+        }
+
+
+def _datetimes(stored):
+    """Stored integer timestamps -> naive local datetimes without float rounding noise."""
+    return local_datetimes(np.asarray(stored, dtype=np.int64) * (10 ** 9 // TS_SCALE), unit="ns")
+
+
+def local_datetimes(epoch, unit="s"):
+    """Epoch times -> naive local datetimes, the convention of the alert log
+    (datetime.fromtimestamp) that the dashboards plot against.
+
+    The UTC offset is looked up once per quarter hour present rather than per
+    row (tz_convert with the local zone runs ~10 s per million rows).
+    """
+    utc = pd.to_datetime(epoch, unit=unit)
+    ns = np.asarray(utc, dtype="datetime64[ns]").view(np.int64)
+    valid = ns != np.iinfo(np.int64).min   # NaT
+    quarters, inv = np.unique(ns[valid] // (900 * 10 ** 9), return_inverse=True)
+    offsets = np.zeros(len(ns), dtype=np.int64)
+    offsets[valid] = np.array([_utc_offset(q * 900) for q in quarters.tolist()], dtype=np.int64)[inv]
+    local = pd.to_timedelta(offsets, unit="s")
+    if isinstance(utc, pd.Series):
+        return utc + pd.Series(local, index=utc.index)
+    return utc + local
+
+
+def _utc_offset(epoch):
+    return int(datetime.fromtimestamp(epoch, timezone.utc).astimezone().utcoffset().total_seconds())
+
+
+def _may_match(block, name, rng):
+    if name not in block.fields:
+        return False
+    j = block.fields.index(name)
+    lo, hi = rng
+    if np.isnan(block.min[j]):
+        return False
+    return (hi is None or block.min[j] <= hi) and (lo is None or block.max[j] >= lo)
+
+
+# --- CLI -----------------------------------------------------------------------
+
+def parse_time(value):
+    """Epoch seconds from a number or a date string (naive dates are local time)."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        ts = pd.Timestamp(value)
+        return (ts if ts.tzinfo else ts.tz_localize(tzlocal())).timestamp()
+
+
+def import_csv(path, series, root=TSDB_DIR, start=None, interval=1.0):
+    """Append a CSV's numeric columns; its 'timestamp' column (epoch seconds or
+    dates) is used if present, else rows are spaced `interval` s from `start`."""
+    df = pd.read_csv(path)
+    if "timestamp" in df.columns:
+        ts = df.pop("timestamp")
+        ts = ts.to_numpy(dtype=float) if pd.api.types.is_numeric_dtype(ts) \
+            else pd.to_datetime(ts).astype("int64").to_numpy() / 1e9
+    else:
+        t0 = parse_time(start) if start is not None else time.time() - interval * len(df)
+        ts = t0 + interval * np.arange(len(df))
+    values = df.select_dtypes(include=["number"])
+    writer = SeriesWriter(series, values.columns, root)
+    writer.append_many(ts, values.to_numpy(dtype=float))
+    writer.close()
+    return len(df)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Compressed register history store")
+    p.add_argument("--root", default=TSDB_DIR)
+    sub = p.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import", help="Append a CSV to a series")
+    imp.add_argument("csv")
+    imp.add_argument("--series", help="defaults to the CSV file name")
+    imp.add_argument("--start", help="first timestamp (epoch s or ISO) for CSVs without one")
+    imp.add_argument("--interval", type=float, default=1.0, help="seconds between rows without timestamps")
+    inf = sub.add_parser("info", help="Rows, blocks and size per series")
+    inf.add_argument("series", nargs="*")
+    exp = sub.add_parser("export", help="Write a time range of a series as CSV")
+    exp.add_argument("series")
+    exp.add_argument("-o", "--output", required=True)
+    exp.add_argument("--start")
+    exp.add_argument("--end")
+    args = p.parse_args()
+
+    db = TSDB(args.root)
+    if args.cmd == "import":
+        series = args.series or os.path.splitext(os.path.basename(args.csv))[0]
+        n = import_csv(args.csv, series, args.root, args.start, args.interval)
+        info = db.info(series)
+        csv_bytes = os.path.getsize(args.csv)
+        print(f"Imported {n} rows into {series}: {csv_bytes:,} B of CSV -> {info['bytes']:,} B "
+              f"for the whole series ({info['rows']} rows)")
+    elif args.cmd == "info":
+        for series in args.series or db.series():
+            info = db.info(series)
+            per_row = info["bytes"] / info["rows"] if info["rows"] else 0
+            span = ""
+            if info["rows"]:
+                start, end = _datetimes([info["start"], info["end"]])
+                span = f" {start} .. {end}"
+            print(f"{series}: {info['rows']:,} rows in {info['blocks']} blocks, {info['bytes']:,} B "
+                  f"({per_row:.1f} B/row), fields {info['fields']}{span}")
+    else:
+        df = db.frame(args.series, parse_time(args.start), parse_time(args.end))
+        df.to_csv(args.output, index=False)
+        print(f"Exported {len(df)} rows -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+metrics.py
+
+In-process metrics for the long-running loops: counters, gauges and
+fixed-bucket histograms, served in Prometheus text format on a local port.
+
+Updates never take a lock. Each thread that touches a metric gets its own
+cell (a plain list) through a thread-local; inc/observe is one attribute
+lookup plus a list update, and a scrape sums the cells. Gauges and counters
+can also be backed by a function evaluated at scrape time, which is how
+queue depths and counters owned by other objects are exposed without
+touching their hot paths.
+
+    from src.telemetry import metrics
+
+    POLLS = metrics.counter("detect_polls_total", "Register reads attempted")
+    RTT   = metrics.histogram("detect_poll_rtt_seconds", "Modbus read round trip")
+    metrics.serve_from_env(9101)     # METRICS_PORT overrides, 0 disables
+
+    POLLS.inc()
+    RTT.observe(elapsed)
+
+    python -m src.telemetry.metrics http://127.0.0.1:9101/metrics    # one scrape
+"""
+
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans sub-millisecond scoring up to multi-second reconnects
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')
+                                     .replace("\n", "\\n")) for k, v in pairs)
+    return "{" + body + "}"
+
+
+class _Cells:
+    """Per-thread lists of `width` numbers; only the owning thread writes its cell."""
+
+    __slots__ = ("width", "cells", "local", "lock")
+
+    def __init__(self, width):
+        self.width = width
+        self.cells = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def new(self):
+        cell = [0] * self.width
+        with self.lock:  # once per thread
+            self.cells.append(cell)
+        self.local.cell = cell
+        return cell
+
+    def total(self):
+        out = [0] * self.width
+        for cell in list(self.cells):
+            for i, v in enumerate(cell):
+                out[i] += v
+        return out
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), **kwargs):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._kwargs = kwargs
+        self._children = {}
+        self._lock = threading.Lock()
+        self._fn = None
+        if not self.labelnames:
+            self._init()
+
+    def _init(self):
+        pass
+
+    def labels(self, *values):
+        """Child metric for one label combination (cache it on hot paths)."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = type(self)(self.name, self.help, **self._kwargs)
+                    self._children[key] = child
+        return child
+
+    def set_function(self, fn):
+        """Report fn() at scrape time instead of the stored value."""
+        self._fn = fn
+        return self
+
+    def _series(self):
+        """[(label values, metric without labels)]"""
+        if self.labelnames:
+            return sorted(self._children.items())
+        return [((), self)]
+
+    def _samples(self, labels):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, metric in self._series():
+            lines.extend(metric._samples(_label_text(self.labelnames, values)))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _init(self):
+        self._cells = _Cells(1)
+
+    def inc(self, amount=1):
+        try:
+            cell = self._cells.local.cell
+        except AttributeError:
+            cell = self._cells.new()
+        cell[0] += amount
+
+    def value(self):
+        return self._fn() if self._fn is not None else self._cells.total()[0]
+
+    def _samples(self, labels):
+        return [f"{self.name}{labels} {_fmt(self.value())}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _init(self):
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        # Gauges are written by the thread that owns the quantity
+        self._value += amount
+
+    def dec(self, amount=1):
+        self._value -= amount
+
+    def value(self):
+        return self._fn() if self._fn is not None else self._value
+
+    def _samples(self, labels):
+        return [f"{self.name}{labels} {_fmt(self.value())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, buckets=self.bounds)
+
+    def _init(self):
+        # per-bucket counts, then the +Inf bucket, then the sum
+        self._cells = _Cells(len(self.bounds) + 2)
+
+    def observe(self, value):
+        try:
+            cell = self._cells.local.cell
+        except AttributeError:
+            cell = self._cells.new()
+        cell[bisect.bisect_left(self.bounds, value)] += 1
+        cell[-1] += value
+
+    def time(self):
+        """Context manager observing the elapsed wall time of its block."""
+        return _Timer(self)
+
+    def snapshot(self):
+        """(cumulative bucket counts incl. +Inf, count, sum)"""
+        total = self._cells.total()
+        cumulative, running = [], 0
+        for c in total[:-1]:
+            running += c
+            cumulative.append(running)
+        return cumulative, running, total[-1]
+
+    def _samples(self, labels):
+        cumulative, count, total = self.snapshot()
+        base = labels[1:-1]
+        out = []
+        for bound, c in zip(self.bounds + (float("inf"),), cumulative):
+            le = f'le="{_fmt(bound)}"'
+            out.append(f"{self.name}_bucket{{{base + ',' if base else ''}{le}}} {c}")
+        out.append(f"{self.name}_sum{labels} {_fmt(float(total))}")
+        out.append(f"{self.name}_count{labels} {count}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+    """Named metrics of one process; creating an existing name returns it."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames=labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames=labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labelnames=labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+_START = time.time()
+gauge("process_start_time_seconds", "Start time of the process since unix epoch").set(_START)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # scrapes every few seconds would drown the daemon's own output
+
+
+def serve(port, addr=METRICS_ADDR, registry=REGISTRY):
+    """Serve /metrics from a daemon thread; returns the HTTP server."""
+    handler = type("Handler", (_Handler,), {"registry": registry})
+    httpd = ThreadingHTTPServer((addr, port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True, name=f"metrics-{port}").start()
+    return httpd
+
+
+def serve_from_env(default_port, registry=REGISTRY):
+    """serve() on METRICS_PORT (or default_port); 0 disables. A busy port only warns."""
+    port = int(os.getenv("METRICS_PORT", default_port))
+    if not port:
+        return None
+    try:
+        httpd = serve(port, registry=registry)
+    except OSError as e:
+        print(f"[WARN] Metrics endpoint unavailable on {METRICS_ADDR}:{port}: {e}")
+        return None
+    print(f"Metrics on http://{METRICS_ADDR}:{httpd.server_address[1]}/metrics")
+    return httpd
+
+
+def main():
+    import sys
+    from urllib.request import urlopen
+
+    url = sys.argv[1] if len(sys.argv) > 1 else f"http://{METRICS_ADDR}:9101/metrics"
+    with urlopen(url, timeout=5) as resp:
+        print(resp.read().decode(), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+tracing.py
+
+Opt-in per-frame stage tracing. A frame (one poll, one packet) is sampled on
+entry with probability TRACE_SAMPLE; in a sampled frame every stage span
+records its start and duration. Unsampled frames and a disabled tracer hand
+out a shared no-op span, so the instrumented loops pay one random() call per
+frame at most.
+
+Tracing is enabled by setting TRACE_DIR. At exit (or flush()) each tracer writes
+<TRACE_DIR>/<name>-<pid>.json in Chrome trace-event format (open it in
+chrome://tracing or ui.perfetto.dev) and prints per-stage percentiles.
+
+    tracer = tracing.get_tracer("detect")
+    with tracer.frame() as fr:
+        with fr.span("modbus_read"):
+            ...
+
+    TRACE_DIR=traces TRACE_SAMPLE=0.1 python -m src.detection.detect
+    python -m src.telemetry.tracing traces/          # stage percentiles over saved traces
+"""
+
+import argparse
+import atexit
+import glob
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+TRACE_DIR     = os.getenv("TRACE_DIR")
+TRACE_SAMPLE  = float(os.getenv("TRACE_SAMPLE", 0.1))
+MAX_EVENTS    = 200_000  # spans kept for export (oldest dropped)
+STAGE_SAMPLES = 10_000   # durations kept per stage for percentiles
+PERCENTILES   = (50, 90, 99)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def span(self, name):
+        return self
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("frame", "name", "start")
+
+    def __init__(self, frame, name):
+        self.frame = frame
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.frame.spans.append((self.name, self.start, time.perf_counter_ns() - self.start))
+        return False
+
+
+class Frame:
+    """A sampled frame: the root span plus the stage spans opened inside it."""
+
+    __slots__ = ("tracer", "id", "start", "spans", "args")
+
+    def __init__(self, tracer, frame_id):
+        self.tracer = tracer
+        self.id = frame_id
+        self.spans = []
+        self.args = {}
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._record(self, time.perf_counter_ns() - self.start)
+        return False
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def set(self, **args):
+        """Attach key/values to the frame's trace event (register values, score...)."""
+        self.args.update(args)
+
+
+class Tracer:
+    def __init__(self, name, enabled=False, sample=TRACE_SAMPLE):
+        self.name = name
+        self.enabled = enabled
+        self.sample = sample
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.stages = {}
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # perf_counter_ns -> epoch, so traces of several processes line up
+        self._epoch_ns = time.time_ns() - time.perf_counter_ns()
+
+    def frame(self):
+        """Context manager for one unit of work; a no-op unless enabled and sampled."""
+        if not self.enabled or random.random() >= self.sample:
+            return NULL_SPAN
+        return Frame(self, next(self._ids))
+
+    def _record(self, frame, duration):
+        tid = threading.get_ident()
+        with self._lock:
+            self.frames += 1
+            self.events.append((self.name, frame.start, duration, tid, frame.id, frame.args))
+            self._stage(self.name, duration)
+            for name, start, dur in frame.spans:
+                self.events.append((name, start, dur, tid, frame.id, None))
+                self._stage(name, dur)
+
+    def _stage(self, name, duration):
+        samples = self.stages.get(name)
+        if samples is None:
+            samples = self.stages[name] = deque(maxlen=STAGE_SAMPLES)
+        samples.append(duration)
+
+    def percentiles(self):
+        """{stage: {'count', 'p50', 'p90', 'p99', 'max'}} in milliseconds over the recent samples."""
+        with self._lock:
+            stages = {name: list(samples) for name, samples in self.stages.items()}
+        return {name: stage_summary(durations, scale=1e-6) for name, durations in stages.items()}
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+        trace = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"{self.name} ({pid})"}}]
+        for name, start, dur, tid, frame_id, args in events:
+            ev = {"name": name, "cat": self.name, "ph": "X", "pid": pid, "tid": tid,
+                  "ts": (self._epoch_ns + start) / 1000, "dur": dur / 1000,
+                  "args": dict(args or {}, frame=frame_id)}
+            trace.append(ev)
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        os.replace(tmp, path)
+        return path
+
+    def save(self):
+        """Export to TRACE_DIR and print the stage table (no-op if nothing was sampled)."""
+        if not self.frames:
+            return
+        path = self.export(os.path.join(TRACE_DIR, f"{self.name}-{os.getpid()}.json"))
+        print(f"[TRACE] {self.frames} sampled frames -> {path}")
+        print(format_table(self.percentiles()))
+
+
+_tracers = {}
+
+
+def get_tracer(name):
+    """Process-wide tracer for `name`; enabled (and exported at exit) when TRACE_DIR is set."""
+    tracer = _tracers.get(name)
+    if tracer is None:
+        tracer = _tracers[name] = Tracer(name, enabled=bool(TRACE_DIR))
+    return tracer
+
+
+def flush():
+    """Save every tracer of this process; runs at exit, but multiprocessing
+    children leave through os._exit and must call it themselves."""
+    for tracer in list(_tracers.values()):
+        tracer.save()
+
+
+if TRACE_DIR:
+    atexit.register(flush)
+
+
+def stage_summary(durations, scale=1.0):
+    data = sorted(durations)
+    if not data:
+        return {"count": 0}
+    out = {"count": len(data)}
+    for p in PERCENTILES:
+        out[f"p{p}"] = data[min(len(data) - 1, int(len(data) * p / 100))] * scale
+    out["max"] = data[-1] * scale
+    return out
+
+
+def format_table(stages):
+    """Stage percentiles (ms) as text, slowest p99 first."""
+    header = f"{'stage':24s} {'count':>8s}" + "".join(f" {'p' + str(p):>9s}" for p in PERCENTILES) + f" {'max':>9s}"
+    rows = [header]
+    for name, s in sorted(stages.items(), key=lambda kv: -kv[1].get("p99", 0)):
+        if not s["count"]:
+            continue
+        rows.append(f"{name:24s} {s['count']:8d}" + "".join(f" {s[f'p{p}']:9.3f}" for p in PERCENTILES)
+                    + f" {s['max']:9.3f}")
+    return "\n".join(rows)
+
+
+def load_stages(paths):
+    """Merge stage durations (us) from Chrome trace files or directories of them."""
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path])
+    stages = {}
+    for path in files:
+        with open(path) as f:
+            for ev in json.load(f)["traceEvents"]:
+                if ev.get("ph") == "X":
+                    stages.setdefault(ev["name"], []).append(ev["dur"])
+    return stages
+
+
+def main():
+    p = argparse.ArgumentParser(description="Per-stage latency percentiles from saved traces")
+    p.add_argument("paths", nargs="+", help="trace JSON files or directories")
+    args = p.parse_args()
+    stages = load_stages(args.paths)
+    print(format_table({name: stage_summary(d, scale=1e-3) for name, d in stages.items()}))
+
+
+if __name__ == "__main__":
+    main()
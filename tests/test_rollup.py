@@ -0,0 +1,27 @@
+import numpy as np
+
+from src.detection.shap_store import ShapStore, ShapWriter
+from src.storage.rollup import ALL_SERIES, RollupStore
+from src.storage.tsdb import TSDB, SeriesWriter
+
+DEVICE = "192.168.64.1:502"
+
+
+def test_anomalies_share_the_register_series(tmp_path):
+    t0 = 1_700_000_000.0
+    writer = SeriesWriter(DEVICE, ["reg0", "reg1"], root=str(tmp_path / "tsdb"))
+    writer.append_many(t0 + np.arange(150) * 0.1, np.ones((150, 2)))
+    writer.close()
+    shap = ShapWriter(["reg0", "reg1"], root=str(tmp_path / "shap"))
+    shap.append_many([t0 + 1.0, t0 + 5.0], [-0.1, -0.2], [[1, 2], [3, 4]], [DEVICE, DEVICE], [7, 3])
+    shap.close()
+
+    store = RollupStore(TSDB(str(tmp_path / "tsdb")), ShapStore(str(tmp_path / "shap")), root=str(tmp_path / "rollups"))
+    store.refresh(save=False)
+
+    assert TSDB(str(tmp_path / "tsdb")).series() == [DEVICE]
+    assert sorted(store.series) == sorted([DEVICE, ALL_SERIES])
+    resolution, frame = store.query(DEVICE, n_points=10)
+    assert resolution > 0
+    assert frame["anomalies"].sum() == 10
+    assert frame["reg0_count"].sum() == 150